@@ -1,6 +1,27 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        from .membership import (
+            participant_deleted,
+            participant_saved,
+            participants_bulk_added,
+        )
+        from .list_version import thread_changed
+        from .models import Message, Thread, ThreadParticipant, participants_added
+        from .search import install_search_index
+        from .tail_cache import drop_tail
+
+        post_migrate.connect(install_search_index, sender=self)
+        post_save.connect(drop_tail, sender=Message)
+        post_delete.connect(drop_tail, sender=Message)
+        post_save.connect(thread_changed, sender=Thread)
+        post_delete.connect(thread_changed, sender=Thread)
+        post_save.connect(participant_saved, sender=ThreadParticipant)
+        post_delete.connect(participant_deleted, sender=ThreadParticipant)
+        participants_added.connect(participants_bulk_added, sender=ThreadParticipant)
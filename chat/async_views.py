@@ -0,0 +1,278 @@
+"""
+Async-native versions of the hot chat endpoints, served in place of their
+``chat.views`` counterparts when ``CHAT_ASYNC_VIEWS`` is on (see
+``chat.urls``).
+
+Reads go through Django's async ORM and writes through ``sync_to_async``,
+so under ASGI a request only holds a thread while it talks to the
+database, not while a slow client uploads or downloads. Under WSGI every
+request would start its own event loop; keep the sync views there.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import views
+from .conditional import async_conditional_get
+from .ingest import create_message
+from .list_version import thread_list_version
+from .models import ArchivedMessage, Message, Thread, ThreadParticipant
+from .pagination import ListPagination, ThreadMessagePagination
+from .serializers import (
+    CreateMessageSerializer,
+    CreateParticipantSerializer,
+    MessageSerializer,
+    ParticipantRowSerializer,
+    ThreadMessageRowSerializer,
+    ThreadSerializer,
+)
+from .tail_cache import aload_tail, get_tail_cache
+
+
+async def thread_validators(thread_id):
+    """
+    Async ``chat.views.thread_validators``.
+    """
+    return (
+        await Thread.objects.filter(pk=thread_id)
+        .values_list("version", "modified_at")
+        .afirst()
+    )
+
+
+def save_if_valid(serializer, **kwargs):
+    """
+    Validate and save ``serializer`` in one go; both may query, so async
+    views run this in a thread. Returns whether it was saved.
+    """
+    if not serializer.is_valid():
+        return False
+    serializer.save(**kwargs)
+    return True
+
+
+class AsyncAPIView(APIView):
+    """
+    ``APIView`` whose handlers are coroutines.
+
+    DRF's ``dispatch`` cannot await a handler, so this one mirrors it;
+    request parsing, content negotiation, permissions, exception handling
+    and rendering are DRF's own.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            # OPTIONS is still APIView's sync handler
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def initial(self, request, *args, **kwargs):
+        # Authentication and permission checks may query (the user, the
+        # membership index), so APIView.initial runs in a thread
+        await sync_to_async(super().initial)(request, *args, **kwargs)
+
+
+class ThreadListCreateAPIView(AsyncAPIView, views.ThreadListCreateAPIView):
+    """
+    List threads (e.g. look one up by entity) or create a new thread.
+    """
+
+    @async_conditional_get
+    async def get(self, request):
+        threads, error = self.filter_threads(request)
+        if error:
+            return error
+
+        paginator = ListPagination(ordering=request.query_params.get("ordering"))
+        threads, fields, error = views.sparse_fieldset(
+            request, threads, ThreadSerializer, paginator
+        )
+        if error:
+            return error
+
+        page = await paginator.apaginate_queryset(threads, request)
+        serializer = ThreadSerializer(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
+
+    async def get_validators(self, request):
+        version = await sync_to_async(thread_list_version)()
+        if version is None:
+            return None
+        return (version, request.user.pk), None
+
+    async def post(self, request):
+        serializer = ThreadSerializer(data=request.data)
+        if not await sync_to_async(serializer.is_valid)():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        await sync_to_async(views.create_thread)(serializer, request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class ThreadRetrieveUpdateDestroyAPIView(
+    AsyncAPIView, views.ThreadRetrieveUpdateDestroyAPIView
+):
+    """
+    Retrieve, update or delete a specific thread.
+    """
+
+    async def get_object(self, pk):
+        try:
+            return await Thread.objects.aget(pk=pk)  # Live threads only
+        except Thread.DoesNotExist:
+            return None
+
+    @async_conditional_get
+    async def get(self, request, pk):
+        thread = await self.get_object(pk)
+        if thread is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = ThreadSerializer(thread)
+        return Response(serializer.data)
+
+    async def get_validators(self, request, pk):
+        return await thread_validators(pk)
+
+    async def put(self, request, pk):
+        thread = await self.get_object(pk)
+        if thread is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = ThreadSerializer(thread, data=request.data)
+        if await sync_to_async(save_if_valid)(serializer, created_by=request.user):
+            return Response(serializer.data)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    async def delete(self, request, pk):
+        thread = await self.get_object(pk)
+        if thread is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        thread.is_deleted = True
+        await thread.asave()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ThreadMessagesAPIView(AsyncAPIView, views.ThreadMessagesAPIView):
+    @async_conditional_get
+    async def get(self, request, thread_id):
+        paginator = ThreadMessagePagination()
+        tail_cache = get_tail_cache()
+        if (
+            tail_cache is not None
+            and self.validators is not None
+            and paginator.opens_tail(request, tail_cache.size)
+        ):
+            version = self.validators[0]
+            tail = tail_cache.get(thread_id, version)
+            if tail is None:
+                thread = await aget_object_or_404(Thread, id=thread_id)
+                tail = await aload_tail(
+                    thread, version, tail_cache.size, paginator.position_field
+                )
+                tail_cache.set(thread_id, tail)
+            page = paginator.paginate_tail(tail, request)
+            if page is not None:
+                return paginator.get_paginated_response(
+                    [message["data"] for message in page]
+                )
+
+        thread = await aget_object_or_404(Thread, id=thread_id)
+
+        messages = ThreadMessageRowSerializer.values(
+            Message.objects.filter(thread=thread)
+        )
+        # Older history continues in cold storage once the hot rows run out
+        archived = None
+        if thread.archived_until is not None:
+            archived = ThreadMessageRowSerializer.values(
+                ArchivedMessage.objects.filter(thread=thread)
+            )
+
+        page = await paginator.apaginate_queryset(messages, request, archived=archived)
+        serializer = ThreadMessageRowSerializer(page)
+        return paginator.get_paginated_response(serializer.data)
+
+    async def get_validators(self, request, thread_id):
+        return await thread_validators(thread_id)
+
+    async def post(self, request, thread_id):
+        thread = await aget_object_or_404(Thread, id=thread_id)
+
+        serializer = CreateMessageSerializer(data=request.data)
+        # Resolves the user; validation queries, so it runs in a thread
+        if not await sync_to_async(serializer.is_valid)():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user = serializer.validated_data["user"]
+        message = await sync_to_async(create_message)(
+            thread=thread,
+            user=user,
+            content=serializer.validated_data["content"],
+            created_by=user,
+        )
+        response_serializer = MessageSerializer(message)
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+
+class ThreadParticipantsAPIView(AsyncAPIView, views.ThreadParticipantsAPIView):
+    @async_conditional_get
+    async def get(self, request, thread_id):
+        thread = await aget_object_or_404(Thread, id=thread_id)
+
+        participants = [
+            row
+            async for row in ParticipantRowSerializer.values(
+                ThreadParticipant.objects.filter(thread=thread)
+            )
+        ]
+        serializer = ParticipantRowSerializer(participants)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    async def get_validators(self, request, thread_id):
+        return await thread_validators(thread_id)
+
+    async def post(self, request, thread_id):
+        thread = await aget_object_or_404(Thread, id=thread_id)
+
+        serializer = CreateParticipantSerializer(data=request.data)
+        if not await sync_to_async(serializer.is_valid)():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user = serializer.validated_data["user"]
+        # Adds the participant, or revives a removed one, unless present
+        created = await sync_to_async(ThreadParticipant.objects.bulk_add)(
+            [(thread.id, user.id)], created_by=request.user
+        )
+
+        response_data = {"thread_id": str(thread.id), "user_id": str(user.id)}
+        return Response(
+            response_data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
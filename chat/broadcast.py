@@ -0,0 +1,108 @@
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .serializers import ThreadMessageSerializer
+from .tail_cache import extend_tails
+
+
+class BaseBroadcast:
+    """
+    Fan-out of committed chat events to WebSocket subscribers.
+
+    ``publish`` is called from request threads once the write has committed;
+    ``subscribe``/``unsubscribe`` are called from the event loop serving the
+    socket, with an ``asyncio.Queue`` that receives the published payloads.
+    """
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel, queue, loop):
+        raise NotImplementedError
+
+    def unsubscribe(self, channel, queue):
+        raise NotImplementedError
+
+
+class InMemoryBroadcast(BaseBroadcast):
+    """
+    In-process fan-out for tests and single-node deployments.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, {}).items())
+        for queue, loop in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    def subscribe(self, channel, queue, loop):
+        with self._lock:
+            self._subscribers.setdefault(channel, {})[queue] = loop
+
+    def unsubscribe(self, channel, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is None:
+                return
+            subscribers.pop(queue, None)
+            if not subscribers:
+                del self._subscribers[channel]
+
+
+_broadcast = None
+
+
+def get_broadcast():
+    global _broadcast
+    if _broadcast is None:
+        backend = getattr(
+            settings, "CHAT_BROADCAST_BACKEND", "chat.broadcast.InMemoryBroadcast"
+        )
+        _broadcast = import_string(backend)()
+    return _broadcast
+
+
+@receiver(setting_changed)
+def reset_broadcast(*, setting, **kwargs):
+    global _broadcast
+    if setting == "CHAT_BROADCAST_BACKEND":
+        _broadcast = None
+
+
+def thread_channel(thread_id):
+    return f"thread.{thread_id}"
+
+
+def publish_messages(messages):
+    """
+    Push new messages to subscribers of their threads, and onto their cached
+    tails, once the surrounding transaction commits.
+    """
+    events = [
+        (
+            thread_channel(message.thread_id),
+            {
+                "type": "message",
+                "thread_id": str(message.thread_id),
+                "message": dict(ThreadMessageSerializer(message).data),
+            },
+        )
+        for message in messages
+    ]
+
+    def send():
+        broadcast = get_broadcast()
+        for channel, event in events:
+            broadcast.publish(channel, event)
+        extend_tails(messages, [event["message"] for _, event in events])
+
+    transaction.on_commit(send)
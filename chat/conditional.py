@@ -0,0 +1,88 @@
+import functools
+import hashlib
+
+from django.views.decorators.http import condition
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(
+        ":".join(str(part) for part in parts).encode(), usedforsecurity=False
+    )
+    return f'"{digest.hexdigest()}"'
+
+
+def conditional_get(method):
+    """
+    Answer ``If-None-Match``/``If-Modified-Since`` on an ``APIView.get``
+    with 304 Not Modified before the view runs its query or serializer.
+
+    The view's ``get_validators(request, *args, **kwargs)`` returns
+    ``(version, last_modified)`` from a cheap lookup, or ``None`` to skip
+    conditional handling (e.g. the resource does not exist). The ETag also
+    covers the query string and ``Accept`` header, since both change the
+    representation. The validators are left on ``view.validators`` for the
+    view to reuse.
+    """
+
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        validators = []
+
+        def get_validators():
+            if not validators:
+                validators.append(view.get_validators(request, *args, **kwargs))
+            return validators[0]
+
+        def etag_func(request, *args, **kwargs):
+            if get_validators() is None:
+                return None
+            version, _ = get_validators()
+            return make_etag(
+                version, request.get_full_path(), request.META.get("HTTP_ACCEPT", "")
+            )
+
+        def last_modified_func(request, *args, **kwargs):
+            if get_validators() is None:
+                return None
+            return get_validators()[1]
+
+        @condition(etag_func=etag_func, last_modified_func=last_modified_func)
+        def view_func(request, *args, **kwargs):
+            view.validators = get_validators()
+            return method(view, request, *args, **kwargs)
+
+        return view_func(request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_conditional_get(method):
+    """
+    ``conditional_get`` for the coroutine ``get`` of an async view, whose
+    ``get_validators`` is a coroutine as well.
+    """
+
+    @functools.wraps(method)
+    async def wrapper(view, request, *args, **kwargs):
+        # Looked up up front, since condition() calls its functions in sync
+        validators = await view.get_validators(request, *args, **kwargs)
+        view.validators = validators
+        if validators is None:
+            return await method(view, request, *args, **kwargs)
+        version, last_modified = validators
+
+        def etag_func(request, *args, **kwargs):
+            return make_etag(
+                version, request.get_full_path(), request.META.get("HTTP_ACCEPT", "")
+            )
+
+        def last_modified_func(request, *args, **kwargs):
+            return last_modified
+
+        @condition(etag_func=etag_func, last_modified_func=last_modified_func)
+        async def view_func(request, *args, **kwargs):
+            return await method(view, request, *args, **kwargs)
+
+        return await view_func(request, *args, **kwargs)
+
+    return wrapper
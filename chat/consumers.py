@@ -0,0 +1,153 @@
+import asyncio
+import json
+import uuid
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from users.authentication import CachedJWTAuthentication
+
+from .broadcast import get_broadcast, thread_channel
+from .membership import get_membership_index
+from .models import ThreadParticipant
+
+
+class ThreadMessageConsumer:
+    """
+    WebSocket endpoint pushing new messages of subscribed threads.
+
+    Connect with ``?token=<access token>`` (or an ``Authorization: Bearer``
+    header), then send ``{"action": "subscribe", "thread_id": "<uuid>"}``
+    for every thread to follow. Only participants may subscribe to a thread;
+    one removed later is unsubscribed when the next message arrives.
+    """
+
+    authentication_class = CachedJWTAuthentication
+    # Application-defined close code for a rejected handshake
+    unauthorized_close_code = 4401
+
+    async def __call__(self, scope, receive, send):
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+
+        user = await self.authenticate(scope)
+        if user is None:
+            await send(
+                {"type": "websocket.close", "code": self.unauthorized_close_code}
+            )
+            return
+        await send({"type": "websocket.accept"})
+
+        broadcast = get_broadcast()
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        subscriptions = set()
+
+        receiving = asyncio.ensure_future(receive())
+        pushing = asyncio.ensure_future(queue.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {receiving, pushing}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if pushing in done:
+                    await self.push(
+                        user, pushing.result(), send, queue, subscriptions
+                    )
+                    pushing = asyncio.ensure_future(queue.get())
+                if receiving in done:
+                    message = receiving.result()
+                    if message["type"] == "websocket.disconnect":
+                        break
+                    if message["type"] == "websocket.receive":
+                        reply = await self.handle(
+                            user, message, queue, loop, subscriptions
+                        )
+                        await self.send_json(send, reply)
+                    receiving = asyncio.ensure_future(receive())
+        finally:
+            receiving.cancel()
+            pushing.cancel()
+            for channel in subscriptions:
+                broadcast.unsubscribe(channel, queue)
+
+    async def authenticate(self, scope):
+        raw_token = self.get_raw_token(scope)
+        if raw_token is None:
+            return None
+
+        authentication = self.authentication_class()
+        try:
+            validated_token = authentication.get_validated_token(raw_token)
+            return await sync_to_async(authentication.get_user)(validated_token)
+        except AuthenticationFailed:
+            return None
+
+    def get_raw_token(self, scope):
+        query = parse_qs(scope.get("query_string", b"").decode())
+        if query.get("token"):
+            return query["token"][0].encode()
+
+        authentication = self.authentication_class()
+        for name, value in scope.get("headers", []):
+            if name == b"authorization":
+                return authentication.get_raw_token(value)
+        return None
+
+    async def push(self, user, event, send, queue, subscriptions):
+        """
+        Forward a published ``event`` while the user still takes part in its
+        thread; otherwise drop the subscription.
+        """
+        channel = thread_channel(event["thread_id"])
+        if channel not in subscriptions:
+            return  # Queued before the subscription was dropped
+        # Checked per message; a warm membership index costs no query
+        is_member = await sync_to_async(get_membership_index().is_member)(
+            user.pk, event["thread_id"]
+        )
+        if is_member:
+            await self.send_json(send, event)
+            return
+        get_broadcast().unsubscribe(channel, queue)
+        subscriptions.discard(channel)
+        await self.send_json(
+            send, {"type": "unsubscribed", "thread_id": event["thread_id"]}
+        )
+
+    async def handle(self, user, message, queue, loop, subscriptions):
+        try:
+            payload = json.loads(message.get("text") or message.get("bytes") or "")
+            action = payload["action"]
+            thread_id = uuid.UUID(str(payload["thread_id"]))
+        except (ValueError, KeyError, TypeError):
+            return {"type": "error", "error": "Expected an action and a thread_id."}
+
+        channel = thread_channel(thread_id)
+        if action == "subscribe":
+            is_participant = await ThreadParticipant.objects.filter(
+                thread_id=thread_id,
+                user=user,
+                thread__is_deleted=False,
+            ).aexists()
+            if not is_participant:
+                return {
+                    "type": "error",
+                    "thread_id": str(thread_id),
+                    "error": "Not a participant of this thread.",
+                }
+            get_broadcast().subscribe(channel, queue, loop)
+            subscriptions.add(channel)
+            return {"type": "subscribed", "thread_id": str(thread_id)}
+
+        if action == "unsubscribe":
+            get_broadcast().unsubscribe(channel, queue)
+            subscriptions.discard(channel)
+            return {"type": "unsubscribed", "thread_id": str(thread_id)}
+
+        return {"type": "error", "error": f"Unknown action '{action}'."}
+
+    async def send_json(self, send, payload):
+        await send({"type": "websocket.send", "text": json.dumps(payload)})
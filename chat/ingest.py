@@ -0,0 +1,170 @@
+"""
+Write-behind batching of posted messages (``CHAT_INGEST_BATCHING``).
+
+Posts are validated by the view and get their IDs when the ``Message`` is
+built, then go to ``MessageBatcher.submit``, which blocks until the batch
+holding the message has committed. The first message to arrive in an empty
+buffer makes its request the leader: it waits up to ``CHAT_INGEST_WINDOW_MS``
+for more messages (or until ``CHAT_INGEST_BATCH_SIZE`` are buffered), then
+inserts the batch in one transaction on its own connection and wakes the
+other requests. No background thread or extra connection is involved.
+
+Batches commit one at a time, in arrival order, so messages of a thread
+are stored in the order they were accepted by this process.
+"""
+
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from chat_system.db_routers import record_write
+
+from .broadcast import publish_messages
+from .models import Message, Thread
+
+
+class PendingMessage:
+    def __init__(self, message):
+        self.message = message
+        self.arrived = time.monotonic()
+        self.leading = False
+        self.done = False
+        self.error = None
+        self.wake = threading.Event()
+
+
+class MessageBatcher:
+    """
+    In-process group commit of ``Message`` inserts.
+    """
+
+    def __init__(self, batch_size=200, window=0.005):
+        self.batch_size = batch_size
+        self.window = window
+        self.condition = threading.Condition()
+        # Held while a batch is written, so batches commit in order
+        self.flushing = threading.Lock()
+        self.pending = []
+        self.last_created_at = None
+
+    def submit(self, message):
+        """
+        Insert ``message`` as part of a batch; returns once it committed,
+        or raises what the insert raised.
+        """
+        entry = PendingMessage(message)
+        with self.condition:
+            self.pending.append(entry)
+            # The oldest pending message's request writes the batch
+            entry.leading = len(self.pending) == 1
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify_all()
+
+        while True:
+            if entry.leading:
+                entry.leading = False
+                self.lead(entry)
+            entry.wake.wait()
+            entry.wake.clear()
+            if entry.done:
+                break
+        if entry.error is not None:
+            raise entry.error
+        return message
+
+    def lead(self, entry):
+        deadline = entry.arrived + self.window
+        with self.condition:
+            self.condition.wait_for(
+                lambda: len(self.pending) >= self.batch_size,
+                timeout=max(deadline - time.monotonic(), 0),
+            )
+
+        with self.flushing:
+            with self.condition:
+                batch = self.pending[: self.batch_size]
+                del self.pending[: self.batch_size]
+                if self.pending:
+                    # Overflow becomes the next batch, filling while this one
+                    # is written
+                    self.pending[0].leading = True
+                    self.pending[0].wake.set()
+            self.flush(batch)
+
+    def flush(self, batch):
+        try:
+            self.write([entry.message for entry in batch])
+        except Exception as exc:
+            if len(batch) == 1:
+                batch[0].error = exc
+            else:
+                # Retry one by one, so a bad message only fails its own post
+                for entry in batch:
+                    self.flush([entry])
+                return
+        for entry in batch:
+            entry.done = True
+            entry.wake.set()
+
+    def write(self, messages):
+        with transaction.atomic():
+            Message.objects.bulk_create(messages)
+            self.keep_order(messages)
+            Thread.all_objects.record_messages(messages)
+            publish_messages(messages)
+
+    def keep_order(self, messages):
+        """
+        ``created_at`` is stamped per row on insert; with a coarse clock two
+        messages could share a stamp and then sort by their random IDs.
+        Nudge such stamps apart so arrival order holds.
+        """
+        nudged = []
+        last = self.last_created_at
+        for message in messages:
+            if last is not None and message.created_at <= last:
+                message.created_at = last + timedelta(microseconds=1)
+                nudged.append(message)
+            last = message.created_at
+        if nudged:
+            Message.objects.bulk_update(nudged, ["created_at"])
+        self.last_created_at = last
+
+
+_batcher = None
+
+
+def get_batcher():
+    global _batcher
+    if _batcher is None:
+        _batcher = MessageBatcher(
+            batch_size=getattr(settings, "CHAT_INGEST_BATCH_SIZE", 200),
+            window=getattr(settings, "CHAT_INGEST_WINDOW_MS", 5) / 1e3,
+        )
+    return _batcher
+
+
+@receiver(setting_changed)
+def reset_batcher(*, setting, **kwargs):
+    global _batcher
+    if setting in ("CHAT_INGEST_BATCH_SIZE", "CHAT_INGEST_WINDOW_MS"):
+        _batcher = None
+
+
+def create_message(**fields):
+    """
+    Create a message and publish it to subscribers: through the batcher
+    when ``CHAT_INGEST_BATCHING`` is on, otherwise with a plain insert.
+    """
+    if not getattr(settings, "CHAT_INGEST_BATCHING", False):
+        message = Message.objects.create(**fields)
+        publish_messages([message])
+        return message
+    # The insert may run on another request's thread
+    record_write()
+    return get_batcher().submit(Message(**fields))
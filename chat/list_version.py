@@ -0,0 +1,69 @@
+"""
+Version of the thread list as a whole, the conditional GET validator of
+``threads/`` (``CHAT_THREAD_LIST_VERSION``).
+
+Any committed write to any thread moves the counter on, so checking an
+ETag of the list costs one cache read instead of a query over the
+filtered threads. Writes to one thread invalidate every filtered list,
+which is the price of that. The counter lives in the Django cache
+``CHAT_THREAD_LIST_VERSION_ALIAS`` and must be shared by all processes:
+one that misses another's writes would answer 304 for a changed list.
+"""
+
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+KEY = "chat:threads:version"
+
+
+def get_version_cache():
+    if not getattr(settings, "CHAT_THREAD_LIST_VERSION", False):
+        return None
+    return caches[getattr(settings, "CHAT_THREAD_LIST_VERSION_ALIAS", "default")]
+
+
+def restart(cache):
+    # A lost counter restarts at random, so ETags served before never match
+    cache.add(KEY, secrets.randbits(48), None)
+
+
+def thread_list_version():
+    """
+    The current version, or ``None`` while ``CHAT_THREAD_LIST_VERSION`` is
+    off.
+    """
+    cache = get_version_cache()
+    if cache is None:
+        return None
+    version = cache.get(KEY)
+    if version is None:
+        restart(cache)
+        version = cache.get(KEY)
+    return version
+
+
+def bump_thread_list_version(using=None):
+    """
+    Move the version on once the current transaction commits.
+    """
+
+    def bump():
+        cache = get_version_cache()
+        if cache is None:
+            return
+        try:
+            cache.incr(KEY)
+        except ValueError:
+            restart(cache)
+
+    transaction.on_commit(bump, using=using)
+
+
+def thread_changed(sender, using=None, **kwargs):
+    """
+    ``post_save``/``post_delete`` receiver for ``Thread``.
+    """
+    bump_thread_list_version(using)
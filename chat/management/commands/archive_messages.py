@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from chat.models import EPOCH, ArchivedMessage, Message, Thread
+
+
+class Command(BaseCommand):
+    help = (
+        "Move messages past their thread's retention period "
+        "(CHAT_MESSAGE_RETENTION_DAYS) into the archive table, oldest first, "
+        "in short batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=getattr(settings, "CHAT_ARCHIVE_BATCH_SIZE", 1000),
+        )
+        parser.add_argument(
+            "--entity-type",
+            action="append",
+            dest="entity_types",
+            help="Only archive threads of this entity type.",
+        )
+
+    def handle(self, *args, **options):
+        retention = getattr(settings, "CHAT_MESSAGE_RETENTION_DAYS", {})
+        entity_types = options["entity_types"] or list(retention)
+        unknown = [
+            entity_type for entity_type in entity_types if entity_type not in retention
+        ]
+        if unknown:
+            raise CommandError(f"No retention configured for: {', '.join(unknown)}.")
+
+        now = timezone.now()
+        total = 0
+        for entity_type in entity_types:
+            cutoff = now - timedelta(days=retention[entity_type])
+            archived = self.archive(entity_type, cutoff, options["batch_size"])
+            self.stdout.write(
+                f"{entity_type}: archived {archived} messages older than "
+                f"{cutoff.isoformat()}"
+            )
+            total += archived
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {total} messages archived."))
+
+    def archive(self, entity_type, cutoff, batch_size):
+        # Deleted messages are archived too; the archive keeps their flag.
+        # An IN subquery rather than a join, so only message rows get locked.
+        messages = Message.all_objects.filter(
+            thread__in=Thread.all_objects.filter(entity_type=entity_type),
+            created_at__lt=cutoff,
+        ).order_by("created_at", "id")
+
+        archived = 0
+        while True:
+            # One short transaction per batch; the oldest rows go first, so
+            # a thread's archived messages always sort before its hot ones.
+            with transaction.atomic():
+                rows = list(
+                    messages.select_for_update().values_list(
+                        *ArchivedMessage.copied_fields, named=True
+                    )[:batch_size]
+                )
+                if not rows:
+                    break
+                ArchivedMessage.all_objects.bulk_create(
+                    [ArchivedMessage(**row._asdict()) for row in rows],
+                    ignore_conflicts=True,
+                )
+                # Moved, not removed: the thread summaries stay as they are
+                Message.all_objects.filter(id__in=[row.id for row in rows]).delete()
+                threads = Thread.all_objects.filter(
+                    id__in={row.thread_id for row in rows}
+                )
+                # A new version, so cached pages and tails of these threads
+                # are revalidated
+                threads.update(
+                    archived_until=Greatest(
+                        Coalesce(F("archived_until"), Value(EPOCH)),
+                        Value(rows[-1].created_at),
+                    ),
+                    version=F("version") + 1,
+                    modified_at=timezone.now(),
+                )
+            archived += len(rows)
+        return archived
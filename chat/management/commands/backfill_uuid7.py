@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat.models import ArchivedMessage, Message, Thread
+from chat_system.ids import uuid7_from_datetime
+
+
+class Command(BaseCommand):
+    help = (
+        "Give messages (hot and archived) created before the switch to UUIDv7 "
+        "keys a time-ordered id derived from their created_at, oldest first, "
+        "in short batches. Message ids seen by clients change; threads, "
+        "participants and users keep theirs, since other rows and systems "
+        "refer to them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=getattr(settings, "CHAT_BACKFILL_BATCH_SIZE", 1000),
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for model in (Message, ArchivedMessage):
+            total += self.backfill(model, options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {total} ids rewritten."))
+
+    def backfill(self, model, batch_size):
+        rows = model.all_objects.order_by("created_at", "id")
+        rewritten = 0
+        position = None
+        while True:
+            batch = rows
+            if position is not None:
+                created_at, pk = position
+                batch = rows.filter(created_at__gte=created_at).exclude(
+                    created_at=created_at, id__lte=pk
+                )
+            batch = list(
+                batch.values_list("id", "created_at", "thread_id")[:batch_size]
+            )
+            if not batch:
+                break
+            # Rewritten rows may sort again after the position; they are v7
+            # by then and skipped
+            old = [row for row in batch if row[0].version != 7]
+            # One short transaction per batch holds row locks only briefly
+            with transaction.atomic():
+                for pk, created_at, _ in old:
+                    model.all_objects.filter(pk=pk).update(
+                        id=uuid7_from_datetime(created_at)
+                    )
+                if old:
+                    # Pages and tails cached under the old ids are revalidated
+                    Thread.all_objects.filter(
+                        pk__in={thread_id for _, _, thread_id in old}
+                    ).touch()
+            rewritten += len(old)
+            position = batch[-1][1], batch[-1][0]
+            self.stdout.write(f"{model.__name__}: {rewritten} ids rewritten")
+        return rewritten
@@ -0,0 +1,303 @@
+import asyncio
+import importlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory, override_settings
+from django.urls import clear_url_caches, reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat.management.commands.bench_endpoints import percentile
+from chat.management.commands.seed_chat_data import bench_email
+from chat.models import Thread
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync views under WSGI with the async views "
+        "(CHAT_ASYNC_VIEWS) under ASGI, for many concurrent slow clients. "
+        "Requests go through Django's WSGI and ASGI handlers in process; every "
+        "client spends --client-delay ms sending its request and as long again "
+        "reading the response. Read endpoints only, against the current "
+        "database (see seed_chat_data)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clients", type=int, default=50, help="Concurrent clients."
+        )
+        parser.add_argument(
+            "--requests", type=int, default=500, help="Requests per endpoint."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="WSGI worker threads, like gunicorn --threads.",
+        )
+        parser.add_argument("--client-delay", type=float, default=20.0)
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            dest="endpoints",
+            help="Only endpoints whose name contains this text.",
+        )
+        parser.add_argument("--email", default=bench_email(0))
+        parser.add_argument(
+            "--output", "-o", help="Write the JSON report here ('-' for stdout)."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(email=options["email"])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No user {options['email']}; run seed_chat_data first.")
+
+        self.host = (settings.ALLOWED_HOSTS or ["localhost"])[0].lstrip(".")
+        self.authorization = f"Bearer {AccessToken.for_user(user)}"
+        self.delay = options["client_delay"] / 1e3
+        scenarios = self.scenarios(user)
+        if options["endpoints"]:
+            scenarios = [
+                scenario
+                for scenario in scenarios
+                if any(text in scenario[0] for text in options["endpoints"])
+            ]
+
+        # One JSON line per request would drown the report
+        request_logger = logging.getLogger("chat_system.requests")
+        level = request_logger.level
+        if options["verbosity"] < 2:
+            request_logger.setLevel(logging.WARNING)
+        try:
+            results = []
+            for mode in ("wsgi", "asgi"):
+                with self.views(async_views=mode == "asgi"):
+                    for name, path, query in scenarios:
+                        results.append(
+                            self.measure(mode, name, path, query, options)
+                        )
+        finally:
+            request_logger.setLevel(level)
+
+        report = {
+            "meta": {
+                "clients": options["clients"],
+                "requests": options["requests"],
+                "workers": options["workers"],
+                "client_delay_ms": options["client_delay"],
+            },
+            "results": results,
+        }
+        if options["output"] == "-":
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.write_table(results)
+            if options["output"]:
+                with open(options["output"], "w") as output:
+                    json.dump(report, output, indent=2)
+
+    def scenarios(self, user):
+        """
+        ``(name, path, query string)`` of the read endpoints served by
+        ``chat.async_views``, aimed at the benchmark user's busiest thread.
+        """
+        thread = (
+            Thread.objects.filter(participants__user=user)
+            .order_by("-message_count")
+            .first()
+        )
+        if thread is None:
+            raise CommandError(f"{user.email} takes part in no thread.")
+        thread_kwargs = {"thread_id": thread.id}
+        return [
+            (
+                "threads.list.entity",
+                reverse("thread-list"),
+                f"entity_type={thread.entity_type}&entity_id={thread.entity_id}",
+            ),
+            (
+                "threads.retrieve",
+                reverse("thread-detail", kwargs={"pk": thread.id}),
+                "",
+            ),
+            (
+                "thread_messages.latest",
+                reverse("thread-messages", kwargs=thread_kwargs),
+                "",
+            ),
+            (
+                "thread_participants.list",
+                reverse("thread-participants", kwargs=thread_kwargs),
+                "",
+            ),
+        ]
+
+    @contextmanager
+    def views(self, async_views):
+        """
+        Route the chat URLs to the sync or the async views, and configure
+        connection reuse as a deployment under that server would.
+        """
+        # Persistent connections are off under ASGI (see DJANGO_ASGI)
+        conn_max_age = {
+            alias: connections.settings[alias]["CONN_MAX_AGE"]
+            for alias in connections
+        }
+        try:
+            with override_settings(CHAT_ASYNC_VIEWS=async_views):
+                if async_views:
+                    for alias in connections:
+                        connections.settings[alias]["CONN_MAX_AGE"] = 0
+                self.reload_urls()
+                yield
+        finally:
+            for alias, value in conn_max_age.items():
+                connections.settings[alias]["CONN_MAX_AGE"] = value
+            self.reload_urls()
+
+    def reload_urls(self):
+        # chat.urls picks its views when imported
+        importlib.reload(importlib.import_module("chat.urls"))
+        clear_url_caches()
+
+    def measure(self, mode, name, path, query, options):
+        if mode == "wsgi":
+            handler = WSGIHandler()
+            pool = ThreadPoolExecutor(max_workers=options["workers"])
+
+            async def request():
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    pool, self.wsgi_request, handler, path, query
+                )
+
+        else:
+            handler = ASGIHandler()
+
+            async def request():
+                return await self.asgi_request(handler, path, query)
+
+        try:
+            latencies, statuses, elapsed = asyncio.run(
+                self.run_clients(request, options["clients"], options["requests"])
+            )
+        finally:
+            if mode == "wsgi":
+                pool.shutdown()
+
+        latencies.sort()
+        return {
+            "mode": mode,
+            "name": name,
+            "path": f"{path}?{query}" if query else path,
+            "errors": sum(1 for code in statuses if code != 200),
+            "requests_per_second": round(len(latencies) / elapsed, 1),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.5), 3),
+                "p90": round(percentile(latencies, 0.9), 3),
+                "p99": round(percentile(latencies, 0.99), 3),
+                "max": round(latencies[-1], 3),
+            },
+        }
+
+    async def run_clients(self, request, clients, total):
+        """
+        ``clients`` closed-loop clients sharing ``total`` requests.
+        """
+        latencies = []
+        statuses = []
+        remaining = [total]
+
+        async def client():
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                start = time.perf_counter()
+                statuses.append(await request())
+                latencies.append((time.perf_counter() - start) * 1e3)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        return latencies, statuses, time.perf_counter() - start
+
+    def wsgi_request(self, handler, path, query):
+        factory = RequestFactory(
+            HTTP_HOST=self.host, HTTP_AUTHORIZATION=self.authorization
+        )
+        environ = factory.get(path, QUERY_STRING=query).environ
+        response_status = []
+
+        def start_response(status, headers, exc_info=None):
+            response_status.append(int(status.split()[0]))
+
+        # A WSGI worker thread is held while the client sends and reads
+        time.sleep(self.delay)
+        response = handler(environ, start_response)
+        try:
+            for _ in response:
+                pass
+            time.sleep(self.delay)
+        finally:
+            response.close()
+        return response_status[0]
+
+    async def asgi_request(self, handler, path, query):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [
+                (b"host", self.host.encode()),
+                (b"authorization", self.authorization.encode()),
+            ],
+            "client": ("127.0.0.1", 0),
+            "server": (self.host, 80),
+        }
+        received = []
+        response_status = []
+
+        async def receive():
+            if received:
+                # Django listens for a disconnect until the response is sent
+                await asyncio.Future()
+            received.append(True)
+            await asyncio.sleep(self.delay)
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response_status.append(message["status"])
+            elif not message.get("more_body"):
+                await asyncio.sleep(self.delay)
+
+        await handler(scope, receive, send)
+        return response_status[0]
+
+    def write_table(self, results):
+        self.stdout.write(
+            f"{'mode':<5} {'endpoint':<26} {'req/s':>8} {'p50 ms':>9} "
+            f"{'p90 ms':>9} {'p99 ms':>9} {'errors':>7}"
+        )
+        for result in results:
+            latency = result["latency_ms"]
+            self.stdout.write(
+                f"{result['mode']:<5} {result['name']:<26} "
+                f"{result['requests_per_second']:>8.1f} {latency['p50']:>9.2f} "
+                f"{latency['p90']:>9.2f} {latency['p99']:>9.2f} "
+                f"{result['errors']:>7}"
+            )
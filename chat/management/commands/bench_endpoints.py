@@ -0,0 +1,435 @@
+import json
+import math
+import platform
+import time
+import tracemalloc
+import uuid
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from chat.management.commands.seed_chat_data import EMAIL_DOMAIN, bench_email
+from chat.models import Message, Thread, ThreadParticipant
+from chat.pagination import ThreadMessagePagination
+from users.models import CustomUser
+
+
+# Private cache the on-commit work of rolled-back writes is sent to
+SANDBOX_ALIAS = "bench-on-commit"
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def sandbox():
+    """
+    Settings sending on-commit work (broadcasts, tail, membership and list
+    version updates) to fresh in-process backends and a private cache, so
+    work of rolled-back writes reaches no subscriber or other process.
+    """
+    return override_settings(
+        CACHES={
+            **settings.CACHES,
+            SANDBOX_ALIAS: {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": SANDBOX_ALIAS,
+            },
+        },
+        CHAT_BROADCAST_BACKEND="chat.broadcast.InMemoryBroadcast",
+        CHAT_TAIL_CACHE_ALIAS=SANDBOX_ALIAS,
+        CHAT_MEMBERSHIP_CACHE_ALIAS=SANDBOX_ALIAS,
+        CHAT_THREAD_LIST_VERSION_ALIAS=SANDBOX_ALIAS,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every chat and users endpoint against the current database "
+        "(see seed_chat_data) and report latency percentiles, query counts and "
+        "peak allocated memory per endpoint. Reads run as in production; each "
+        "write runs in a transaction that is rolled back, so the commit itself "
+        "is not measured. The on-commit work of writes (broadcasts, cache "
+        "updates) is timed separately after the rollback, against private "
+        "in-process backends, so rolled-back rows are never published."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            dest="endpoints",
+            help="Only endpoints whose name contains this text.",
+        )
+        parser.add_argument("--email", default=bench_email(0))
+        parser.add_argument("--password", default="bench-password")
+        parser.add_argument(
+            "--output", "-o", help="Write the JSON report here ('-' for stdout)."
+        )
+        parser.add_argument(
+            "--baseline", help="JSON report to compare against; fails on regressions."
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=1.25,
+            help="Allowed p50 latency ratio against the baseline.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(email=options["email"])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No user {options['email']}; run seed_chat_data first.")
+
+        refresh = RefreshToken.for_user(user)
+        client = Client(
+            HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}",
+            HTTP_HOST=(settings.ALLOWED_HOSTS or ["localhost"])[0].lstrip("."),
+        )
+        scenarios = self.scenarios(user, str(refresh), options["password"])
+        if options["endpoints"]:
+            scenarios = [
+                scenario
+                for scenario in scenarios
+                if any(text in scenario[0] for text in options["endpoints"])
+            ]
+
+        results = [
+            self.measure(client, *scenario, options["iterations"], options["warmup"])
+            for scenario in scenarios
+        ]
+
+        report = {"meta": self.meta(options), "results": results}
+        if options["output"] == "-":
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.write_table(results)
+            if options["output"]:
+                with open(options["output"], "w") as output:
+                    json.dump(report, output, indent=2)
+
+        if options["baseline"]:
+            self.compare(results, options["baseline"], options["threshold"])
+
+    def scenarios(self, user, refresh, password):
+        """
+        ``(name, method, path, body)`` for every endpoint, aimed at the
+        busiest thread the benchmark user takes part in.
+        """
+        thread = (
+            Thread.objects.filter(participants__user=user)
+            .order_by("-message_count")
+            .first()
+        )
+        if thread is None:
+            raise CommandError(f"{user.email} takes part in no thread.")
+        messages = Message.objects.filter(thread=thread).order_by("created_at", "id")
+        message = messages.last()
+        middle = messages[thread.message_count // 2]
+        participant = ThreadParticipant.objects.get(thread=thread, user=user)
+        outsider = CustomUser.objects.exclude(
+            id__in=thread.participants.values("user_id")
+        ).first()
+        if outsider is None:
+            raise CommandError("Every user takes part in the busiest thread.")
+        other_threads = list(
+            Thread.objects.exclude(id=thread.id).values_list("id", flat=True)[:50]
+        )
+        # A page of entities, as an order list would look up
+        entities = [
+            {"entity_type": entity_type, "entity_id": entity_id}
+            for entity_type, entity_id in Thread.objects.values_list(
+                "entity_type", "entity_id"
+            )[:100]
+        ]
+
+        thread_url = reverse("thread-detail", kwargs={"pk": thread.id})
+        message_url = reverse("message-detail", kwargs={"pk": message.id})
+        participant_url = reverse("participant-detail", kwargs={"pk": participant.id})
+        thread_kwargs = {"thread_id": thread.id}
+        thread_messages_url = reverse("thread-messages", kwargs=thread_kwargs)
+        thread_participants_url = reverse("thread-participants", kwargs=thread_kwargs)
+        cursor = ThreadMessagePagination().encode_cursor(middle)
+        new_message = {"thread": str(thread.id), "user": str(user.id), "content": "Hi"}
+        bulk = [{"user": str(user.id), "content": f"Bulk {i}"} for i in range(100)]
+        thread_body = {
+            "thread_id": str(thread.id),
+            "entity_type": thread.entity_type,
+            "entity_id": thread.entity_id,
+            "title": "Renamed",
+        }
+
+        return [
+            (
+                "users.register",
+                "post",
+                reverse("register_user"),
+                {
+                    "email": f"bench-register@{EMAIL_DOMAIN}",
+                    "password": password,
+                    "name": "Registered",
+                },
+            ),
+            (
+                "users.login",
+                "post",
+                reverse("login_user"),
+                {"email": user.email, "password": password},
+            ),
+            ("users.refresh", "post", reverse("refresh_token"), {"refresh": refresh}),
+            ("users.profile", "get", reverse("user_profile"), None),
+            ("threads.list", "get", reverse("thread-list"), None),
+            (
+                "threads.list.entity",
+                "get",
+                f"{reverse('thread-list')}?entity_type={thread.entity_type}",
+                None,
+            ),
+            (
+                "threads.list.activity",
+                "get",
+                f"{reverse('thread-list')}?ordering=-last_activity_at",
+                None,
+            ),
+            (
+                "threads.create",
+                "post",
+                reverse("thread-list"),
+                dict(thread_body, thread_id=str(uuid.uuid4())),
+            ),
+            (
+                "threads.lookup",
+                "post",
+                reverse("thread-lookup"),
+                {"entities": entities, "counts": True},
+            ),
+            ("threads.retrieve", "get", thread_url, None),
+            ("threads.update", "put", thread_url, thread_body),
+            ("threads.delete", "delete", thread_url, None),
+            ("messages.list", "get", reverse("message-list"), None),
+            (
+                "messages.list.thread",
+                "get",
+                f"{reverse('message-list')}?thread_id={thread.id}",
+                None,
+            ),
+            ("messages.create", "post", reverse("message-list"), new_message),
+            ("messages.retrieve", "get", message_url, None),
+            ("messages.update", "put", message_url, new_message),
+            ("messages.delete", "delete", message_url, None),
+            (
+                "messages.bulk",
+                "post",
+                reverse("message-bulk-create"),
+                {"messages": [dict(item, thread=str(thread.id)) for item in bulk]},
+            ),
+            ("thread_messages.latest", "get", thread_messages_url, None),
+            (
+                "thread_messages.middle",
+                "get",
+                f"{thread_messages_url}?before={cursor}",
+                None,
+            ),
+            (
+                "thread_messages.create",
+                "post",
+                thread_messages_url,
+                {"user": str(user.id), "content": "Hi"},
+            ),
+            (
+                "thread_messages.bulk",
+                "post",
+                reverse("thread-messages-bulk-create", kwargs=thread_kwargs),
+                {"messages": bulk},
+            ),
+            ("thread_read", "post", reverse("thread-read", kwargs=thread_kwargs), {}),
+            ("participants.list", "get", reverse("participant-list"), None),
+            (
+                "participants.create",
+                "post",
+                reverse("participant-list"),
+                {"thread": str(thread.id), "user": str(outsider.id)},
+            ),
+            ("participants.retrieve", "get", participant_url, None),
+            (
+                "participants.update",
+                "put",
+                participant_url,
+                {"thread": str(thread.id), "user": str(user.id)},
+            ),
+            ("participants.delete", "delete", participant_url, None),
+            (
+                "participants.bulk",
+                "post",
+                reverse("participant-bulk"),
+                {
+                    "user": str(outsider.id),
+                    "add": [str(thread_id) for thread_id in other_threads],
+                },
+            ),
+            ("thread_participants.list", "get", thread_participants_url, None),
+            (
+                "thread_participants.add",
+                "post",
+                thread_participants_url,
+                {"user": str(outsider.id)},
+            ),
+            (
+                "thread_participants.bulk",
+                "post",
+                reverse("thread-participants-bulk", kwargs=thread_kwargs),
+                {"add": [str(outsider.id)]},
+            ),
+            (
+                "search",
+                "get",
+                f"{reverse('message-search')}?q=shipment+delayed",
+                None,
+            ),
+            ("inbox", "get", reverse("inbox"), None),
+            (
+                "export",
+                "get",
+                f"{reverse('message-export')}?thread_id={thread.id}",
+                None,
+            ),
+        ]
+
+    def measure(self, client, name, method, path, body, iterations, warmup):
+        def request():
+            if body is None:
+                response = getattr(client, method)(path)
+            else:
+                response = getattr(client, method)(
+                    path, json.dumps(body), content_type="application/json"
+                )
+            if response.streaming:
+                b"".join(response.streaming_content)
+            return response
+
+        def call():
+            """
+            ``(response, request seconds, on-commit seconds)``.
+            """
+            if method == "get":
+                # No transaction, so the router may send reads to a replica
+                start = time.perf_counter()
+                response = request()
+                return response, time.perf_counter() - start, 0.0
+
+            # A transaction per write, so writes never accumulate
+            with transaction.atomic():
+                pending = len(connection.run_on_commit)
+                start = time.perf_counter()
+                response = request()
+                elapsed = time.perf_counter() - start
+                callbacks = [
+                    callback for _, callback, _ in connection.run_on_commit[pending:]
+                ]
+                transaction.set_rollback(True)
+
+            with sandbox():
+                start = time.perf_counter()
+                for callback in callbacks:
+                    callback()
+                return response, elapsed, time.perf_counter() - start
+
+        for _ in range(warmup):
+            call()
+        timings = [call()[1:] for _ in range(iterations)]
+        latencies = sorted(elapsed * 1e3 for elapsed, _ in timings)
+        on_commit = sorted(elapsed * 1e3 for _, elapsed in timings)
+
+        # Queries and memory come from a separate pass so their bookkeeping
+        # does not distort the latencies
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            response, _, _ = call()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            "name": name,
+            "method": method.upper(),
+            "path": path,
+            "status": response.status_code,
+            "iterations": iterations,
+            "latency_ms": {
+                "min": round(latencies[0], 3),
+                "p50": round(percentile(latencies, 0.5), 3),
+                "p90": round(percentile(latencies, 0.9), 3),
+                "p99": round(percentile(latencies, 0.99), 3),
+                "max": round(latencies[-1], 3),
+                "mean": round(sum(latencies) / len(latencies), 3),
+            },
+            "on_commit_ms": {
+                "p50": round(percentile(on_commit, 0.5), 3),
+                "max": round(on_commit[-1], 3),
+            },
+            "queries": len(queries),
+            "peak_allocated_kib": round(peak / 1024, 1),
+        }
+
+    def meta(self, options):
+        return {
+            "timestamp": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "iterations": options["iterations"],
+            "dataset": {
+                "users": CustomUser.objects.count(),
+                "threads": Thread.objects.count(),
+                "messages": Message.objects.count(),
+                "participants": ThreadParticipant.objects.count(),
+            },
+        }
+
+    def write_table(self, results):
+        self.stdout.write(
+            f"{'endpoint':<28} {'status':>6} {'p50 ms':>9} {'p90 ms':>9} "
+            f"{'p99 ms':>9} {'commit ms':>9} {'queries':>8} {'peak KiB':>9}"
+        )
+        for result in results:
+            latency = result["latency_ms"]
+            self.stdout.write(
+                f"{result['name']:<28} {result['status']:>6} {latency['p50']:>9.2f} "
+                f"{latency['p90']:>9.2f} {latency['p99']:>9.2f} "
+                f"{result['on_commit_ms']['p50']:>9.2f} "
+                f"{result['queries']:>8} {result['peak_allocated_kib']:>9.1f}"
+            )
+
+    def compare(self, results, path, threshold):
+        with open(path) as baseline_file:
+            baseline = {
+                result["name"]: result for result in json.load(baseline_file)["results"]
+            }
+
+        regressions = []
+        for result in results:
+            before = baseline.get(result["name"])
+            if before is None:
+                continue
+            ratio = result["latency_ms"]["p50"] / max(before["latency_ms"]["p50"], 1e-3)
+            if ratio > threshold:
+                regressions.append(f"{result['name']}: p50 x{ratio:.2f}")
+            if result["queries"] > before["queries"]:
+                regressions.append(
+                    f"{result['name']}: {before['queries']} -> "
+                    f"{result['queries']} queries"
+                )
+
+        if regressions:
+            raise CommandError("Regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
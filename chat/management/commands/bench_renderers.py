@@ -0,0 +1,79 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from chat.models import Message
+from chat.serializers import MessageSerializer, ThreadMessageSerializer
+from chat_system.renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cost of rendering thread message payloads with DRF's "
+        "JSONRenderer, the orjson renderer and (if installed) MessagePack. "
+        "Uses in-memory objects only; the database is not touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        messages = self.build(rows)
+
+        # Thread history rows are pre-formatted strings; the global message
+        # list carries raw UUID primary keys the renderer has to encode.
+        payloads = [
+            (
+                "ThreadMessageSerializer",
+                ThreadMessageSerializer(messages, many=True).data,
+            ),
+            ("MessageSerializer", MessageSerializer(messages, many=True).data),
+        ]
+        renderers = [("JSONRenderer", JSONRenderer()), ("orjson", ORJSONRenderer())]
+        if msgpack is not None:
+            renderers.append(("msgpack", MessagePackRenderer()))
+
+        for payload_label, data in payloads:
+            for renderer_label, renderer in renderers:
+                body = renderer.render(data)
+                best = min(
+                    self.timed(lambda: renderer.render(data)) for _ in range(repeat)
+                )
+                label = f"{payload_label}: {renderer_label}"
+                self.stdout.write(
+                    f"{label:<40} {best * 1e6 / rows:8.2f} us/row "
+                    f"({best * 1e3:.1f} ms, {len(body) / 1024:.0f} KiB "
+                    f"for {rows} rows)"
+                )
+
+    def build(self, rows):
+        users = [
+            CustomUser(
+                id=uuid.uuid4(), email=f"bench-{i}@example.com", name=f"User {i}"
+            )
+            for i in range(50)
+        ]
+        thread_id = uuid.uuid4()
+        now = timezone.now()
+        return [
+            Message(
+                id=uuid.uuid4(),
+                thread_id=thread_id,
+                user=users[i % len(users)],
+                created_by=users[i % len(users)],
+                content=f"Benchmark message {i} about order line {i * 7}",
+                created_at=now,
+            )
+            for i in range(rows)
+        ]
+
+    def timed(self, run):
+        start = time.perf_counter()
+        run()
+        return time.perf_counter() - start
@@ -0,0 +1,107 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat.models import Message, Thread, ThreadParticipant
+from chat.serializers import (
+    ParticipantRowSerializer,
+    ParticipantSerializer,
+    ThreadMessageRowSerializer,
+    ThreadMessageSerializer,
+)
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-row cost of the thread message and participant read paths "
+        "(ModelSerializer vs. values rows). Runs inside a rolled back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+
+        with transaction.atomic():
+            thread = self.seed(rows, options["users"])
+
+            messages = Message.objects.filter(thread=thread)
+            participants = ThreadParticipant.objects.filter(thread=thread)
+            # Every case builds a fresh queryset so no result cache is reused.
+            cases = [
+                (
+                    "messages: ModelSerializer",
+                    rows,
+                    lambda: ThreadMessageSerializer(messages.all(), many=True).data,
+                ),
+                (
+                    "messages: ModelSerializer + select_related",
+                    rows,
+                    lambda: ThreadMessageSerializer(
+                        messages.select_related("user"), many=True
+                    ).data,
+                ),
+                (
+                    "messages: RowSerializer",
+                    rows,
+                    lambda: ThreadMessageRowSerializer(
+                        ThreadMessageRowSerializer.values(messages)
+                    ).data,
+                ),
+                (
+                    "participants: ModelSerializer + select_related",
+                    options["users"],
+                    lambda: ParticipantSerializer(
+                        participants.select_related("user"), many=True
+                    ).data,
+                ),
+                (
+                    "participants: RowSerializer",
+                    options["users"],
+                    lambda: ParticipantRowSerializer(
+                        ParticipantRowSerializer.values(participants)
+                    ).data,
+                ),
+            ]
+            for label, count, run in cases:
+                best = min(self.timed(run) for _ in range(repeat))
+                self.stdout.write(
+                    f"{label:<48} {best * 1e6 / count:9.2f} us/row "
+                    f"({best * 1e3:.1f} ms for {count} rows)"
+                )
+
+            transaction.set_rollback(True)
+
+    def seed(self, rows, user_count):
+        users = CustomUser.objects.bulk_create(
+            CustomUser(email=f"bench-{i}@example.com", name=f"Bench User {i}")
+            for i in range(user_count)
+        )
+        thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="bench", title="Serialization benchmark"
+        )
+        ThreadParticipant.objects.bulk_create(
+            ThreadParticipant(thread=thread, user=user) for user in users
+        )
+        Message.objects.bulk_create(
+            (
+                Message(
+                    thread=thread,
+                    user=users[i % user_count],
+                    content=f"Benchmark message {i}",
+                )
+                for i in range(rows)
+            ),
+            batch_size=1000,
+        )
+        return thread
+
+    def timed(self, run):
+        start = time.perf_counter()
+        run()
+        return time.perf_counter() - start
@@ -0,0 +1,64 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.export import buffered, export_lines, gzip_stream, parse_bound
+from chat.models import Thread
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the history of threads as NDJSON, one message per line, "
+        "streamed so memory stays flat however large the history is."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--thread", action="append", dest="threads", help="Only this thread id."
+        )
+        parser.add_argument("--entity-type")
+        parser.add_argument("--entity-id")
+        parser.add_argument("--since", help="ISO 8601, inclusive.")
+        parser.add_argument("--until", help="ISO 8601, exclusive.")
+        parser.add_argument("--chunk-size", type=int)
+        parser.add_argument(
+            "--output", "-o", help="File to write to; standard output by default."
+        )
+        parser.add_argument("--gzip", action="store_true")
+
+    def handle(self, *args, **options):
+        if not options["threads"] and not options["entity_type"]:
+            raise CommandError("Pass --thread or --entity-type.")
+
+        threads = Thread.objects.all()
+        if options["threads"]:
+            threads = threads.filter(id__in=options["threads"])
+        if options["entity_type"]:
+            threads = threads.filter(entity_type=options["entity_type"])
+        if options["entity_id"]:
+            threads = threads.filter(entity_id=options["entity_id"])
+
+        bounds = {}
+        for name in ("since", "until"):
+            if options[name]:
+                try:
+                    bounds[name] = parse_bound(options[name])
+                except ValueError as e:
+                    raise CommandError(e)
+
+        chunks = buffered(
+            export_lines(threads, chunk_size=options["chunk_size"], **bounds)
+        )
+        if options["gzip"]:
+            chunks = gzip_stream(chunks)
+
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                self.write(chunks, output)
+        else:
+            self.write(chunks, getattr(self.stdout, "buffer", sys.stdout.buffer))
+
+    def write(self, chunks, output):
+        for chunk in chunks:
+            output.write(chunk)
+        output.flush()
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat.models import Thread
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the denormalized activity summary of threads (message count, "
+        "last message, last activity) from the message table, in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--thread", action="append", dest="threads", help="Only this thread id."
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        threads = Thread.objects.order_by("id")
+        if options["threads"]:
+            threads = threads.filter(id__in=options["threads"])
+
+        rebuilt = 0
+        last_id = None
+        while True:
+            # Keyset over the primary key keeps every batch an index range scan
+            batch = threads if last_id is None else threads.filter(id__gt=last_id)
+            ids = list(batch.values_list("id", flat=True)[:batch_size])
+            if not ids:
+                break
+            # One short transaction per batch holds row locks only briefly
+            with transaction.atomic():
+                rebuilt += Thread.objects.filter(id__in=ids).rebuild_activity()
+            last_id = ids[-1]
+            self.stdout.write(f"Rebuilt {rebuilt} threads")
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {rebuilt} threads rebuilt."))
@@ -0,0 +1,194 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from chat.models import Message, Thread, ThreadParticipant
+from chat_system.ids import uuid7_from_datetime
+from users.models import CustomUser
+
+EMAIL_DOMAIN = "bench.example.com"
+ENTITY_PREFIX = "bench-"
+WORDS = (
+    "order supplier payment stock invoice shipment delayed confirmed pending "
+    "refund quantity price warehouse delivery tracking approved rejected "
+    "urgent update please check attached thanks tomorrow today line item"
+).split()
+
+
+def bench_email(index):
+    return f"bench-user-{index}@{EMAIL_DOMAIN}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic chat dataset for benchmarks: users, threads across "
+        "every entity type with Pareto-skewed message counts, and participants. "
+        f"Seeded users have @{EMAIL_DOMAIN} emails; the first one can log in "
+        "with --password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--threads", type=int, default=1000)
+        parser.add_argument("--messages", type=int, default=100000)
+        parser.add_argument(
+            "--participants", type=int, default=5, help="Participants per thread."
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.2,
+            help="Pareto shape of messages per thread; lower is more skewed.",
+        )
+        parser.add_argument(
+            "--days", type=int, default=90, help="Spread messages over this period."
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--password", default="bench-password")
+        parser.add_argument(
+            "--clear", action="store_true", help="Remove previously seeded data first."
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        if options["users"] < 1 or options["threads"] < 1:
+            raise CommandError("--users and --threads must be positive.")
+
+        seeded = CustomUser.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}")
+        if options["clear"]:
+            Thread.all_objects.filter(entity_id__startswith=ENTITY_PREFIX).delete()
+            seeded.delete()
+        elif seeded.exists():
+            raise CommandError(
+                "Seeded data already exists; pass --clear to replace it."
+            )
+
+        with transaction.atomic():
+            users = self.seed_users(options["users"], options["password"])
+            threads = self.seed_threads(users, options["threads"], options["days"])
+            members = self.seed_participants(threads, users, options["participants"])
+        messages = self.seed_messages(
+            threads, members, options["messages"], options["skew"], options["days"]
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {len(users)} users, {len(threads)} threads and "
+                f"{messages} messages. Log in as {bench_email(0)}."
+            )
+        )
+
+    def seed_users(self, count, password):
+        # Hashing once keeps seeding fast; every user shares the password
+        password = make_password(password)
+        return CustomUser.objects.bulk_create(
+            [
+                CustomUser(
+                    email=bench_email(i), name=f"Bench User {i}", password=password
+                )
+                for i in range(count)
+            ],
+            batch_size=self.batch_size,
+        )
+
+    def seed_threads(self, users, count, days):
+        entity_types = [entity_type for entity_type, _ in Thread.ENTITY_TYPES]
+        threads = Thread.objects.bulk_create(
+            [
+                Thread(
+                    entity_type=entity_types[i % len(entity_types)],
+                    entity_id=f"{ENTITY_PREFIX}{i}",
+                    title=f"Benchmark thread {i}",
+                    created_by=self.random.choice(users),
+                )
+                for i in range(count)
+            ],
+            batch_size=self.batch_size,
+        )
+        # Thread creation times spread over the first half of the period
+        start = timezone.now() - timedelta(days=days)
+        for thread in threads:
+            thread.created_at = start + timedelta(
+                seconds=self.random.uniform(0, days * 86400 / 2)
+            )
+        Thread.objects.bulk_update(threads, ["created_at"], batch_size=500)
+        return threads
+
+    def seed_participants(self, threads, users, per_thread):
+        members = {}
+        participants = []
+        for thread in threads:
+            # The login user takes part in every thread, so per-user endpoints
+            # (inbox, search) see the whole dataset
+            chosen = {users[0]} | set(
+                self.random.sample(users, min(per_thread, len(users)))
+            )
+            members[thread.id] = list(chosen)
+            participants += [
+                ThreadParticipant(
+                    thread=thread, user=user, created_by=thread.created_by
+                )
+                for user in chosen
+            ]
+        ThreadParticipant.objects.bulk_create(participants, batch_size=self.batch_size)
+        return members
+
+    def seed_messages(self, threads, members, total, skew, days):
+        weights = [self.random.paretovariate(skew) for _ in threads]
+        scale = total / sum(weights)
+        counts = [int(weight * scale) for weight in weights]
+        # Hand the rounding remainder to the heaviest threads
+        for index in sorted(
+            range(len(threads)), key=weights.__getitem__, reverse=True
+        )[: total - sum(counts)]:
+            counts[index] += 1
+
+        end = timezone.now()
+        batch = []
+        created = 0
+        for thread, count in zip(threads, counts):
+            if not count:
+                continue
+            # Evenly spaced from the thread's creation until now
+            step = (end - thread.created_at) / count
+            for i in range(count):
+                created_at = thread.created_at + step * (i + 1)
+                batch.append(
+                    Message(
+                        # Keys as if the message had been posted back then
+                        id=uuid7_from_datetime(created_at),
+                        thread=thread,
+                        user=self.random.choice(members[thread.id]),
+                        content=" ".join(
+                            self.random.choices(WORDS, k=self.random.randint(3, 30))
+                        ),
+                        created_at=created_at,
+                    )
+                )
+                if len(batch) >= self.batch_size:
+                    created += self.insert(batch)
+                    self.stdout.write(f"{created} messages")
+                    batch = []
+        if batch:
+            created += self.insert(batch)
+
+        Thread.objects.filter(entity_id__startswith=ENTITY_PREFIX).rebuild_activity()
+        return created
+
+    def insert(self, messages):
+        # created_at is auto_now_add, so the spread timestamps are written
+        # back after the insert
+        created_at = [message.created_at for message in messages]
+        with transaction.atomic():
+            Message.objects.bulk_create(messages)
+            for message, value in zip(messages, created_at):
+                message.created_at = value
+            # Small update batches keep the generated CASE expression short
+            Message.objects.bulk_update(messages, ["created_at"], batch_size=500)
+        return len(messages)
@@ -0,0 +1,208 @@
+"""
+Cached index of the threads each user takes part in, behind the
+``IsThreadParticipant`` permission.
+
+A user's thread ids are loaded with one query on their first check and then
+answer every later check from memory. Participant changes update the index
+once they commit: the model signals cover saves and deletes, and
+``chat.models.participants_added`` covers ``ThreadParticipantQuerySet.bulk_add``, which
+bypasses them.
+
+``LocalMembershipIndex`` keeps the sets in each process and updates them in
+place; changes made by other processes reach it within
+``CHAT_MEMBERSHIP_CACHE_TTL``. ``SharedMembershipIndex`` keeps them in a
+Django cache shared by all processes, where a change moves the user to a
+new generation instead, so a concurrent update can never be lost.
+"""
+
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from users.cache import TTLCache
+
+from .models import ThreadParticipant
+
+
+def as_uuids(values):
+    return {uuid.UUID(str(value)) for value in values}
+
+
+def load_threads(user_id):
+    return frozenset(
+        ThreadParticipant.objects.filter(user_id=user_id).values_list(
+            "thread_id", flat=True
+        )
+    )
+
+
+class BaseMembershipIndex:
+    def is_member(self, user_id, thread_id):
+        return uuid.UUID(str(thread_id)) in self.threads(user_id)
+
+    def threads(self, user_id):
+        """
+        Ids of the threads ``user_id`` takes part in.
+        """
+        raise NotImplementedError
+
+    def add(self, user_id, thread_ids):
+        raise NotImplementedError
+
+    def remove(self, user_id, thread_ids):
+        raise NotImplementedError
+
+    def forget(self, user_id):
+        """
+        Drop the user's set, e.g. after a change that is not a plain add or
+        removal.
+        """
+        raise NotImplementedError
+
+
+class LocalMembershipIndex(BaseMembershipIndex):
+    """
+    Per-process LRU of up to ``CHAT_MEMBERSHIP_CACHE_SIZE`` users' sets.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(
+            max_size=getattr(settings, "CHAT_MEMBERSHIP_CACHE_SIZE", 10000),
+            ttl=getattr(settings, "CHAT_MEMBERSHIP_CACHE_TTL", 60),
+        )
+        self.lock = threading.Lock()
+        # Bumped by every change; a set loaded across a change is not kept,
+        # since the query may have missed it
+        self.changes = 0
+
+    def threads(self, user_id):
+        key = str(uuid.UUID(str(user_id)))
+        threads = self.cache.get(key)
+        if threads is None:
+            changes = self.changes
+            threads = load_threads(user_id)
+            with self.lock:
+                if changes == self.changes:
+                    self.cache.set(key, threads)
+        return threads
+
+    def change(self, user_id, function):
+        with self.lock:
+            self.changes += 1
+            self.cache.update(str(uuid.UUID(str(user_id))), function)
+
+    def add(self, user_id, thread_ids):
+        self.change(user_id, lambda threads: threads | as_uuids(thread_ids))
+
+    def remove(self, user_id, thread_ids):
+        self.change(user_id, lambda threads: threads - as_uuids(thread_ids))
+
+    def forget(self, user_id):
+        with self.lock:
+            self.changes += 1
+            self.cache.delete(str(uuid.UUID(str(user_id))))
+
+
+class SharedMembershipIndex(BaseMembershipIndex):
+    """
+    Sets kept in the Django cache ``CHAT_MEMBERSHIP_CACHE_ALIAS`` for
+    ``CHAT_MEMBERSHIP_CACHE_TTL`` seconds, tagged with the user's
+    generation. A check reads both in one round trip.
+    """
+
+    def __init__(self):
+        alias = getattr(settings, "CHAT_MEMBERSHIP_CACHE_ALIAS", "default")
+        self.cache = caches[alias]
+        self.ttl = getattr(settings, "CHAT_MEMBERSHIP_CACHE_TTL", 60)
+
+    def keys(self, user_id):
+        user_id = uuid.UUID(str(user_id))
+        return f"chat:members:{user_id}", f"chat:members:{user_id}:generation"
+
+    def threads(self, user_id):
+        key, generation_key = self.keys(user_id)
+        cached = self.cache.get_many([key, generation_key])
+        generation = cached.get(generation_key)
+        entry = cached.get(key)
+        if entry is not None and entry[0] == generation:
+            return entry[1]
+        threads = load_threads(user_id)
+        # Tagged with the generation read before the query: if a change
+        # landed meanwhile, the next check reloads
+        self.cache.set(key, (generation, threads), self.ttl)
+        return threads
+
+    def forget(self, user_id):
+        _, generation_key = self.keys(user_id)
+        try:
+            self.cache.incr(generation_key)
+        except ValueError:
+            self.cache.set(generation_key, 1, None)
+
+    def add(self, user_id, thread_ids):
+        self.forget(user_id)
+
+    def remove(self, user_id, thread_ids):
+        self.forget(user_id)
+
+
+_membership_index = None
+
+
+def get_membership_index():
+    global _membership_index
+    if _membership_index is None:
+        backend = getattr(
+            settings,
+            "CHAT_MEMBERSHIP_BACKEND",
+            "chat.membership.LocalMembershipIndex",
+        )
+        _membership_index = import_string(backend)()
+    return _membership_index
+
+
+@receiver(setting_changed)
+def reset_membership_index(*, setting, **kwargs):
+    global _membership_index
+    if setting.startswith("CHAT_MEMBERSHIP"):
+        _membership_index = None
+
+
+def participant_saved(sender, instance, created, **kwargs):
+    loaded_user_id = getattr(instance, "_loaded_user_id", None)
+
+    def update():
+        index = get_membership_index()
+        if created:
+            index.add(instance.user_id, [instance.thread_id])
+            return
+        # Edits may move the membership or soft-delete it
+        index.forget(instance.user_id)
+        if loaded_user_id is not None and loaded_user_id != instance.user_id:
+            index.forget(loaded_user_id)
+
+    transaction.on_commit(update)
+
+
+def participant_deleted(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: get_membership_index().remove(instance.user_id, [instance.thread_id])
+    )
+
+
+def participants_bulk_added(sender, pairs, **kwargs):
+    def update():
+        index = get_membership_index()
+        by_user = {}
+        for thread_id, user_id in pairs:
+            by_user.setdefault(user_id, []).append(thread_id)
+        for user_id, thread_ids in by_user.items():
+            index.add(user_id, thread_ids)
+
+    transaction.on_commit(update)
@@ -1,6 +1,26 @@
-import uuid
-from django.db import models
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest, Substr
+from django.dispatch import Signal
+from django.utils import timezone
+from chat_system.ids import uuid7
 from users.models import CustomUser
+from .list_version import bump_thread_list_version
+
+MESSAGE_PREVIEW_LENGTH = 255
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class LiveManager(models.Manager):
+    """
+    Default manager: rows that are not soft-deleted. Deleted rows stay
+    reachable through ``all_objects``.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
 
 
 class BaseModel(models.Model):
@@ -14,10 +34,158 @@ class BaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_deleted = models.BooleanField(default=False)
 
+    objects = LiveManager()
+    all_objects = models.Manager()
+
     class Meta:
         abstract = True
 
 
+class ThreadQuerySet(models.QuerySet):
+    """
+    Maintenance of the denormalized activity summary on ``Thread``.
+
+    Callers run these in the same transaction as the message writes they
+    describe, so the summary never disagrees with the committed messages.
+    """
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        if rows:
+            # Every summary change shows in the thread list
+            bump_thread_list_version(self.db)
+        return rows
+
+    def record_messages(self, messages):
+        """
+        Fold newly created messages into their threads' summaries with one
+        UPDATE per thread.
+        """
+        counts = Counter()
+        latest = {}
+        for message in messages:
+            counts[message.thread_id] += 1
+            current = latest.get(message.thread_id)
+            if current is None or message.created_at >= current.created_at:
+                latest[message.thread_id] = message
+
+        for thread_id, count in counts.items():
+            message = latest[thread_id]
+            # Concurrent writers may commit out of order; never move backwards.
+            newer = Q(last_message_at__isnull=True) | Q(
+                last_message_at__lte=message.created_at
+            )
+            self.filter(pk=thread_id).update(
+                version=F("version") + 1,
+                modified_at=timezone.now(),
+                message_count=F("message_count") + count,
+                last_message_at=Case(
+                    When(newer, then=Value(message.created_at)),
+                    default=F("last_message_at"),
+                ),
+                last_message_preview=Case(
+                    When(
+                        newer,
+                        then=Value(message.content[:MESSAGE_PREVIEW_LENGTH]),
+                    ),
+                    default=F("last_message_preview"),
+                ),
+                last_activity_at=Greatest(
+                    F("last_activity_at"), Value(message.created_at)
+                ),
+            )
+
+    def forget_messages(self, messages):
+        """
+        Remove deleted messages from their threads' summaries, re-reading
+        the latest message only where the deleted one was the latest.
+        """
+        counts = Counter()
+        newest = {}
+        for message in messages:
+            counts[message.thread_id] += 1
+            newest[message.thread_id] = max(
+                message.created_at, newest.get(message.thread_id, message.created_at)
+            )
+
+        for thread_id, count in counts.items():
+            self.filter(pk=thread_id).update(
+                version=F("version") + 1,
+                modified_at=timezone.now(),
+                message_count=Greatest(F("message_count") - count, Value(0)),
+            )
+            self.filter(
+                pk=thread_id, last_message_at__lte=newest[thread_id]
+            ).refresh_last_message()
+
+    def touch(self):
+        """
+        Mark the threads' messages or participants as changed, invalidating
+        the validators served for conditional GETs.
+        """
+        return self.update(version=F("version") + 1, modified_at=timezone.now())
+
+    def refresh_last_message(self):
+        latest = self.latest_messages()
+        archived = self.latest_messages(ArchivedMessage)
+        return self.update(
+            last_message_at=Coalesce(
+                Subquery(latest.values("created_at")[:1]),
+                Subquery(archived.values("created_at")[:1]),
+            ),
+            last_message_preview=Coalesce(
+                Subquery(latest.values("preview")[:1]),
+                Subquery(archived.values("preview")[:1]),
+                Value(""),
+            ),
+        )
+
+    def rebuild_activity(self):
+        """
+        Recompute the whole summary from ``Message`` and ``ArchivedMessage``
+        in a single UPDATE, which also touches the threads. Archived messages
+        are always older than the thread's hot messages, so they only matter
+        once those run out.
+        """
+        latest = self.latest_messages()
+        archived = self.latest_messages(ArchivedMessage)
+        last_message_at = Coalesce(
+            Subquery(latest.values("created_at")[:1]),
+            Subquery(archived.values("created_at")[:1]),
+        )
+        return self.update(
+            message_count=self.count_messages(Message)
+            + self.count_messages(ArchivedMessage),
+            last_message_at=last_message_at,
+            last_message_preview=Coalesce(
+                Subquery(latest.values("preview")[:1]),
+                Subquery(archived.values("preview")[:1]),
+                Value(""),
+            ),
+            last_activity_at=Coalesce(last_message_at, F("created_at")),
+            version=F("version") + 1,
+            modified_at=timezone.now(),
+        )
+
+    def count_messages(self, model):
+        counts = (
+            model.objects.filter(thread=OuterRef("pk"))
+            .order_by()
+            .values("thread")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        return Coalesce(Subquery(counts), Value(0))
+
+    def latest_messages(self, model=None):
+        model = model or Message
+        return (
+            model.objects.filter(thread=OuterRef("pk"))
+            .order_by("-created_at", "-id")
+            .annotate(preview=Substr("content", 1, MESSAGE_PREVIEW_LENGTH))
+        )
+
+
 class Thread(BaseModel):  # Inherit from BaseModel
     ENTITY_TYPES = [
         ("ORDER", "Order"),
@@ -27,36 +195,358 @@ class Thread(BaseModel):  # Inherit from BaseModel
         ("STOCK", "Stock"),
     ]
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     entity_type = models.CharField(max_length=50, choices=ENTITY_TYPES)
     entity_id = models.CharField(max_length=50)
     title = models.TextField()
+    # Activity summary, maintained alongside message writes (see ThreadQuerySet)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_preview = models.CharField(
+        max_length=MESSAGE_PREVIEW_LENGTH, blank=True, default=""
+    )
+    message_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    # Bumped on every change to the thread's messages or participants
+    version = models.PositiveBigIntegerField(default=0)
+    modified_at = models.DateTimeField(auto_now=True)
+    # Messages created up to this moment may have moved to ArchivedMessage
+    archived_until = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveManager.from_queryset(ThreadQuerySet)()
+    all_objects = ThreadQuerySet.as_manager()
 
     class Meta:
-        indexes = [models.Index(fields=["entity_type", "entity_id"])]
+        indexes = [
+            # Partial: only live threads are ever looked up by entity
+            models.Index(
+                fields=["entity_type", "entity_id"],
+                condition=Q(is_deleted=False),
+                name="chat_thread_live_entity_idx",
+            ),
+            models.Index(fields=["last_activity_at", "id"]),
+            # Global list, newest first
+            models.Index(
+                fields=["created_at", "id"],
+                condition=Q(is_deleted=False),
+                name="chat_thread_live_created_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        # Edits change the representation too; bumped in SQL, so a concurrent
+        # touch() is never overwritten with the version it already used
+        self.version = F("version") + 1
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "version", "modified_at"}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.refresh_from_db(fields=["version"])
+
 
 class Message(BaseModel):  # Inherit from BaseModel
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     thread = models.ForeignKey(
         Thread, related_name="messages", on_delete=models.CASCADE
     )
     user = models.ForeignKey("users.CustomUser", on_delete=models.CASCADE)
     content = models.TextField()
 
+    class Meta:
+        # Serves the thread history as a single index range scan per page;
+        # partial, so deleted messages never grow the index.
+        indexes = [
+            models.Index(
+                fields=["thread", "created_at", "id"],
+                condition=Q(is_deleted=False),
+                name="chat_message_live_history_idx",
+            ),
+            # History by UUIDv7 id alone (CHAT_MESSAGES_ORDER_BY_ID)
+            models.Index(
+                fields=["thread", "id"],
+                condition=Q(is_deleted=False),
+                name="chat_message_live_id_idx",
+            ),
+            # Global list, newest first, optionally by author
+            models.Index(
+                fields=["created_at", "id"],
+                condition=Q(is_deleted=False),
+                name="chat_message_live_created_idx",
+            ),
+            models.Index(
+                fields=["user", "created_at", "id"],
+                condition=Q(is_deleted=False),
+                name="chat_message_live_user_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"Message by {self.user} in Thread {self.thread.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so a message moved to another thread updates both
+        instance._loaded_thread_id = instance.__dict__.get("thread_id")
+        # And so an edit adjusts the summary instead of rebuilding it
+        if {"is_deleted", "content", "created_at"} <= instance.__dict__.keys():
+            instance._loaded_state = (
+                instance.is_deleted,
+                instance.content,
+                instance.created_at,
+            )
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Thread.all_objects.record_messages([self])
+            else:
+                self.update_activity()
+        self._loaded_thread_id = self.thread_id
+        self._loaded_state = (self.is_deleted, self.content, self.created_at)
+
+    def update_activity(self):
+        """
+        Fold an edit into the thread summaries: a soft delete, restore or
+        move changes the counts by one, and a new text only re-reads the
+        preview where this may be the latest message.
+        """
+        loaded_thread_id = getattr(self, "_loaded_thread_id", None)
+        loaded_state = getattr(self, "_loaded_state", None)
+        threads = Thread.all_objects
+        if loaded_thread_id is None or loaded_state is None:
+            # Not read from the database; nothing to compare against
+            affected = threads.filter(
+                pk__in={self.thread_id, loaded_thread_id} - {None}
+            )
+            affected.rebuild_activity()
+            return
+
+        was_deleted, content, created_at = loaded_state
+        left = not was_deleted and (
+            self.is_deleted
+            or loaded_thread_id != self.thread_id
+            or created_at != self.created_at
+        )
+        joined = not self.is_deleted and (was_deleted or left)
+        if left:
+            threads.forget_messages(
+                [Message(thread_id=loaded_thread_id, created_at=created_at)]
+            )
+        if joined:
+            threads.record_messages([self])
+        if not left and not joined:
+            if not self.is_deleted and content != self.content:
+                threads.filter(
+                    pk=self.thread_id, last_message_at__lte=self.created_at
+                ).refresh_last_message()
+            threads.filter(pk=self.thread_id).touch()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Thread.all_objects.forget_messages([self])
+        return result
+
+
+class ArchivedMessage(models.Model):
+    """
+    Cold storage for messages past their thread's retention period, moved
+    here unchanged by the ``archive_messages`` command.
+    """
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    thread = models.ForeignKey(
+        Thread, related_name="archived_messages", on_delete=models.CASCADE
+    )
+    user = models.ForeignKey("users.CustomUser", on_delete=models.CASCADE)
+    content = models.TextField()
+    created_by = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="archivedmessage_created_by",
+    )
+    # Copied from the original message, not set on archival
+    created_at = models.DateTimeField()
+    is_deleted = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    # Fields copied verbatim from Message
+    copied_fields = (
+        "id",
+        "thread_id",
+        "user_id",
+        "content",
+        "created_by_id",
+        "created_at",
+        "is_deleted",
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["thread", "created_at", "id"],
+                condition=Q(is_deleted=False),
+                name="chat_archive_live_history_idx",
+            ),
+            models.Index(
+                fields=["thread", "id"],
+                condition=Q(is_deleted=False),
+                name="chat_archive_live_id_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Archived message {self.id} in Thread {self.thread_id}"
+
+
+# Sent with the (thread_id, user_id) ``pairs`` added by ``bulk_add``, which
+# bypasses the model signals
+participants_added = Signal()
+
+
+class ThreadParticipantQuerySet(models.QuerySet):
+    def bulk_add(self, pairs, created_by=None):
+        """
+        Add ``(thread_id, user_id)`` pairs with a single conflict-ignoring
+        INSERT, reviving soft-deleted memberships. Returns the pairs that
+        were not participants before.
+        """
+        pairs = set(pairs)
+        if not pairs:
+            return set()
+        existing = {}
+        revived = set()
+        # Soft-deleted memberships still hold the unique (thread, user) pair
+        for pk, thread_id, user_id, is_deleted in self.model.all_objects.filter(
+            thread_id__in={thread_id for thread_id, _ in pairs},
+            user_id__in={user_id for _, user_id in pairs},
+        ).values_list("id", "thread_id", "user_id", "is_deleted"):
+            if (thread_id, user_id) in pairs:
+                existing[thread_id, user_id] = pk
+                if is_deleted:
+                    revived.add(pk)
+
+        added = pairs - existing.keys()
+        self.bulk_create(
+            [
+                self.model(thread_id=thread_id, user_id=user_id, created_by=created_by)
+                for thread_id, user_id in added
+            ],
+            ignore_conflicts=True,
+        )
+        if revived:
+            self.model.all_objects.filter(pk__in=revived).update(is_deleted=False)
+            added |= {pair for pair, pk in existing.items() if pk in revived}
+        if added:
+            Thread.all_objects.filter(
+                pk__in={thread_id for thread_id, _ in added}
+            ).touch()
+            participants_added.send(sender=self.model, pairs=added)
+        return added
+
+    def with_unread_counts(self):
+        """
+        Annotate ``unread_count``: live messages by other users after the
+        participant's read cursor.
+
+        Threads already read past their last message short-circuit to zero;
+        the rest count a single range of the thread history index, so the
+        whole inbox is one query however many threads the user is in.
+        """
+        unread = (
+            Message.objects.filter(
+                thread=OuterRef("thread_id"),
+                created_at__gt=Coalesce(OuterRef("last_read_at"), Value(EPOCH)),
+            )
+            .exclude(user=OuterRef("user_id"))
+            .order_by()
+            .values("thread")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        return self.annotate(
+            unread_count=Case(
+                When(
+                    Q(thread__last_message_at__isnull=True)
+                    | Q(thread__last_message_at__lte=F("last_read_at")),
+                    then=Value(0),
+                ),
+                default=Coalesce(Subquery(unread), Value(0)),
+            )
+        )
+
+    def mark_read(self, until):
+        """
+        Advance read cursors to ``until``; cursors never move backwards.
+        """
+        return self.filter(
+            Q(last_read_at__isnull=True) | Q(last_read_at__lt=until)
+        ).update(last_read_at=until)
+
 
 class ThreadParticipant(BaseModel):  # Inherit from BaseModel
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     thread = models.ForeignKey(
         Thread, related_name="participants", on_delete=models.CASCADE
     )
     user = models.ForeignKey("users.CustomUser", on_delete=models.CASCADE)
+    # Read cursor: messages created after this are unread
+    last_read_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveManager.from_queryset(ThreadParticipantQuerySet)()
+    all_objects = ThreadParticipantQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["thread", "user"], name="unique_thread_participant"
+            )
+        ]
+        # Global list, newest first, optionally by user
+        indexes = [
+            models.Index(
+                fields=["created_at", "id"],
+                condition=Q(is_deleted=False),
+                name="chat_tp_live_created_idx",
+            ),
+            models.Index(
+                fields=["user", "created_at", "id"],
+                condition=Q(is_deleted=False),
+                name="chat_tp_live_user_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Participant {self.user} in Thread {self.thread.title}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so a membership moved to another user updates both
+        instance._loaded_user_id = instance.__dict__.get("user_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Thread.all_objects.filter(pk=self.thread_id).touch()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Thread.all_objects.filter(pk=self.thread_id).touch()
+        return result
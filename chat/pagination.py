@@ -0,0 +1,293 @@
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import DateTimeField
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination:
+    """
+    Opaque cursor pagination over ``(<ordering field>, id)``; the field holds
+    datetimes or integers. Ordering by ``id`` alone suits tables keyed by
+    time-ordered UUIDv7s (see ``chat_system.ids``).
+
+    Every page is a single range scan on the ordering index, so the cost of
+    a page does not depend on how deep the client has scrolled. Items are
+    returned in display order; ``after`` walks towards the end of that order
+    and ``before`` walks towards its start.
+    """
+
+    position_field = "created_at"
+    ordering = "created_at"
+    # Which end of the ordering is served when no cursor is given.
+    anchor = "start"
+    page_size = 50
+    max_page_size = 200
+    limit_query_param = "limit"
+    before_query_param = "before"
+    after_query_param = "after"
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, ordering=None, anchor=None, page_size=None):
+        if ordering is not None:
+            self.ordering = ordering
+        if anchor is not None:
+            self.anchor = anchor
+        if page_size is not None:
+            self.page_size = page_size
+        self.descending = self.ordering.startswith("-")
+        self.position_field = self.ordering.lstrip("-")
+        self.by_id = self.position_field == "id"
+
+    def paginate_queryset(self, queryset, request, archived=None):
+        """
+        ``archived`` optionally holds rows that all sort before every row of
+        ``queryset`` (e.g. cold storage); it is only queried once a page
+        reaches past the start of ``queryset``.
+        """
+        querysets = self.prepare(queryset, request, archived)
+        return self.set_page(self.fetch(querysets))
+
+    async def apaginate_queryset(self, queryset, request, archived=None):
+        """
+        ``paginate_queryset`` for async views.
+        """
+        querysets = self.prepare(queryset, request, archived)
+        return self.set_page(await self.afetch(querysets))
+
+    def prepare(self, queryset, request, archived):
+        """
+        Read the limit and cursor from ``request``; returns the querysets to
+        scan, in position order.
+        """
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.position_type = self.get_position_type(queryset.model)
+        before = self.decode_cursor(request.query_params.get(self.before_query_param))
+        after = self.decode_cursor(request.query_params.get(self.after_query_param))
+
+        # Either walk towards the end of the display order from ``after``
+        # (or the start), or towards its start from ``before`` (or the end)
+        if after is not None:
+            self.position, self.reverse = after, False
+        elif before is not None or self.anchor == "end":
+            self.position, self.reverse = before, True
+        else:
+            self.position, self.reverse = None, False
+        return [queryset] if archived is None else [archived, queryset]
+
+    def paginate_tail(self, tail, request):
+        """
+        The opening page (no cursor) out of a thread's cached tail
+        (``chat.tail_cache.Tail``), or ``None`` when the tail holds too few
+        messages for it.
+        """
+        self.request = request
+        self.limit = self.get_limit(request)
+        if len(tail.messages) < self.limit and not tail.complete:
+            return None
+        self.position, self.reverse = None, True
+        # Nearest first, as seek() would return them
+        rows = sorted(tail.messages, key=self.get_position, reverse=True)
+        self.set_page(rows[: self.limit + 1])
+        # Older messages exist beyond the tail
+        self.has_previous = self.has_previous or not tail.complete
+        return self.page
+
+    def opens_tail(self, request, size):
+        """
+        Whether ``request`` asks for the opening page, of at most ``size``
+        items, of an ordering anchored at its end.
+        """
+        params = request.query_params
+        return (
+            self.anchor == "end"
+            and not params.get(self.before_query_param)
+            and not params.get(self.after_query_param)
+            and self.get_limit(request) <= size
+        )
+
+    def set_page(self, rows):
+        """
+        Store the page out of up to ``limit + 1`` fetched rows.
+        """
+        more = len(rows) > self.limit
+        rows = rows[: self.limit]
+        if self.reverse:
+            # Fetched nearest first
+            self.has_previous = more
+            self.has_next = self.position is not None
+            self.page = rows[::-1]
+        else:
+            self.has_next = more
+            self.has_previous = self.position is not None
+            self.page = rows
+        return self.page
+
+    def fetch(self, querysets):
+        """
+        Up to ``limit + 1`` rows from the current position, in scan order.
+        """
+        rows = []
+        for queryset in self.scan_order(querysets):
+            wanted = self.limit + 1 - len(rows)
+            rows.extend(self.seek(queryset)[:wanted])
+            # Stop as soon as the page is full
+            if len(rows) > self.limit:
+                break
+        return rows
+
+    async def afetch(self, querysets):
+        rows = []
+        for queryset in self.scan_order(querysets):
+            wanted = self.limit + 1 - len(rows)
+            rows.extend([row async for row in self.seek(queryset)[:wanted]])
+            if len(rows) > self.limit:
+                break
+        return rows
+
+    def scan_order(self, querysets):
+        # Segments are ordered by position; walk them in the scan direction
+        ascending = self.descending == self.reverse
+        return querysets if ascending else querysets[::-1]
+
+    def seek(self, queryset):
+        field = self.position_field
+        # Walking the index in ascending (field, id) order?
+        ascending = self.descending == self.reverse
+        if self.by_id:
+            if self.position is not None:
+                lookup = "id__gt" if ascending else "id__lt"
+                queryset = queryset.filter(**{lookup: self.position[1]})
+            return queryset.order_by("id" if ascending else "-id")
+        if self.position is not None:
+            value, pk = self.position
+            # A single-column range predicate keeps this an index range scan;
+            # the tie on equal timestamps is resolved by the residual filter.
+            if ascending:
+                queryset = queryset.filter(**{f"{field}__gte": value}).exclude(
+                    **{field: value, "id__lte": pk}
+                )
+            else:
+                queryset = queryset.filter(**{f"{field}__lte": value}).exclude(
+                    **{field: value, "id__gte": pk}
+                )
+        if ascending:
+            return queryset.order_by(field, "id")
+        return queryset.order_by(f"-{field}", "-id")
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if limit <= 0:
+            return self.page_size
+        return min(limit, self.max_page_size)
+
+    def get_position_type(self, model):
+        """
+        The type cursor values must have: ``datetime`` for datetime fields,
+        ``int`` for counters.
+        """
+        field = model._meta.get_field(self.position_field)
+        return datetime if isinstance(field, DateTimeField) else int
+
+    def get_position(self, item):
+        if isinstance(item, dict):
+            return item[self.position_field], item["id"]
+        return getattr(item, self.position_field), item.id
+
+    def encode_cursor(self, item):
+        value, pk = self.get_position(item)
+        if self.by_id:
+            payload = json.dumps([str(pk)]).encode()
+        else:
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            payload = json.dumps([value, str(pk)]).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+        try:
+            padded = encoded + "=" * (-len(encoded) % 4)
+            position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if self.by_id:
+                # Cursors of another ordering fail here rather than skip rows
+                (pk,) = position
+                return None, uuid.UUID(pk)
+            value, pk = position
+            if isinstance(value, str):
+                value = parse_datetime(value)
+            pk = uuid.UUID(pk)
+        except (AttributeError, TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        # A cursor of another ordering would fail in the query instead
+        if not isinstance(value, self.position_type) or isinstance(value, bool):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def get_link(self, param, item):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.before_query_param)
+        url = remove_query_param(url, self.after_query_param)
+        return replace_query_param(url, param, self.encode_cursor(item))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.after_query_param, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(self.before_query_param, self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+
+class ThreadMessagePagination(KeysetPagination):
+    """
+    Message history: oldest first, opening on the most recent page.
+    """
+
+    ordering = "created_at"
+    anchor = "end"
+
+    def __init__(self, **kwargs):
+        if getattr(settings, "CHAT_MESSAGES_ORDER_BY_ID", False):
+            kwargs.setdefault("ordering", "id")
+        kwargs.setdefault(
+            "page_size", getattr(settings, "CHAT_MESSAGES_PAGE_SIZE", self.page_size)
+        )
+        super().__init__(**kwargs)
+
+
+class ListPagination(KeysetPagination):
+    """
+    Global list endpoints: newest first unless another ordering is given.
+    """
+
+    ordering = "-created_at"
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault(
+            "page_size", getattr(settings, "CHAT_LIST_PAGE_SIZE", self.page_size)
+        )
+        super().__init__(**kwargs)
@@ -0,0 +1,53 @@
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import BasePermission
+
+from .membership import get_membership_index
+from .models import ThreadParticipant
+
+
+def participating(queryset, user, field="thread"):
+    """
+    Rows of ``queryset`` whose ``field`` is a thread ``user`` takes part in;
+    all of them for staff.
+    """
+    if user.is_staff:
+        return queryset
+    threads = ThreadParticipant.objects.filter(user=user).values("thread_id")
+    return queryset.filter(**{f"{field}__in": threads})
+
+
+def limit_thread_choices(serializer, user):
+    """
+    Let ``serializer``'s ``thread`` field accept only the user's threads.
+    Others fail validation as unknown ones do, so their existence is not
+    revealed.
+    """
+    field = serializer.fields["thread"]
+    field.queryset = participating(field.queryset, user, "id")
+    return serializer
+
+
+class IsThreadParticipant(BasePermission):
+    """
+    Allows ``threads/<thread_id>/...`` to the thread's participants and to
+    staff, checked against the cached membership index. Others get 404, as
+    if the thread did not exist. Views naming the thread by another URL
+    keyword set ``thread_kwarg``. Threads named in the body or query string
+    are checked by the views, with ``participating``.
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return False
+        thread_id = view.kwargs.get(getattr(view, "thread_kwarg", "thread_id"))
+        if thread_id is None or user.is_staff:
+            return True
+        try:
+            is_member = get_membership_index().is_member(user.pk, thread_id)
+        except ValueError:
+            # Not a thread id at all
+            is_member = False
+        if not is_member:
+            raise NotFound()
+        return True
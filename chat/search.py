@@ -0,0 +1,166 @@
+"""
+Full-text search over ``Message.content``.
+
+PostgreSQL keeps a generated ``tsvector`` column with a GIN index on the
+message table; SQLite (tests and local development) keeps an external-content
+FTS5 table in sync through triggers. Both are created after ``migrate`` by
+``install_search_index`` and maintained by the database on every write.
+"""
+
+import html
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, F, FloatField, TextField, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Message
+
+SEARCH_COLUMN = "search_vector"
+
+# The database wraps matches in these; ``render_highlight`` swaps them for
+# the configured markers once the text around them is escaped
+MATCH_START = "\x02"
+MATCH_STOP = "\x03"
+
+
+def search_config():
+    return getattr(settings, "CHAT_SEARCH_CONFIG", "english")
+
+
+def highlight_markers():
+    return getattr(settings, "CHAT_SEARCH_HIGHLIGHT", ("<mark>", "</mark>"))
+
+
+def render_highlight(text):
+    """
+    The ``highlight`` annotation as HTML: the message text escaped, with
+    matches wrapped in the ``CHAT_SEARCH_HIGHLIGHT`` markers.
+    """
+    if text is None:
+        return None
+    start, stop = highlight_markers()
+    return html.escape(text).replace(MATCH_START, start).replace(MATCH_STOP, stop)
+
+
+def fts_table():
+    return f"{Message._meta.db_table}_fts"
+
+
+def install_search_index(sender=None, using="default", **kwargs):
+    """
+    Create the search column/table and index if missing (``post_migrate``).
+    """
+    connection = connections[using]
+    table = Message._meta.db_table
+    if table not in connection.introspection.table_names():
+        return
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            quoted = connection.ops.quote_name(table)
+            cursor.execute(
+                f"ALTER TABLE {quoted} ADD COLUMN IF NOT EXISTS {SEARCH_COLUMN} "
+                f"tsvector GENERATED ALWAYS AS (to_tsvector("
+                f"'{search_config()}'::regconfig, coalesce(content, ''))) STORED"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_search_idx "
+                f"ON {quoted} USING gin ({SEARCH_COLUMN})"
+            )
+        elif connection.vendor == "sqlite":
+            fts = fts_table()
+            created = fts not in connection.introspection.table_names()
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                f"content, content='{table}', content_rowid='rowid', "
+                f"tokenize='porter unicode61')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} "
+                f"BEGIN INSERT INTO {fts}(rowid, content) "
+                f"VALUES (new.rowid, new.content); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} "
+                f"BEGIN INSERT INTO {fts}({fts}, rowid, content) "
+                f"VALUES ('delete', old.rowid, old.content); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF content "
+                f"ON {table} BEGIN INSERT INTO {fts}({fts}, rowid, content) "
+                f"VALUES ('delete', old.rowid, old.content); "
+                f"INSERT INTO {fts}(rowid, content) VALUES (new.rowid, new.content); "
+                f"END"
+            )
+            if created:
+                # Index rows written before the search table existed
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def fts5_query(query):
+    """
+    Quote every term so user input can never be parsed as FTS5 syntax.
+    """
+    return " ".join('"%s"' % term.replace('"', '""') for term in query.split())
+
+
+def search_messages(queryset, query):
+    """
+    Restrict ``queryset`` to messages matching ``query``, annotated with
+    ``rank`` (higher is better) and ``highlight`` (raw, see
+    ``render_highlight``), best matches first.
+    """
+    vendor = connections[queryset.db].vendor
+    table = Message._meta.db_table
+
+    if vendor == "postgresql":
+        tsquery = "websearch_to_tsquery(%s::regconfig, %s)"
+        params = (search_config(), query)
+        queryset = queryset.filter(
+            RawSQL(
+                f"{table}.{SEARCH_COLUMN} @@ {tsquery}",
+                params,
+                output_field=BooleanField(),
+            )
+        ).annotate(
+            rank=RawSQL(
+                f"ts_rank_cd({table}.{SEARCH_COLUMN}, {tsquery})",
+                params,
+                output_field=FloatField(),
+            ),
+            highlight=RawSQL(
+                f"ts_headline(%s::regconfig, {table}.content, {tsquery}, %s)",
+                (
+                    search_config(),
+                    *params,
+                    f'StartSel="{MATCH_START}", StopSel="{MATCH_STOP}"',
+                ),
+                output_field=TextField(),
+            ),
+        )
+    elif vendor == "sqlite":
+        fts = fts_table()
+        match = (fts5_query(query),)
+        matched = f"FROM {fts} WHERE {fts} MATCH %s AND {fts}.rowid = {table}.rowid"
+        queryset = queryset.filter(
+            RawSQL(
+                f"{table}.rowid IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)",
+                match,
+                output_field=BooleanField(),
+            )
+        ).annotate(
+            # bm25() is lower-is-better
+            rank=RawSQL(f"(SELECT -bm25({fts}) {matched})", match, FloatField()),
+            highlight=RawSQL(
+                f"(SELECT highlight({fts}, 0, %s, %s) {matched})",
+                (MATCH_START, MATCH_STOP, *match),
+                output_field=TextField(),
+            ),
+        )
+    else:
+        queryset = queryset.filter(content__icontains=query).annotate(
+            rank=Value(0.0, output_field=FloatField()),
+            highlight=F("content"),
+        )
+    return queryset.order_by("-rank", "-created_at", "-id")
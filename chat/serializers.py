@@ -1,8 +1,87 @@
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.validators import UniqueTogetherValidator
 from .models import Thread, Message, ThreadParticipant
+from .search import render_highlight
 
 
-class ThreadSerializer(serializers.ModelSerializer):
+def format_datetime(value, tz=None):
+    """
+    ISO 8601 the way DRF's ``DateTimeField`` renders it, without the field.
+
+    Resolving the current timezone is comparatively expensive, so callers
+    formatting many values should look it up once and pass it as ``tz``.
+    """
+    if value is None:
+        return None
+    value = value.astimezone(tz or timezone.get_current_timezone()).isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+class RowSerializer:
+    """
+    Lean read path for hot list endpoints.
+
+    Builds representations straight from ``values_list(..., named=True)``
+    rows, so no model instances or DRF field objects are created per row.
+    Subclasses list the lookups they need in ``fields`` and must produce the
+    same output as the ModelSerializer they stand in for.
+    """
+
+    fields = ()
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values_list(*cls.fields, named=True)
+
+    def to_representation(self, row):
+        raise NotImplementedError
+
+    @property
+    def data(self):
+        self.timezone = timezone.get_current_timezone()
+        to_representation = self.to_representation
+        return [to_representation(row) for row in self.rows]
+
+    def __iter__(self):
+        """
+        Representations one at a time, so streamed rows are never all held
+        in memory.
+        """
+        self.timezone = timezone.get_current_timezone()
+        for row in self.rows:
+            yield self.to_representation(row)
+
+
+class SparseFieldsMixin:
+    """
+    Lets a serializer render a subset of its fields (``fields=[...]``) and
+    load only the columns behind them (``select``).
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def field_names(cls):
+        return list(cls().fields)
+
+    @classmethod
+    def select(cls, queryset, fields, *extra):
+        declared = cls().fields
+        columns = {declared[name].source.split(".")[0] for name in fields}
+        return queryset.only(*columns, *extra)
+
+
+class ThreadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     thread_id = serializers.UUIDField(source="id")
 
     class Meta:
@@ -14,19 +93,36 @@ class ThreadSerializer(serializers.ModelSerializer):
             "title",
             "created_by",
             "created_at",
+            "last_message_at",
+            "last_message_preview",
+            "message_count",
+            "last_activity_at",
+        ]
+        read_only_fields = [
+            "last_message_at",
+            "last_message_preview",
+            "message_count",
+            "last_activity_at",
         ]
 
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = ["id", "thread", "user", "content", "created_by", "created_at"]
 
 
-class ThreadParticipantSerializer(serializers.ModelSerializer):
+class ThreadParticipantSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = ThreadParticipant
         fields = ["id", "thread", "user", "created_by", "created_at"]
+        # Removed (soft-deleted) memberships still hold the unique pair
+        validators = [
+            UniqueTogetherValidator(
+                queryset=ThreadParticipant.all_objects.all(),
+                fields=["thread", "user"],
+            )
+        ]
 
 
 class ThreadMessageSerializer(serializers.ModelSerializer):
@@ -39,18 +135,91 @@ class ThreadMessageSerializer(serializers.ModelSerializer):
         fields = ["message_id", "user_id", "user_name", "content", "created_at"]
 
 
+class ThreadMessageRowSerializer(RowSerializer):
+    """
+    Row-level equivalent of ``ThreadMessageSerializer``.
+    """
+
+    fields = ("id", "user_id", "user__name", "content", "created_at")
+
+    def to_representation(self, row):
+        return {
+            "message_id": str(row.id),
+            "user_id": str(row.user_id),
+            "user_name": row.user__name,
+            "content": row.content,
+            "created_at": format_datetime(row.created_at, self.timezone),
+        }
+
+
 class CreateMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = ["user", "content"]
 
 
+class BulkMessageSerializer(serializers.Serializer):
+    """
+    One item of a bulk message import into a known thread.
+
+    References are validated as plain UUIDs here; the view resolves all of
+    them with a single query per model.
+    """
+
+    user = serializers.UUIDField()
+    content = serializers.CharField()
+
+
+class BulkThreadMessageSerializer(BulkMessageSerializer):
+    thread = serializers.UUIDField()
+
+
 class CreateParticipantSerializer(serializers.ModelSerializer):
     class Meta:
         model = ThreadParticipant
         fields = ["user"]
 
 
+class BulkParticipantSerializer(serializers.Serializer):
+    """
+    Users to add to and remove from the thread in the URL.
+    """
+
+    add = serializers.ListField(
+        child=serializers.UUIDField(), required=False, default=list
+    )
+    remove = serializers.ListField(
+        child=serializers.UUIDField(), required=False, default=list
+    )
+
+    def validate(self, attrs):
+        if not attrs["add"] and not attrs["remove"]:
+            raise serializers.ValidationError("Provide 'add' and/or 'remove'.")
+        return attrs
+
+
+class BulkUserThreadsSerializer(BulkParticipantSerializer):
+    """
+    Threads to add the given user to and remove them from.
+    """
+
+    user = serializers.UUIDField()
+
+
+class EntitySerializer(serializers.Serializer):
+    entity_type = serializers.CharField(max_length=50)
+    entity_id = serializers.CharField(max_length=50)
+
+
+class EntityLookupSerializer(serializers.Serializer):
+    """
+    Entities to look threads up for, optionally with per-entity counts.
+    """
+
+    entities = serializers.ListField(child=EntitySerializer(), allow_empty=False)
+    counts = serializers.BooleanField(default=False)
+
+
 class ParticipantSerializer(serializers.ModelSerializer):
     user_id = serializers.UUIDField(source="user.id")
     user_name = serializers.CharField(source="user.name")
@@ -58,3 +227,103 @@ class ParticipantSerializer(serializers.ModelSerializer):
     class Meta:
         model = ThreadParticipant
         fields = ["user_id", "user_name"]
+
+
+class ParticipantRowSerializer(RowSerializer):
+    """
+    Row-level equivalent of ``ParticipantSerializer``.
+    """
+
+    fields = ("user_id", "user__name")
+
+    def to_representation(self, row):
+        return {"user_id": str(row.user_id), "user_name": row.user__name}
+
+
+class ReadCursorSerializer(serializers.Serializer):
+    """
+    Message to mark as read; defaults to the thread's latest message.
+    """
+
+    message_id = serializers.UUIDField(required=False)
+
+
+class InboxRowSerializer(RowSerializer):
+    fields = (
+        "thread_id",
+        "thread__title",
+        "thread__entity_type",
+        "thread__entity_id",
+        "thread__last_message_at",
+        "thread__last_message_preview",
+        "last_read_at",
+        "unread_count",
+    )
+
+    def to_representation(self, row):
+        return {
+            "thread_id": str(row.thread_id),
+            "title": row.thread__title,
+            "entity_type": row.thread__entity_type,
+            "entity_id": row.thread__entity_id,
+            "last_message_at": format_datetime(
+                row.thread__last_message_at, self.timezone
+            ),
+            "last_message_preview": row.thread__last_message_preview,
+            "last_read_at": format_datetime(row.last_read_at, self.timezone),
+            "unread_count": row.unread_count,
+        }
+
+
+class SearchResultRowSerializer(RowSerializer):
+    fields = (
+        "id",
+        "thread_id",
+        "user_id",
+        "user__name",
+        "content",
+        "created_at",
+        "rank",
+        "highlight",
+    )
+
+    def to_representation(self, row):
+        return {
+            "message_id": str(row.id),
+            "thread_id": str(row.thread_id),
+            "user_id": str(row.user_id),
+            "user_name": row.user__name,
+            "content": row.content,
+            "created_at": format_datetime(row.created_at, self.timezone),
+            "rank": row.rank,
+            "highlight": render_highlight(row.highlight),
+        }
+
+
+class ExportRowSerializer(RowSerializer):
+    """
+    One line of a thread history export.
+    """
+
+    fields = (
+        "id",
+        "thread_id",
+        "thread__entity_type",
+        "thread__entity_id",
+        "user_id",
+        "user__name",
+        "content",
+        "created_at",
+    )
+
+    def to_representation(self, row):
+        return {
+            "message_id": str(row.id),
+            "thread_id": str(row.thread_id),
+            "entity_type": row.thread__entity_type,
+            "entity_id": row.thread__entity_id,
+            "user_id": str(row.user_id),
+            "user_name": row.user__name,
+            "content": row.content,
+            "created_at": format_datetime(row.created_at, self.timezone),
+        }
@@ -0,0 +1,330 @@
+"""
+Cached tails of the busiest threads' history (``CHAT_TAIL_CACHE``).
+
+Opening a thread reads its latest page of messages, and a few very active
+threads get most of those reads. The tail cache keeps the last
+``CHAT_TAIL_CACHE_SIZE`` messages of recently read threads, already
+serialized, so the thread messages endpoint serves the opening page
+without its page query or serializer; only the conditional GET lookup of
+the thread's version remains.
+
+A tail is loaded on the first read of its thread and extended with every
+message published afterwards (``chat.broadcast.publish_messages``). It
+records the ``Thread.version`` it reflects and is only served while that
+matches the thread's current version, so edits, deletes, archival and
+writes by other processes never leave stale pages behind: they make the
+next read a miss. Edits and deletes drop the tail right away as well.
+"""
+
+import sys
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Message
+from .serializers import ThreadMessageRowSerializer
+
+
+class Tail:
+    """
+    The latest messages of a thread, oldest first, as ``{"id", "created_at",
+    "data"}`` dicts where ``data`` is the serialized message. ``complete``
+    when they are the thread's whole history. Never modified once built,
+    so readers need no lock.
+    """
+
+    def __init__(self, version, messages, complete):
+        self.version = version
+        self.messages = messages
+        self.complete = complete
+
+    def extended(self, messages, size):
+        """
+        A tail one version on, holding ``messages`` as well.
+        """
+        merged = sorted(
+            self.messages + messages,
+            key=lambda message: (message["created_at"], message["id"]),
+        )
+        return Tail(
+            self.version + 1, merged[-size:], self.complete and len(merged) <= size
+        )
+
+    def size_in_bytes(self):
+        # Rough: the text plus a fixed allowance for dicts, UUIDs and dates
+        return sys.getsizeof(self) + sum(
+            512 + len(message["data"]["content"]) + len(message["data"]["user_name"])
+            for message in self.messages
+        )
+
+
+class BaseTailCache:
+    """
+    Storage of ``Tail`` objects by thread id; counts hits, misses and
+    evictions.
+    """
+
+    def __init__(self):
+        self.size = getattr(settings, "CHAT_TAIL_CACHE_SIZE", 50)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, thread_id):
+        return str(uuid.UUID(str(thread_id)))
+
+    def get(self, thread_id, version):
+        """
+        The tail of the thread, if one of ``version`` is cached.
+        """
+        tail = self.load(self.key(thread_id))
+        hit = tail is not None and tail.version == version
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return tail if hit else None
+
+    def set(self, thread_id, tail):
+        self.store(self.key(thread_id), tail)
+
+    def append(self, thread_id, messages):
+        """
+        Extend the thread's tail, if cached, with newly committed messages.
+        """
+        key = self.key(thread_id)
+        tail = self.load(key)
+        if tail is None:
+            return
+        tail = self.extended(tail, messages)
+        if tail is None:
+            self.delete(thread_id)
+        else:
+            self.store(key, tail)
+
+    def extended(self, tail, messages):
+        """
+        ``tail`` one version on with ``messages``, or ``None`` if it has to go.
+        """
+        known = {message["id"] for message in tail.messages}
+        if any(message["id"] in known for message in messages):
+            # Loaded after the messages committed, so its version may already
+            # count them; one more would claim a write it has not seen
+            return None
+        return tail.extended(messages, self.size)
+
+    def delete(self, thread_id):
+        raise NotImplementedError
+
+    def load(self, key):
+        raise NotImplementedError
+
+    def store(self, key, tail):
+        raise NotImplementedError
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class LocalTailCache(BaseTailCache):
+    """
+    Per-process LRU of tails, bounded by ``CHAT_TAIL_CACHE_MAX_BYTES``.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.max_bytes = getattr(settings, "CHAT_TAIL_CACHE_MAX_BYTES", 32 << 20)
+        self.bytes = 0
+        self._data = OrderedDict()
+
+    def append(self, thread_id, messages):
+        # Load, extend and store under one hold of the lock, so concurrent
+        # appends to a thread cannot drop each other's messages
+        key = self.key(thread_id)
+        with self.lock:
+            tail = self._load(key)
+            if tail is None:
+                return
+            tail = self.extended(tail, messages)
+            if tail is None:
+                self._delete(key)
+            else:
+                self._store(key, tail, tail.size_in_bytes())
+
+    def load(self, key):
+        with self.lock:
+            return self._load(key)
+
+    def store(self, key, tail):
+        size = tail.size_in_bytes()
+        with self.lock:
+            self._store(key, tail, size)
+
+    def delete(self, thread_id):
+        with self.lock:
+            self._delete(self.key(thread_id))
+
+    def _load(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def _store(self, key, tail, size):
+        self._delete(key)
+        if size > self.max_bytes:
+            return
+        self._data[key] = (tail, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self._data.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def _delete(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def stats(self):
+        stats = super().stats()
+        with self.lock:
+            stats["entries"] = len(self._data)
+            stats["bytes"] = self.bytes
+        return stats
+
+
+class SharedTailCache(BaseTailCache):
+    """
+    Tails kept in the Django cache ``CHAT_TAIL_CACHE_ALIAS`` for
+    ``CHAT_TAIL_CACHE_TIMEOUT`` seconds, shared by all processes. Memory and
+    eviction are up to the cache server; evictions are not counted.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.cache = caches[getattr(settings, "CHAT_TAIL_CACHE_ALIAS", "default")]
+        self.timeout = getattr(settings, "CHAT_TAIL_CACHE_TIMEOUT", 300)
+
+    def load(self, key):
+        return self.cache.get(f"chat:tail:{key}")
+
+    def store(self, key, tail):
+        # Concurrent appends may overwrite each other; the version check
+        # turns the loser into a miss
+        self.cache.set(f"chat:tail:{key}", tail, self.timeout)
+
+    def delete(self, thread_id):
+        self.cache.delete(f"chat:tail:{self.key(thread_id)}")
+
+
+_tail_cache = None
+
+
+def get_tail_cache():
+    """
+    The configured tail cache, or ``None`` while ``CHAT_TAIL_CACHE`` is off.
+    """
+    global _tail_cache
+    if not getattr(settings, "CHAT_TAIL_CACHE", False):
+        return None
+    if _tail_cache is None:
+        backend = getattr(
+            settings, "CHAT_TAIL_CACHE_BACKEND", "chat.tail_cache.LocalTailCache"
+        )
+        _tail_cache = import_string(backend)()
+    return _tail_cache
+
+
+@receiver(setting_changed)
+def reset_tail_cache(*, setting, **kwargs):
+    global _tail_cache
+    if setting.startswith("CHAT_TAIL_CACHE"):
+        _tail_cache = None
+
+
+def tail_ordering(position_field):
+    if position_field == "id":
+        return ("-id",)
+    return (f"-{position_field}", "-id")
+
+
+def build_tail(thread, version, size, rows):
+    # ``rows`` are the latest ``size + 1`` messages, newest first
+    data = ThreadMessageRowSerializer(rows[:size]).data
+    messages = [
+        {"id": row.id, "created_at": row.created_at, "data": item}
+        for row, item in zip(rows[:size], data)
+    ]
+    complete = len(rows) <= size and thread.archived_until is None
+    return Tail(version, messages[::-1], complete)
+
+
+def tail_rows(thread, size, position_field):
+    # ``version`` may come from a lagging replica; a tail read from the
+    # primary holds at least what that version promises
+    queryset = Message.objects.using(DEFAULT_DB_ALIAS).filter(thread=thread)
+    return ThreadMessageRowSerializer.values(queryset).order_by(
+        *tail_ordering(position_field)
+    )[: size + 1]
+
+
+def load_tail(thread, version, size, position_field="created_at"):
+    """
+    The tail of ``thread`` at ``version``: its latest ``size`` messages by
+    ``position_field`` (the pagination's ordering).
+    """
+    rows = list(tail_rows(thread, size, position_field))
+    return build_tail(thread, version, size, rows)
+
+
+async def aload_tail(thread, version, size, position_field="created_at"):
+    rows = [row async for row in tail_rows(thread, size, position_field)]
+    return build_tail(thread, version, size, rows)
+
+
+def extend_tails(messages, payloads):
+    """
+    Add committed messages, serialized as ``payloads``, to their threads'
+    cached tails. Called once per ``Thread.record_messages``, which moves
+    each thread one version on.
+    """
+    tail_cache = get_tail_cache()
+    if tail_cache is None:
+        return
+    by_thread = defaultdict(list)
+    for message, payload in zip(messages, payloads):
+        by_thread[message.thread_id].append(
+            {"id": message.id, "created_at": message.created_at, "data": payload}
+        )
+    for thread_id, items in by_thread.items():
+        tail_cache.append(thread_id, items)
+
+
+def drop_tail(sender, instance, created=False, **kwargs):
+    """
+    ``post_save``/``post_delete`` receiver dropping the tail of a thread
+    whose messages were edited or deleted.
+    """
+    tail_cache = get_tail_cache()
+    if tail_cache is None or created:
+        return
+    # A message moved to another thread leaves its old thread too
+    thread_ids = {instance.thread_id, getattr(instance, "_loaded_thread_id", None)}
+    for thread_id in thread_ids - {None}:
+        tail_cache.delete(thread_id)
@@ -1,7 +1,57 @@
-from rest_framework.test import APITestCase, APIClient
+import base64
+import gzip
+import json
+import os
+import tempfile
+import threading
+
+from unittest import skipUnless
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    APITestCase,
+    force_authenticate,
+)
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import Thread, Message, CustomUser, ThreadParticipant
+from django.utils import timezone
+
+from chat_system.asgi import application
+from chat_system.db_routers import PrimaryReplicaRouter, ReplicaRoutingMiddleware
+from chat_system.ids import uuid7, uuid7_from_datetime
+from chat_system.instrumentation import collect_pool_metrics
+from chat_system.renderers import msgpack
+from . import async_views
+from .broadcast import get_broadcast, thread_channel
+from .ingest import MessageBatcher
+from .membership import get_membership_index
+from .tail_cache import LocalTailCache, Tail, get_tail_cache
+from .models import (
+    ArchivedMessage,
+    Thread,
+    Message,
+    CustomUser,
+    ThreadParticipant,
+)
+from .serializers import (
+    ParticipantRowSerializer,
+    ParticipantSerializer,
+    ThreadMessageRowSerializer,
+    ThreadMessageSerializer,
+)
+from datetime import timedelta
+from io import StringIO
 from uuid import uuid4
 
 
@@ -47,8 +97,96 @@ class ChatAPITestCase(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["content"], "Hello, World!")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["content"], "Hello, World!")
+        self.assertIsNone(response.data["next"])
+        self.assertIsNone(response.data["previous"])
+
+    def test_thread_messages_cursor_pagination(self):
+        for i in range(4):
+            Message.objects.create(
+                thread=self.thread, user=self.user2, content=f"Reply {i}"
+            )
+        url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+
+        # Opens on the latest page, oldest first within the page
+        response = self.client.get(url, {"limit": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        contents = [m["content"] for m in response.data["results"]]
+        self.assertEqual(contents, ["Reply 2", "Reply 3"])
+        self.assertIsNone(response.data["next"])
+
+        # Scroll back until the history is exhausted
+        seen = contents
+        previous = response.data["previous"]
+        while previous:
+            response = self.client.get(previous)
+            seen = [m["content"] for m in response.data["results"]] + seen
+            previous = response.data["previous"]
+        self.assertEqual(
+            seen, ["Hello, World!", "Reply 0", "Reply 1", "Reply 2", "Reply 3"]
+        )
+
+        # And forward again from the oldest page
+        response = self.client.get(response.data["next"])
+        contents = [m["content"] for m in response.data["results"]]
+        self.assertEqual(contents, ["Reply 0", "Reply 1"])
+
+    def test_thread_messages_invalid_cursor(self):
+        url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+        response = self.client.get(url, {"before": "not-a-cursor"})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_of_another_field_type(self):
+        def cursor(value):
+            payload = json.dumps([value, str(uuid4())]).encode()
+            return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+        thread_messages = reverse(
+            "thread-messages", kwargs={"thread_id": self.thread.id}
+        )
+        by_count = {
+            "ordering": "message_count",
+            "after": cursor(timezone.now().isoformat()),
+        }
+        for url, params in (
+            (thread_messages, {"before": cursor(5)}),
+            (reverse("message-list"), {"after": cursor(5)}),
+            (reverse("thread-list"), by_count),
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_thread_messages_single_query_for_all_authors(self):
+        for user in (self.user1, self.user2, self.user1):
+            Message.objects.create(thread=self.thread, user=user, content="Hi")
+        url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+
+        # The user's threads for the membership check (cached from then on),
+        # conditional GET validators, the thread, one joined query for the page
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 4)
+
+    def test_row_serializers_match_model_serializers(self):
+        ThreadParticipant.objects.create(thread=self.thread, user=self.user2)
+        messages = Message.objects.filter(thread=self.thread)
+        participants = ThreadParticipant.objects.filter(thread=self.thread)
+
+        self.assertEqual(
+            ThreadMessageRowSerializer(
+                ThreadMessageRowSerializer.values(messages)
+            ).data,
+            ThreadMessageSerializer(messages, many=True).data,
+        )
+        self.assertEqual(
+            ParticipantRowSerializer(
+                ParticipantRowSerializer.values(participants.order_by("created_at"))
+            ).data,
+            ParticipantSerializer(participants.order_by("created_at"), many=True).data,
+        )
 
     def test_post_thread_message(self):
         url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
@@ -58,6 +196,57 @@ class ChatAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data["content"], "New Message")
 
+    def test_bulk_create_thread_messages(self):
+        url = reverse(
+            "thread-messages-bulk-create", kwargs={"thread_id": self.thread.id}
+        )
+        data = {
+            "messages": [
+                {"user": str(self.user1.id), "content": "First"},
+                {"user": str(uuid4()), "content": "Unknown user"},
+                {"user": str(self.user2.id)},
+                {"user": str(self.user2.id), "content": "Second"},
+            ]
+        }
+        # Membership, thread, users, then one INSERT and one summary UPDATE in
+        # a savepoint
+        with self.assertNumQueries(7):
+            response = self.client.post(url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data["created"], 2)
+        statuses = [result["status"] for result in response.data["results"]]
+        self.assertEqual(statuses, [201, 400, 400, 201])
+        self.assertIn("user", response.data["results"][1]["errors"])
+        self.assertIn("content", response.data["results"][2]["errors"])
+        self.assertEqual(Message.objects.filter(thread=self.thread).count(), 3)
+
+    def test_bulk_create_messages_across_threads(self):
+        other = Thread.objects.create(
+            entity_type="ORDER", entity_id="2", title="Other Thread"
+        )
+        ThreadParticipant.objects.create(thread=other, user=self.user1)
+        url = reverse("message-bulk-create")
+        targets = [(self.thread.id, "A"), (other.id, "B"), (uuid4(), "C")]
+        data = {
+            "messages": [
+                {"thread": str(thread), "user": str(self.user1.id), "content": c}
+                for thread, c in targets
+            ]
+        }
+        response = self.client.post(url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data["results"][1]["thread_id"], str(other.id))
+        self.assertIn("thread", response.data["results"][2]["errors"])
+        self.assertTrue(Message.objects.filter(thread=other, content="B").exists())
+
+    def test_bulk_create_requires_message_list(self):
+        url = reverse("message-bulk-create")
+        response = self.client.post(url, {"messages": []}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_get_thread_participants(self):
         url = reverse("thread-participants", kwargs={"thread_id": self.thread.id})
         response = self.client.get(url)
@@ -82,6 +271,57 @@ class ChatAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["user_id"], str(self.user1.id))
 
+    def test_bulk_add_and_remove_thread_participants(self):
+        url = reverse("thread-participants-bulk", kwargs={"thread_id": self.thread.id})
+        data = {"add": [str(self.user1.id), str(self.user2.id)]}
+        response = self.client.post(url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["added"], [str(self.user2.id)])
+        self.assertEqual(
+            ThreadParticipant.objects.filter(thread=self.thread).count(), 2
+        )
+
+        data = {"remove": [str(self.user1.id)]}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.data["removed"], 1)
+        self.assertEqual(
+            list(ThreadParticipant.objects.values_list("user_id", flat=True)),
+            [self.user2.id],
+        )
+
+    def test_bulk_add_rejects_unknown_users(self):
+        url = reverse("thread-participants-bulk", kwargs={"thread_id": self.thread.id})
+        response = self.client.post(url, {"add": [str(uuid4())]}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_add_user_to_many_threads(self):
+        threads = [
+            Thread.objects.create(entity_type="SUPPLIER", entity_id=str(i), title="T")
+            for i in range(3)
+        ]
+        for thread in threads:
+            ThreadParticipant.objects.create(thread=thread, user=self.user1)
+        # A soft-deleted membership is revived rather than duplicated
+        ThreadParticipant.objects.create(
+            thread=threads[0], user=self.user2, is_deleted=True
+        )
+        url = reverse("participant-bulk")
+        data = {"user": str(self.user2.id), "add": [str(t.id) for t in threads]}
+        response = self.client.post(url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["added"]), 3)
+        self.assertEqual(
+            ThreadParticipant.objects.filter(user=self.user2, is_deleted=False).count(),
+            3,
+        )
+
+    def test_participant_uniqueness_is_enforced(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ThreadParticipant.objects.create(thread=self.thread, user=self.user1)
+
     def test_get_nonexistent_thread_messages(self):
         url = reverse("thread-messages", kwargs={"thread_id": uuid4()})
         response = self.client.get(url)
@@ -109,3 +349,1722 @@ class ChatAPITestCase(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RendererTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="1", title="Ünïcode\u2028title"
+        )
+        Message.objects.create(thread=self.thread, user=self.user, content="Hi")
+
+    def test_json_matches_drf_renderer(self):
+        response = self.client.get(reverse("message-list"))
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+        response = self.client.get(reverse("thread-list"))
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_malformed_json_is_rejected(self):
+        response = self.client.post(
+            reverse("thread-list"), "{not json", content_type="application/json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @skipUnless(msgpack, "msgpack is not installed")
+    def test_msgpack_on_request(self):
+        response = self.client.get(
+            reverse("message-list"), HTTP_ACCEPT="application/msgpack"
+        )
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        results = msgpack.unpackb(response.content)["results"]
+        self.assertEqual(results[0]["content"], "Hi")
+        self.assertEqual(results[0]["thread"], str(self.thread.id))
+
+
+class GlobalListTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.other = CustomUser.objects.create_user(
+            email="user2@example.com", password="password2", name="User Two"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="1", title="Order", created_by=self.user
+        )
+        self.supplier = Thread.objects.create(
+            entity_type="SUPPLIER", entity_id="1", title="Supplier"
+        )
+        for index in range(5):
+            Message.objects.create(
+                thread=self.thread,
+                user=self.user if index % 2 else self.other,
+                content=f"Message {index}",
+            )
+        Message.objects.create(thread=self.supplier, user=self.user, content="Other")
+        ThreadParticipant.objects.create(thread=self.thread, user=self.user)
+        ThreadParticipant.objects.create(thread=self.supplier, user=self.other)
+
+    def test_messages_are_paginated_newest_first(self):
+        url = reverse("message-list")
+        response = self.client.get(url, {"thread_id": self.thread.id, "limit": 2})
+        self.assertEqual(
+            [m["content"] for m in response.data["results"]],
+            ["Message 4", "Message 3"],
+        )
+        self.assertIsNone(response.data["previous"])
+
+        contents = []
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            contents += [m["content"] for m in response.data["results"]]
+        self.assertEqual(contents, ["Message 2", "Message 1", "Message 0"])
+
+    def test_filters(self):
+        url = reverse("message-list")
+        response = self.client.get(url, {"user_id": self.other.id})
+        self.assertEqual(len(response.data["results"]), 3)
+
+        first = Message.objects.filter(content="Message 1").get()
+        response = self.client.get(
+            url,
+            {
+                "thread_id": self.thread.id,
+                "created_after": first.created_at.isoformat(),
+            },
+        )
+        self.assertEqual(len(response.data["results"]), 4)
+
+        response = self.client.get(url, {"user_id": "not-a-uuid"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(
+            reverse("participant-list"), {"user_id": self.user.id}
+        )
+        self.assertEqual(
+            [p["thread"] for p in response.data["results"]], [self.thread.id]
+        )
+        # Only participants of the user's own threads are listed
+        response = self.client.get(
+            reverse("participant-list"), {"user_id": self.other.id}
+        )
+        self.assertEqual(response.data["results"], [])
+
+        response = self.client.get(
+            reverse("thread-list"),
+            {"entity_type": "ORDER", "created_by": self.user.id},
+        )
+        self.assertEqual([t["title"] for t in response.data["results"]], ["Order"])
+
+    def test_sparse_fieldsets(self):
+        url = reverse("message-list")
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {"fields": "id,content", "limit": 1})
+        self.assertEqual(list(response.data["results"][0]), ["id", "content"])
+
+        response = self.client.get(url, {"fields": "id,password"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(reverse("thread-list"), {"fields": "thread_id"})
+        self.assertEqual(
+            [list(thread) for thread in response.data["results"]], [["thread_id"]]
+        )
+
+
+class ThreadActivityTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="1", title="Busy Thread"
+        )
+        ThreadParticipant.objects.create(thread=self.thread, user=self.user)
+        self.quiet = Thread.objects.create(
+            entity_type="ORDER", entity_id="2", title="Quiet Thread"
+        )
+        ThreadParticipant.objects.create(thread=self.quiet, user=self.user)
+
+    def test_summary_follows_message_create_and_delete(self):
+        first = Message.objects.create(thread=self.thread, user=self.user, content="1")
+        last = Message.objects.create(thread=self.thread, user=self.user, content="2")
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.message_count, 2)
+        self.assertEqual(self.thread.last_message_at, last.created_at)
+        self.assertEqual(self.thread.last_message_preview, "2")
+
+        url = reverse("message-detail", kwargs={"pk": last.id})
+        self.client.delete(url)
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.message_count, 1)
+        self.assertEqual(self.thread.last_message_at, first.created_at)
+        self.assertEqual(self.thread.last_message_preview, "1")
+
+    def test_edits_adjust_summary_without_recount(self):
+        first = Message.objects.create(thread=self.thread, user=self.user, content="1")
+        last = Message.objects.create(thread=self.thread, user=self.user, content="2")
+        first = Message.objects.get(pk=first.pk)
+        last = Message.objects.get(pk=last.pk)
+
+        def summary(thread):
+            thread.refresh_from_db()
+            return thread.message_count, thread.last_message_preview
+
+        with CaptureQueriesContext(connection) as queries:
+            last.content = "2, edited"
+            last.save()
+        self.assertFalse(any("COUNT(" in q["sql"] for q in queries.captured_queries))
+        self.assertEqual(summary(self.thread), (2, "2, edited"))
+
+        first.content = "1, edited"
+        first.save()
+        self.assertEqual(summary(self.thread), (2, "2, edited"))
+
+        last.is_deleted = True
+        last.save()
+        self.assertEqual(summary(self.thread), (1, "1, edited"))
+        last.is_deleted = False
+        last.save()
+        self.assertEqual(summary(self.thread), (2, "2, edited"))
+
+        first.thread = self.quiet
+        first.save()
+        self.assertEqual(summary(self.thread), (1, "2, edited"))
+        self.assertEqual(summary(self.quiet), (1, "1, edited"))
+
+    def test_bulk_create_updates_summary(self):
+        url = reverse(
+            "thread-messages-bulk-create", kwargs={"thread_id": self.thread.id}
+        )
+        messages = [{"user": str(self.user.id), "content": f"#{i}"} for i in range(3)]
+        self.client.post(url, {"messages": messages}, format="json")
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.message_count, 3)
+        self.assertTrue(self.thread.last_message_preview.startswith("#"))
+
+    def test_rebuild_command_repairs_drift(self):
+        Message.objects.create(thread=self.thread, user=self.user, content="Hi")
+        Thread.objects.update(message_count=42, last_message_preview="stale")
+        self.thread.refresh_from_db()
+        version = self.thread.version
+
+        call_command("rebuild_thread_activity", batch_size=1, stdout=StringIO())
+        self.thread.refresh_from_db()
+        self.quiet.refresh_from_db()
+        # Conditional GETs see the repaired summary
+        self.assertGreater(self.thread.version, version)
+        self.assertEqual(self.thread.message_count, 1)
+        self.assertEqual(self.thread.last_message_preview, "Hi")
+        self.assertEqual(self.quiet.message_count, 0)
+        self.assertIsNone(self.quiet.last_message_at)
+
+    def test_list_threads_by_activity(self):
+        Message.objects.create(thread=self.quiet, user=self.user, content="Ping")
+        url = reverse("thread-list")
+
+        response = self.client.get(url, {"ordering": "-last_activity_at"})
+        self.assertEqual(
+            [t["title"] for t in response.data["results"]],
+            ["Quiet Thread", "Busy Thread"],
+        )
+        response = self.client.get(url, {"has_messages": "true"})
+        self.assertEqual([t["message_count"] for t in response.data["results"]], [1])
+
+        # Integer orderings page with cursors as well
+        response = self.client.get(url, {"ordering": "-message_count", "limit": 1})
+        self.assertEqual(response.data["results"][0]["title"], "Quiet Thread")
+        response = self.client.get(response.data["next"])
+        self.assertEqual(
+            [t["title"] for t in response.data["results"]], ["Busy Thread"]
+        )
+
+        response = self.client.get(url, {"ordering": "title"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(CHAT_MESSAGE_RETENTION_DAYS={"ORDER": 30})
+class ArchiveMessagesTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="1", title="Old Order"
+        )
+        self.supplier = Thread.objects.create(
+            entity_type="SUPPLIER", entity_id="1", title="Old Supplier"
+        )
+        ThreadParticipant.objects.create(thread=self.thread, user=self.user)
+        old = timezone.now() - timedelta(days=90)
+        for index in range(4):
+            message = Message.objects.create(
+                thread=self.thread, user=self.user, content=f"Message {index}"
+            )
+            if index < 3:
+                # Backdate the first three past the retention period
+                Message.objects.filter(pk=message.pk).update(
+                    created_at=old + timedelta(minutes=index)
+                )
+        Message.objects.create(thread=self.supplier, user=self.user, content="Kept")
+        Message.objects.filter(thread=self.supplier).update(created_at=old)
+
+    def archive(self, *args):
+        call_command("archive_messages", "--batch-size", "2", *args, stdout=StringIO())
+
+    def test_moves_expired_messages_only(self):
+        self.thread.refresh_from_db()
+        version = self.thread.version
+        self.archive()
+
+        self.assertEqual(Message.objects.filter(thread=self.thread).count(), 1)
+        self.assertEqual(ArchivedMessage.objects.filter(thread=self.thread).count(), 3)
+        self.assertEqual(Message.objects.filter(thread=self.supplier).count(), 1)
+
+        # Archiving moves history, it does not change the thread summary
+        self.thread.refresh_from_db()
+        self.assertIsNotNone(self.thread.archived_until)
+        self.assertGreater(self.thread.version, version)
+        self.assertEqual(self.thread.message_count, 4)
+        Thread.objects.filter(pk=self.thread.pk).rebuild_activity()
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.message_count, 4)
+        self.assertEqual(self.thread.last_message_preview, "Message 3")
+
+    def test_history_continues_into_archive(self):
+        self.archive()
+        url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+
+        contents = []
+        response = self.client.get(url, {"limit": 2})
+        while True:
+            contents = [m["content"] for m in response.data["results"]] + contents
+            if not response.data["previous"]:
+                break
+            response = self.client.get(response.data["previous"])
+        self.assertEqual(contents, [f"Message {index}" for index in range(4)])
+
+    def test_unconfigured_entity_type_is_rejected(self):
+        with self.assertRaises(CommandError):
+            self.archive("--entity-type", "SUPPLIER")
+
+
+class UUIDv7TestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="1", title="Order"
+        )
+        ThreadParticipant.objects.create(thread=self.thread, user=self.user)
+
+    def test_ids_are_time_ordered(self):
+        ids = [uuid7() for _ in range(5000)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual({value.version for value in ids}, {7})
+
+        now = timezone.now()
+        stamps = [now + timedelta(microseconds=step) for step in (0, 1, 250, 1000)]
+        ids = [uuid7_from_datetime(stamp) for stamp in stamps]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(
+            uuid7_from_datetime(now).int >> 80,
+            int(now.timestamp() * 1000),
+        )
+
+    def test_new_rows_get_uuid7_keys(self):
+        message = Message.objects.create(
+            thread=self.thread, user=self.user, content="Hi"
+        )
+        self.assertEqual(self.thread.id.version, 7)
+        self.assertEqual(message.id.version, 7)
+        self.assertEqual(self.user.id.version, 7)
+
+    def test_backfill_rewrites_old_message_ids(self):
+        old = timezone.now() - timedelta(days=1)
+        for index in range(5):
+            Message.objects.create(
+                id=uuid4(),
+                thread=self.thread,
+                user=self.user,
+                content=f"Message {index}",
+            )
+            Message.objects.filter(content=f"Message {index}").update(
+                created_at=old + timedelta(minutes=index)
+            )
+        kept = Message.objects.create(thread=self.thread, user=self.user, content="New")
+        self.thread.refresh_from_db()
+        version = self.thread.version
+
+        call_command("backfill_uuid7", "--batch-size", "2", stdout=StringIO())
+        self.thread.refresh_from_db()
+        self.assertGreater(self.thread.version, version)
+
+        messages = list(Message.objects.order_by("id"))
+        self.assertEqual({message.id.version for message in messages}, {7})
+        self.assertEqual(
+            [message.content for message in messages],
+            [f"Message {index}" for index in range(5)] + ["New"],
+        )
+        self.assertEqual(messages[-1].id, kept.id)
+
+    @override_settings(CHAT_MESSAGES_ORDER_BY_ID=True)
+    def test_history_paged_by_id(self):
+        for index in range(5):
+            Message.objects.create(
+                thread=self.thread, user=self.user, content=f"Message {index}"
+            )
+        # created_at no longer matters for the order
+        Message.objects.filter(content="Message 0").update(created_at=timezone.now())
+        url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+
+        contents = []
+        response = self.client.get(url, {"limit": 2})
+        while True:
+            contents = [m["content"] for m in response.data["results"]] + contents
+            if not response.data["previous"]:
+                break
+            response = self.client.get(response.data["previous"])
+        self.assertEqual(contents, [f"Message {index}" for index in range(5)])
+
+        response = self.client.get(response.data["next"])
+        contents = [m["content"] for m in response.data["results"]]
+        self.assertEqual(contents, ["Message 1", "Message 2"])
+
+        # A (created_at, id) cursor is rejected, not misread
+        with override_settings(CHAT_MESSAGES_ORDER_BY_ID=False):
+            cursor = self.client.get(url, {"limit": 2}).data["previous"]
+        response = self.client.get(cursor)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class MessageExportTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.supplier = Thread.objects.create(
+            entity_type="SUPPLIER", entity_id="7", title="Supplier"
+        )
+        self.payment = Thread.objects.create(
+            entity_type="PAYMENT", entity_id="7", title="Payment"
+        )
+        for index in range(3):
+            Message.objects.create(
+                thread=self.supplier, user=self.user, content=f"Supplier {index}"
+            )
+        Message.objects.create(thread=self.payment, user=self.user, content="Paid")
+        for thread in (self.supplier, self.payment):
+            ThreadParticipant.objects.create(thread=thread, user=self.user)
+
+    def export(self, params, **headers):
+        response = self.client.get(reverse("message-export"), params, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def test_streams_ndjson_per_entity_type(self):
+        response, body = self.export({"entity_type": "SUPPLIER"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(
+            [line["content"] for line in lines], [f"Supplier {i}" for i in range(3)]
+        )
+        self.assertEqual(lines[0]["entity_type"], "SUPPLIER")
+        self.assertEqual(lines[0]["thread_id"], str(self.supplier.id))
+
+    def test_time_range(self):
+        messages = list(
+            Message.objects.filter(thread=self.supplier).order_by("created_at")
+        )
+        _, body = self.export(
+            {
+                "thread_id": self.supplier.id,
+                "since": messages[1].created_at.isoformat(),
+                "until": messages[2].created_at.isoformat(),
+            }
+        )
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([line["content"] for line in lines], ["Supplier 1"])
+
+    def test_gzip_when_accepted(self):
+        response, body = self.export(
+            {"thread_id": self.payment.id}, HTTP_ACCEPT_ENCODING="gzip, br"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(json.loads(gzip.decompress(body))["content"], "Paid")
+
+        for accept_encoding in ("gzip;q=0, br", "br, *;q=0", "identity", "gzipped"):
+            response, body = self.export(
+                {"thread_id": self.payment.id}, HTTP_ACCEPT_ENCODING=accept_encoding
+            )
+            self.assertFalse(response.has_header("Content-Encoding"), accept_encoding)
+            self.assertEqual(json.loads(body)["content"], "Paid")
+        response, _ = self.export(
+            {"thread_id": self.payment.id}, HTTP_ACCEPT_ENCODING="br;q=1, *;q=0.5"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_requires_a_thread_or_entity_type(self):
+        response = self.client.get(reverse("message-export"))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("message-export"), {"thread_id": uuid4()})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_only_the_users_threads(self):
+        other = CustomUser.objects.create_user(
+            email="user2@example.com", password="password2", name="User Two"
+        )
+        self.client.force_authenticate(user=other)
+        response = self.client.get(
+            reverse("message-export"), {"thread_id": self.supplier.id}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        _, body = self.export({"entity_type": "SUPPLIER"})
+        self.assertEqual(body, b"")
+
+    def test_command_writes_gzip_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "export.ndjson.gz")
+            call_command(
+                "export_messages", "--entity-type", "PAYMENT", "--gzip", "-o", path
+            )
+            with gzip.open(path) as export:
+                lines = export.read().splitlines()
+        self.assertEqual([json.loads(line)["content"] for line in lines], ["Paid"])
+
+
+class BenchmarkCommandsTestCase(APITestCase):
+
+    def test_seed_and_bench(self):
+        call_command(
+            "seed_chat_data",
+            "--users=8",
+            "--threads=10",
+            "--messages=200",
+            "--participants=3",
+            stdout=StringIO(),
+        )
+        self.assertEqual(Message.objects.count(), 200)
+        self.assertEqual(
+            set(Thread.objects.values_list("entity_type", flat=True)),
+            {entity_type for entity_type, _ in Thread.ENTITY_TYPES},
+        )
+        self.assertEqual(
+            sum(Thread.objects.values_list("message_count", flat=True)), 200
+        )
+
+        published = []
+
+        class Loop:
+            def call_soon_threadsafe(self, callback, message):
+                published.append(message)
+
+        broadcast = get_broadcast()
+        channels = [
+            thread_channel(pk) for pk in Thread.objects.values_list("pk", flat=True)
+        ]
+        for channel in channels:
+            broadcast.subscribe(channel, None, Loop())
+        self.addCleanup(
+            lambda: [broadcast.unsubscribe(channel, None) for channel in channels]
+        )
+
+        out = StringIO()
+        call_command(
+            "bench_endpoints", "--iterations=2", "--warmup=0", "-o", "-", stdout=out
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["meta"]["dataset"]["messages"], 200)
+        for result in report["results"]:
+            self.assertLess(result["status"], 400, result["name"])
+            self.assertGreater(result["latency_ms"]["p50"], 0)
+            self.assertIn("p50", result["on_commit_ms"])
+        # Every write was rolled back, and none of it was published
+        self.assertEqual(Message.objects.count(), 200)
+        self.assertEqual(published, [])
+
+class InstrumentationTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.client.force_authenticate(user=self.user)
+        Thread.objects.create(entity_type="ORDER", entity_id="1", title="Timed")
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("thread-list"))
+        timing = response["Server-Timing"]
+        self.assertIn('desc="1 queries"', timing)
+        for metric in ("db;dur=", "app;dur=", "render;dur=", "total;dur="):
+            self.assertIn(metric, timing)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("thread-list"))
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn("# TYPE chat_http_request_duration_seconds histogram", body)
+        self.assertIn(
+            'chat_http_request_db_queries_bucket{route="api/chat/threads/",'
+            'method="GET",le="5"}',
+            body,
+        )
+
+        with override_settings(METRICS_TOKEN="secret"):
+            response = self.client.get(reverse("metrics"))
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(
+                reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged_with_sql(self):
+        with self.assertLogs("chat_system.slow_queries", "WARNING") as logs:
+            self.client.get(reverse("thread-list"))
+        self.assertIn("chat_thread", logs.records[-1].sql)
+        self.assertEqual(logs.records[-1].route, "api/chat/threads/")
+
+    def test_pool_metrics(self):
+        # No pool configured in tests, so nothing is exported
+        self.assertEqual(collect_pool_metrics({}), [])
+
+        lines = collect_pool_metrics(
+            {
+                "default": {
+                    "pool_size": 5,
+                    "pool_available": 2,
+                    "requests_waiting": 1,
+                    "requests_num": 40,
+                    "requests_wait_ms": 1500,
+                }
+            }
+        )
+        self.assertIn("# TYPE chat_db_pool_connections gauge", lines)
+        self.assertIn(
+            'chat_db_pool_connections{database="default",state="in_use"} 3', lines
+        )
+        self.assertIn(
+            'chat_db_pool_connections{database="default",state="idle"} 2', lines
+        )
+        self.assertIn('chat_db_pool_requests_waiting{database="default"} 1', lines)
+        self.assertIn('chat_db_pool_requests_total{database="default"} 40', lines)
+        self.assertIn('chat_db_pool_wait_seconds_total{database="default"} 1.5', lines)
+
+class SoftDeleteTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="1", title="Deleted Thread"
+        )
+        Message.objects.create(thread=self.thread, user=self.user, content="Hi")
+        self.thread.is_deleted = True
+        self.thread.save()
+
+    def test_default_manager_hides_deleted_rows(self):
+        self.assertFalse(Thread.objects.filter(pk=self.thread.pk).exists())
+        self.assertTrue(Thread.all_objects.filter(pk=self.thread.pk).exists())
+
+    def test_entity_filter_excludes_deleted_threads(self):
+        response = self.client.get(
+            reverse("thread-list"), {"entity_type": "ORDER", "entity_id": "1"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [])
+
+    def test_sub_resources_of_deleted_thread_are_not_found(self):
+        for name in ("thread-messages", "thread-participants"):
+            url = reverse(name, kwargs={"thread_id": self.thread.id})
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_removed_participant_can_be_added_again(self):
+        thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="2", title="Live Thread"
+        )
+        ThreadParticipant.objects.create(
+            thread=thread, user=self.user, is_deleted=True
+        )
+        # Only a current participant can add them back
+        member = CustomUser.objects.create_user(
+            email="user2@example.com", password="password2", name="User Two"
+        )
+        ThreadParticipant.objects.create(thread=thread, user=member)
+        self.client.force_authenticate(user=member)
+        url = reverse("thread-participants", kwargs={"thread_id": thread.id})
+        response = self.client.post(url, {"user": self.user.id}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(ThreadParticipant.objects.filter(thread=thread).count(), 2)
+
+        response = self.client.post(url, {"user": self.user.id}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ConditionalGetTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.other = CustomUser.objects.create_user(
+            email="user2@example.com", password="password2", name="User Two"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="1", title="Polled Thread"
+        )
+        ThreadParticipant.objects.create(thread=self.thread, user=self.user)
+        Message.objects.create(thread=self.thread, user=self.user, content="Hi")
+
+    def test_unchanged_messages_are_not_modified(self):
+        url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        # A single validator lookup, no message query or serialization
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Message.objects.create(thread=self.thread, user=self.user, content="New")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_etag_varies_with_page(self):
+        url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, {"limit": 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_participant_changes_invalidate_participants(self):
+        url = reverse("thread-participants", kwargs={"thread_id": self.thread.id})
+        etag = self.client.get(url)["ETag"]
+
+        ThreadParticipant.objects.create(thread=self.thread, user=self.other)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+    def test_thread_detail(self):
+        url = reverse("thread-detail", kwargs={"pk": self.thread.id})
+        response = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        etag = self.client.get(url)["ETag"]
+        response = self.client.put(
+            url,
+            {
+                "thread_id": str(self.thread.id),
+                "entity_type": "ORDER",
+                "entity_id": "1",
+                "title": "Renamed",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["title"], "Renamed")
+        self.assertNotEqual(response["ETag"], etag)
+
+    @override_settings(CHAT_THREAD_LIST_VERSION=True)
+    def test_thread_list_version(self):
+        self.addCleanup(cache.clear)
+        url = reverse("thread-list")
+        etag = self.client.get(url, {"entity_type": "ORDER"})["ETag"]
+
+        # A cache read, no thread query
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                url, {"entity_type": "ORDER"}, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Another user's list is another representation
+        self.client.force_authenticate(user=self.other)
+        response = self.client.get(
+            url, {"entity_type": "ORDER"}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [])
+        self.client.force_authenticate(user=self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(thread=self.thread, user=self.user, content="2")
+        response = self.client.get(
+            url, {"entity_type": "ORDER"}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["message_count"], 2)
+
+        etag = response["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.thread.delete()
+        response = self.client.get(
+            url, {"entity_type": "ORDER"}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.data["results"], [])
+
+    def test_thread_list_without_version(self):
+        response = self.client.get(reverse("thread-list"))
+        self.assertFalse(response.has_header("ETag"))
+
+
+class UnreadInboxTestCase(APITestCase):
+
+    def setUp(self):
+        self.user1 = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.user2 = CustomUser.objects.create_user(
+            email="user2@example.com", password="password2", name="User Two"
+        )
+        self.client.force_authenticate(user=self.user1)
+        self.threads = [
+            Thread.objects.create(entity_type="ORDER", entity_id=str(i), title=f"T{i}")
+            for i in range(3)
+        ]
+        for thread in self.threads:
+            ThreadParticipant.objects.create(thread=thread, user=self.user1)
+
+    def post(self, thread, user, count):
+        return [
+            Message.objects.create(thread=thread, user=user, content=f"{i}")
+            for i in range(count)
+        ]
+
+    def test_inbox_counts_unread_messages_in_one_query(self):
+        self.post(self.threads[0], self.user2, 3)
+        self.post(self.threads[1], self.user2, 1)
+        # Own messages never count as unread
+        self.post(self.threads[1], self.user1, 2)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("inbox"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total_unread"], 4)
+        unread = {t["title"]: t["unread_count"] for t in response.data["threads"]}
+        self.assertEqual(unread, {"T0": 3, "T1": 1, "T2": 0})
+
+        response = self.client.get(reverse("inbox"), {"unread_only": "true"})
+        self.assertEqual(len(response.data["threads"]), 2)
+
+    def test_mark_read_advances_cursor(self):
+        messages = self.post(self.threads[0], self.user2, 3)
+        url = reverse("thread-read", kwargs={"thread_id": self.threads[0].id})
+
+        response = self.client.post(url, {"message_id": str(messages[1].id)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        inbox = self.client.get(reverse("inbox")).data
+        self.assertEqual(inbox["total_unread"], 1)
+
+        # Defaults to the latest message, and never moves backwards
+        self.client.post(url)
+        self.client.post(url, {"message_id": str(messages[0].id)})
+        inbox = self.client.get(reverse("inbox")).data
+        self.assertEqual(inbox["total_unread"], 0)
+
+    def test_mark_read_requires_participation(self):
+        self.client.force_authenticate(user=self.user2)
+        url = reverse("thread-read", kwargs={"thread_id": self.threads[0].id})
+        response = self.client.post(url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class MessageSearchTestCase(APITestCase):
+
+    def setUp(self):
+        self.user1 = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.user2 = CustomUser.objects.create_user(
+            email="user2@example.com", password="password2", name="User Two"
+        )
+        self.client.force_authenticate(user=self.user1)
+        self.order = Thread.objects.create(
+            entity_type="ORDER", entity_id="42", title="Order 42"
+        )
+        self.supplier = Thread.objects.create(
+            entity_type="SUPPLIER", entity_id="7", title="Supplier 7"
+        )
+        self.private = Thread.objects.create(
+            entity_type="ORDER", entity_id="43", title="Not mine"
+        )
+        for thread in (self.order, self.supplier):
+            ThreadParticipant.objects.create(thread=thread, user=self.user1)
+        ThreadParticipant.objects.create(thread=self.private, user=self.user2)
+
+        def post(thread, content):
+            return Message.objects.create(
+                thread=thread, user=self.user2, content=content
+            )
+
+        self.shipped = post(self.order, "The invoice was shipped with the pallets")
+        post(self.order, "Invoice invoice invoice, please confirm")
+        post(self.supplier, "New invoice attached")
+        post(self.private, "Secret invoice")
+        post(self.order, "Unrelated chatter")
+
+    def search(self, **params):
+        return self.client.get(reverse("message-search"), params)
+
+    def test_search_is_ranked_and_scoped_to_participation(self):
+        response = self.search(q="invoice")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        contents = [r["content"] for r in response.data["results"]]
+        self.assertEqual(len(contents), 3)
+        self.assertNotIn("Secret invoice", contents)
+        self.assertEqual(contents[0], "Invoice invoice invoice, please confirm")
+        self.assertIn("<mark>", response.data["results"][0]["highlight"])
+
+    def test_search_filters_and_paginates(self):
+        response = self.search(q="invoice", entity_type="SUPPLIER")
+        self.assertEqual(
+            [r["content"] for r in response.data["results"]], ["New invoice attached"]
+        )
+
+        response = self.search(q="invoice", limit=2)
+        self.assertEqual(len(response.data["results"]), 2)
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["next"])
+
+    def test_search_index_follows_writes(self):
+        self.shipped.content = "Rescheduled delivery"
+        self.shipped.save()
+        self.assertEqual(len(self.search(q="shipped").data["results"]), 0)
+        self.assertEqual(len(self.search(q="rescheduled").data["results"]), 1)
+
+        self.shipped.delete()
+        self.assertEqual(len(self.search(q="rescheduled").data["results"]), 0)
+
+    def test_highlight_escapes_content(self):
+        post = Message.objects.create(
+            thread=self.order, user=self.user2, content="<img src=x> refund"
+        )
+        response = self.search(q="refund")
+        self.assertEqual(response.data["results"][0]["content"], post.content)
+        self.assertEqual(
+            response.data["results"][0]["highlight"],
+            "&lt;img src=x&gt; <mark>refund</mark>",
+        )
+
+    def test_search_treats_query_syntax_as_text(self):
+        response = self.search(q='invoice" OR NEAR(')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.search(q=" ")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.search(q="invoice", thread_id="abc")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ThreadMessageConsumerTestCase(APITestCase):
+
+    def setUp(self):
+        self.user1 = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.user2 = CustomUser.objects.create_user(
+            email="user2@example.com", password="password2", name="User Two"
+        )
+        self.thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="1", title="Live Thread"
+        )
+        ThreadParticipant.objects.create(thread=self.thread, user=self.user1)
+
+    def connect(self, user):
+        token = str(AccessToken.for_user(user))
+        return ApplicationCommunicator(
+            application,
+            {
+                "type": "websocket",
+                "path": "/ws/chat/",
+                "query_string": f"token={token}".encode(),
+                "headers": [],
+            },
+        )
+
+    async def send_action(self, communicator, action):
+        payload = {"action": action, "thread_id": str(self.thread.id)}
+        await communicator.send_input(
+            {"type": "websocket.receive", "text": json.dumps(payload)}
+        )
+        return json.loads((await communicator.receive_output())["text"])
+
+    def post_message(self, content):
+        self.client.force_authenticate(user=self.user1)
+        url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {"user": str(self.user1.id), "content": content})
+
+    async def test_subscriber_receives_committed_message(self):
+        communicator = self.connect(self.user1)
+        await communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual(
+            (await communicator.receive_output())["type"], "websocket.accept"
+        )
+
+        reply = await self.send_action(communicator, "subscribe")
+        self.assertEqual(reply["type"], "subscribed")
+
+        await sync_to_async(self.post_message)("Pushed!")
+        event = json.loads((await communicator.receive_output())["text"])
+        self.assertEqual(event["type"], "message")
+        self.assertEqual(event["thread_id"], str(self.thread.id))
+        self.assertEqual(event["message"]["content"], "Pushed!")
+        self.assertEqual(event["message"]["user_name"], "User One")
+
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait()
+
+    async def test_non_participant_cannot_subscribe(self):
+        communicator = self.connect(self.user2)
+        await communicator.send_input({"type": "websocket.connect"})
+        await communicator.receive_output()
+
+        reply = await self.send_action(communicator, "subscribe")
+        self.assertEqual(reply["type"], "error")
+
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait()
+
+    async def test_removed_participant_stops_receiving(self):
+        participant = await ThreadParticipant.objects.acreate(
+            thread=self.thread, user=self.user2
+        )
+        communicator = self.connect(self.user2)
+        await communicator.send_input({"type": "websocket.connect"})
+        await communicator.receive_output()
+        reply = await self.send_action(communicator, "subscribe")
+        self.assertEqual(reply["type"], "subscribed")
+
+        def remove():
+            with self.captureOnCommitCallbacks(execute=True):
+                participant.delete()
+
+        await sync_to_async(remove)()
+        await sync_to_async(self.post_message)("Private")
+        event = json.loads((await communicator.receive_output())["text"])
+        self.assertEqual(
+            event, {"type": "unsubscribed", "thread_id": str(self.thread.id)}
+        )
+        await sync_to_async(self.post_message)("Still private")
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait()
+
+    async def test_rejects_invalid_token(self):
+        communicator = ApplicationCommunicator(
+            application,
+            {"type": "websocket", "path": "/ws/chat/", "query_string": b"token=bad"},
+        )
+        await communicator.send_input({"type": "websocket.connect"})
+        output = await communicator.receive_output()
+
+        self.assertEqual(output, {"type": "websocket.close", "code": 4401})
+
+
+class AsyncViewsTestCase(APITestCase):
+    """
+    The async views answer like the sync ones they replace.
+    """
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user1 = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.user2 = CustomUser.objects.create_user(
+            email="user2@example.com", password="password2", name="User Two"
+        )
+        self.thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="42", title="Async", created_by=self.user1
+        )
+        for i in range(3):
+            Message.objects.create(
+                thread=self.thread, user=self.user1, content=f"Message {i}"
+            )
+        ThreadParticipant.objects.create(thread=self.thread, user=self.user1)
+
+    async def call(self, view_class, method, path, data=None, user=None, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if method == "get":
+            request = self.factory.get(path, data, **headers)
+        else:
+            request = getattr(self.factory, method)(path, data, format="json")
+        force_authenticate(request, user=user or self.user1)
+        return await view_class.as_view()(request, **kwargs)
+
+    async def test_thread_messages_match_sync_view(self):
+        url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+        response = await self.call(
+            async_views.ThreadMessagesAPIView,
+            "get",
+            url,
+            {"limit": 2},
+            thread_id=self.thread.id,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.force_authenticate(user=self.user1)
+        expected = await sync_to_async(self.client.get)(url, {"limit": 2})
+        self.assertEqual(response.data, expected.data)
+        self.assertEqual(
+            [row["content"] for row in response.data["results"]],
+            ["Message 1", "Message 2"],
+        )
+
+    async def test_conditional_get(self):
+        url = reverse("thread-detail", kwargs={"pk": self.thread.id})
+        view_class = async_views.ThreadRetrieveUpdateDestroyAPIView
+        response = await self.call(view_class, "get", url, pk=str(self.thread.id))
+        self.assertEqual(response.data["title"], "Async")
+
+        response = await self.call(
+            view_class,
+            "get",
+            url,
+            headers={"HTTP_IF_NONE_MATCH": response["ETag"]},
+            pk=str(self.thread.id),
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_entity_lookup(self):
+        response = await self.call(
+            async_views.ThreadListCreateAPIView,
+            "get",
+            reverse("thread-list"),
+            {"entity_type": "ORDER", "entity_id": "42", "fields": "thread_id"},
+        )
+        self.assertEqual(
+            response.data["results"], [{"thread_id": str(self.thread.id)}]
+        )
+
+    async def test_post_message(self):
+        response = await self.call(
+            async_views.ThreadMessagesAPIView,
+            "post",
+            reverse("thread-messages", kwargs={"thread_id": self.thread.id}),
+            {"user": str(self.user2.id), "content": "From async"},
+            thread_id=self.thread.id,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["content"], "From async")
+
+        thread = await Thread.objects.aget(id=self.thread.id)
+        self.assertEqual(thread.message_count, 4)
+        self.assertEqual(thread.last_message_preview, "From async")
+
+    async def test_add_participant_and_delete_thread(self):
+        url = reverse("thread-participants", kwargs={"thread_id": self.thread.id})
+        view_class = async_views.ThreadParticipantsAPIView
+        response = await self.call(
+            view_class,
+            "post",
+            url,
+            {"user": str(self.user2.id)},
+            thread_id=self.thread.id,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = await self.call(view_class, "get", url, thread_id=self.thread.id)
+        self.assertEqual(len(response.data), 2)
+
+        response = await self.call(
+            async_views.ThreadRetrieveUpdateDestroyAPIView,
+            "delete",
+            reverse("thread-detail", kwargs={"pk": self.thread.id}),
+            pk=str(self.thread.id),
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = await self.call(view_class, "get", url, thread_id=self.thread.id)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_requires_authentication(self):
+        url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+        request = self.factory.get(url)
+        response = await async_views.ThreadMessagesAPIView.as_view()(
+            request, thread_id=self.thread.id
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class MessageBatchingTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.thread = Thread.objects.create(entity_type="ORDER", entity_id="7")
+        ThreadParticipant.objects.create(thread=self.thread, user=self.user)
+
+    @override_settings(CHAT_INGEST_BATCHING=True, CHAT_INGEST_WINDOW_MS=0)
+    def test_post_through_batcher(self):
+        url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+        for content in ("First", "Second"):
+            response = self.client.post(
+                url, {"user": str(self.user.id), "content": content}, format="json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.message_count, 2)
+        self.assertEqual(self.thread.last_message_preview, "Second")
+        response = self.client.get(url)
+        self.assertEqual(
+            [row["content"] for row in response.data["results"]], ["First", "Second"]
+        )
+
+    def test_concurrent_posts_share_batches_in_order(self):
+        batches = []
+
+        class RecordingBatcher(MessageBatcher):
+            def write(self, messages):
+                if any(message.content == "bad" for message in messages):
+                    raise IntegrityError("bad message")
+                batches.append([message.content for message in messages])
+
+        batcher = RecordingBatcher(batch_size=8, window=0.2)
+        errors = []
+        start = threading.Barrier(20)
+
+        def post(content):
+            start.wait()
+            try:
+                batcher.submit(Message(thread=self.thread, content=content))
+            except IntegrityError:
+                errors.append(content)
+
+        contents = [f"m{i}" for i in range(19)] + ["bad"]
+        workers = [threading.Thread(target=post, args=(c,)) for c in contents]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # Every post got its answer; only the bad one failed
+        self.assertEqual(errors, ["bad"])
+        written = [content for batch in batches for content in batch]
+        self.assertCountEqual(written, contents[:-1])
+        self.assertLess(len(batches), 19)
+        self.assertTrue(all(len(batch) <= 8 for batch in batches))
+
+
+class TailCacheTestCase(APITestCase):
+
+    def setUp(self):
+        override = override_settings(CHAT_TAIL_CACHE=True, CHAT_TAIL_CACHE_SIZE=3)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="1", title="Busy"
+        )
+        ThreadParticipant.objects.create(thread=self.thread, user=self.user)
+        for index in range(4):
+            Message.objects.create(
+                thread=self.thread, user=self.user, content=f"Message {index}"
+            )
+        self.url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+
+    def contents(self, response):
+        return [m["content"] for m in response.data["results"]]
+
+    def thread_version(self):
+        self.thread.refresh_from_db()
+        return self.thread.version
+
+    def test_opening_page_served_from_tail(self):
+        with override_settings(CHAT_TAIL_CACHE=False):
+            expected = self.client.get(self.url, {"limit": 2}).data
+
+        # Miss: the validators, the thread and the tail
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {"limit": 2})
+        self.assertEqual(response.data, expected)
+        # Hit: the validators only
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"limit": 2})
+        self.assertEqual(response.data, expected)
+        self.assertEqual(get_tail_cache().stats()["hits"], 1)
+        self.assertEqual(get_tail_cache().stats()["misses"], 1)
+
+        # Older pages and pages larger than the tail come from the database
+        response = self.client.get(response.data["previous"])
+        self.assertEqual(self.contents(response), ["Message 0", "Message 1"])
+        response = self.client.get(self.url, {"limit": 4})
+        self.assertEqual(len(response.data["results"]), 4)
+        self.assertEqual(get_tail_cache().stats()["hits"], 1)
+
+    def test_posts_extend_the_tail(self):
+        self.client.get(self.url, {"limit": 3})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.url,
+                {"user": str(self.user.id), "content": "Latest"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"limit": 3})
+        self.assertEqual(
+            self.contents(response), ["Message 2", "Message 3", "Latest"]
+        )
+        self.assertIsNotNone(response.data["previous"])
+
+    def test_changes_elsewhere_invalidate_the_tail(self):
+        self.client.get(self.url, {"limit": 3})
+        # Not published here, as if written by another process
+        Message.objects.create(thread=self.thread, user=self.user, content="Other")
+        response = self.client.get(self.url, {"limit": 3})
+        self.assertEqual(self.contents(response)[-1], "Other")
+
+        # Edits and deletes drop the tail
+        message = Message.objects.get(content="Other")
+        message.content = "Edited"
+        message.save()
+        self.assertEqual(get_tail_cache().stats()["entries"], 0)
+        response = self.client.get(self.url, {"limit": 3})
+        self.assertEqual(self.contents(response)[-1], "Edited")
+        message.delete()
+        self.assertEqual(get_tail_cache().stats()["entries"], 0)
+        response = self.client.get(self.url, {"limit": 3})
+        self.assertEqual(self.contents(response)[-1], "Message 3")
+
+    def test_append_of_known_message_drops_tail(self):
+        self.client.get(self.url, {"limit": 3})
+        tail_cache = get_tail_cache()
+        tail = tail_cache.get(self.thread.id, self.thread_version())
+        # Its version may already count the message
+        tail_cache.append(self.thread.id, tail.messages[-1:])
+        self.assertEqual(tail_cache.stats()["entries"], 0)
+
+    async def test_async_view_uses_tail(self):
+        await sync_to_async(self.client.get)(self.url, {"limit": 3})
+        request = APIRequestFactory().get(self.url, {"limit": 3})
+        force_authenticate(request, user=self.user)
+        response = await async_views.ThreadMessagesAPIView.as_view()(
+            request, thread_id=self.thread.id
+        )
+        self.assertEqual(
+            self.contents(response), ["Message 1", "Message 2", "Message 3"]
+        )
+        self.assertEqual(get_tail_cache().stats()["hits"], 1)
+
+    def test_lru_eviction_within_budget(self):
+        tail = Tail(1, [], complete=True)
+        with override_settings(CHAT_TAIL_CACHE_MAX_BYTES=tail.size_in_bytes() * 2):
+            tail_cache = LocalTailCache()
+        first, second, third = uuid4(), uuid4(), uuid4()
+        tail_cache.set(first, tail)
+        tail_cache.set(second, tail)
+        tail_cache.get(first, 1)
+        tail_cache.set(third, tail)
+
+        self.assertIsNotNone(tail_cache.get(first, 1))
+        self.assertIsNone(tail_cache.get(second, 1))
+        self.assertEqual(tail_cache.stats()["evictions"], 1)
+        self.assertEqual(tail_cache.stats()["entries"], 2)
+
+    def test_concurrent_appends_are_kept(self):
+        with override_settings(CHAT_TAIL_CACHE_SIZE=400):
+            tail_cache = LocalTailCache()
+        thread_id = uuid4()
+        tail_cache.set(thread_id, Tail(0, [], complete=True))
+
+        def append(worker):
+            for index in range(50):
+                message = {
+                    "id": f"{worker}-{index}",
+                    "created_at": index,
+                    "data": {"content": "", "user_name": ""},
+                }
+                tail_cache.append(thread_id, [message])
+
+        workers = [threading.Thread(target=append, args=(n,)) for n in range(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        tail = tail_cache.get(thread_id, 400)
+        self.assertEqual(len(tail.messages), 400)
+
+    @override_settings(CHAT_TAIL_CACHE_BACKEND="chat.tail_cache.SharedTailCache")
+    def test_shared_backend(self):
+        self.addCleanup(cache.clear)
+        self.client.get(self.url, {"limit": 3})
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"limit": 3})
+        self.assertEqual(
+            self.contents(response), ["Message 1", "Message 2", "Message 3"]
+        )
+
+        with override_settings(METRICS_TOKEN="secret"):
+            metrics = self.client.get(
+                reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+            ).content.decode()
+        self.assertIn('chat_tail_cache_requests_total{result="hit"} 1', metrics)
+
+
+class ThreadLookupTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.first = Thread.objects.create(entity_type="ORDER", entity_id="1")
+        self.second = Thread.objects.create(entity_type="ORDER", entity_id="1")
+        self.supplier = Thread.objects.create(entity_type="SUPPLIER", entity_id="1")
+        Thread.objects.create(entity_type="ORDER", entity_id="2", is_deleted=True)
+        # Someone else's
+        Thread.objects.create(entity_type="ORDER", entity_id="1")
+        for thread in (self.first, self.second, self.supplier):
+            ThreadParticipant.objects.create(thread=thread, user=self.user)
+        for thread in (self.first, self.second, self.second):
+            Message.objects.create(thread=thread, user=self.user, content="Hi")
+
+    def test_lookup_in_one_query(self):
+        entities = [
+            {"entity_type": "ORDER", "entity_id": "1"},
+            {"entity_type": "ORDER", "entity_id": "2"},
+            {"entity_type": "SUPPLIER", "entity_id": "1"},
+            {"entity_type": "ORDER", "entity_id": "1"},
+        ]
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                reverse("thread-lookup"),
+                {"entities": entities, "counts": True},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        order, deleted, supplier = response.data["results"]
+        self.assertEqual(
+            [thread["thread_id"] for thread in order["threads"]],
+            [str(self.first.id), str(self.second.id)],
+        )
+        self.assertEqual((order["thread_count"], order["message_count"]), (2, 3))
+        self.assertEqual(deleted["threads"], [])
+        self.assertEqual((deleted["thread_count"], deleted["message_count"]), (0, 0))
+        self.assertEqual(supplier["threads"][0]["thread_id"], str(self.supplier.id))
+
+    def test_counts_are_optional(self):
+        response = self.client.post(
+            reverse("thread-lookup"),
+            {"entities": [{"entity_type": "ORDER", "entity_id": "1"}]},
+            format="json",
+        )
+        self.assertNotIn("message_count", response.data["results"][0])
+
+    @override_settings(CHAT_LOOKUP_MAX_ENTITIES=1)
+    def test_rejects_invalid_requests(self):
+        url = reverse("thread-lookup")
+        response = self.client.post(url, {"entities": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        entities = [
+            {"entity_type": "ORDER", "entity_id": "1"},
+            {"entity_type": "ORDER", "entity_id": "2"},
+        ]
+        response = self.client.post(url, {"entities": entities}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"], READ_YOUR_WRITES_SECONDS=60)
+class ReplicaRouterTestCase(SimpleTestCase):
+    """
+    Routing decisions only; TestCase runs every test in a transaction on the
+    primary, which keeps all reads there.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.user = CustomUser(email="user1@example.com")
+
+    def route(self, method="get", write=False):
+        """
+        Databases chosen for reads during one request, before and (when
+        ``write``) after the request writes.
+        """
+        request = getattr(RequestFactory(), method)("/")
+        request.user = self.user
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(Message))
+            if write:
+                self.assertEqual(self.router.db_for_write(Message), "default")
+                reads.append(self.router.db_for_read(Message))
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(request)
+        return reads
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Message), "default")
+
+    def test_reads_follow_writes(self):
+        self.assertEqual(self.route(), ["replica1"])
+        self.assertEqual(self.route(write=True), ["replica1", "default"])
+        # The user's next requests stay on the primary until the pin expires
+        self.assertEqual(self.route(), ["default"])
+        cache.clear()
+        self.assertEqual(self.route(), ["replica1"])
+
+    def test_pins_are_per_user(self):
+        self.route(write=True)
+        self.user = CustomUser(email="user2@example.com")
+        self.assertEqual(self.route(), ["replica1"])
+
+    def test_unsafe_requests_read_from_primary(self):
+        self.assertEqual(self.route("post"), ["default"])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        self.assertEqual(self.route(), ["default"])
+
+
+class MembershipTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.other = CustomUser.objects.create_user(
+            email="user2@example.com", password="password2", name="User Two"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.thread = Thread.objects.create(
+            entity_type="ORDER", entity_id="1", title="Private"
+        )
+        ThreadParticipant.objects.create(thread=self.thread, user=self.user)
+        self.url = reverse("thread-messages", kwargs={"thread_id": self.thread.id})
+
+    def test_non_participants_get_not_found(self):
+        self.client.force_authenticate(user=self.other)
+        participants = reverse(
+            "thread-participants", kwargs={"thread_id": self.thread.id}
+        )
+        for url in (self.url, participants):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(
+            self.url, {"user": str(self.other.id), "content": "Hi"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Message.objects.exists())
+
+        self.other.is_staff = True
+        self.other.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_thread_detail_is_for_participants(self):
+        self.client.force_authenticate(user=self.other)
+        url = reverse("thread-detail", kwargs={"pk": self.thread.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.put(
+            url,
+            {
+                "thread_id": str(self.thread.id),
+                "entity_type": "ORDER",
+                "entity_id": "1",
+                "title": "Mine",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse("thread-detail", kwargs={"pk": "abc"}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.title, "Private")
+        self.assertFalse(self.thread.is_deleted)
+
+        self.other.is_staff = True
+        self.other.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_thread_lists_hold_the_users_threads(self):
+        self.client.force_authenticate(user=self.other)
+        response = self.client.get(reverse("thread-list"))
+        self.assertEqual(response.data["results"], [])
+        response = self.client.post(
+            reverse("thread-lookup"),
+            {"entities": [{"entity_type": "ORDER", "entity_id": "1"}]},
+            format="json",
+        )
+        self.assertEqual(response.data["results"][0]["threads"], [])
+
+        self.other.is_staff = True
+        self.other.save()
+        response = self.client.get(reverse("thread-list"))
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_threads_in_body_and_query_string_are_checked(self):
+        message = Message.objects.create(
+            thread=self.thread, user=self.user, content="Secret"
+        )
+        self.client.force_authenticate(user=self.other)
+        thread = str(self.thread.id)
+
+        response = self.client.post(
+            reverse("participant-bulk"),
+            {"user": str(self.other.id), "add": [thread]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            reverse("participant-bulk"),
+            {"user": str(self.user.id), "remove": [thread]},
+            format="json",
+        )
+        self.assertEqual(response.data["removed"], 0)
+        response = self.client.post(
+            reverse("participant-list"),
+            {"thread": thread, "user": str(self.other.id)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ThreadParticipant.objects.count(), 1)
+
+        item = {"thread": thread, "user": str(self.other.id), "content": "Hi"}
+        response = self.client.post(
+            reverse("message-bulk-create"), {"messages": [item]}, format="json"
+        )
+        self.assertIn("thread", response.data["results"][0]["errors"])
+        response = self.client.post(reverse("message-list"), item, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Message.objects.count(), 1)
+
+        response = self.client.get(reverse("message-list"), {"thread_id": thread})
+        self.assertEqual(response.data["results"], [])
+        response = self.client.get(reverse("participant-list"))
+        self.assertEqual(response.data["results"], [])
+        response = self.client.get(
+            reverse("message-detail", kwargs={"pk": message.id})
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.other.is_staff = True
+        self.other.save()
+        response = self.client.get(reverse("message-list"), {"thread_id": thread})
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_warm_check_costs_no_query(self):
+        self.client.get(self.url)
+        # Validators, thread and page only
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_changes_update_the_index(self):
+        index = get_membership_index()
+        self.assertFalse(index.is_member(self.other.id, self.thread.id))
+
+        url = reverse("thread-participants-bulk", kwargs={"thread_id": self.thread.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {"add": [str(self.other.id)]}, format="json")
+        with self.assertNumQueries(0):
+            self.assertTrue(index.is_member(self.other.id, self.thread.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {"remove": [str(self.other.id)]}, format="json")
+        with self.assertNumQueries(0):
+            self.assertFalse(index.is_member(self.other.id, self.thread.id))
+
+    def test_creator_becomes_participant(self):
+        self.client.force_authenticate(user=self.other)
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("thread-list"),
+                {
+                    "thread_id": str(uuid7()),
+                    "entity_type": "ORDER",
+                    "entity_id": "2",
+                    "title": "New",
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        thread = Thread.objects.get(entity_id="2")
+        self.assertTrue(
+            ThreadParticipant.objects.filter(thread=thread, user=self.other).exists()
+        )
+        with self.assertNumQueries(0):
+            self.assertTrue(get_membership_index().is_member(self.other.id, thread.id))
+
+    @override_settings(CHAT_MEMBERSHIP_BACKEND="chat.membership.SharedMembershipIndex")
+    def test_shared_backend(self):
+        self.addCleanup(cache.clear)
+        index = get_membership_index()
+        self.assertTrue(index.is_member(self.user.id, self.thread.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(index.is_member(self.user.id, self.thread.id))
+        self.assertFalse(index.is_member(self.other.id, self.thread.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ThreadParticipant.objects.create(thread=self.thread, user=self.other)
+        self.assertTrue(index.is_member(self.other.id, self.thread.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            ThreadParticipant.objects.filter(user=self.user).delete()
+        self.assertFalse(index.is_member(self.user.id, self.thread.id))
@@ -1,25 +1,42 @@
+from django.conf import settings
 from django.urls import path
+
+from . import async_views, views
 from .views import (
-    ThreadListCreateAPIView,
-    ThreadMessagesAPIView,
-    ThreadParticipantsAPIView,
-    ThreadRetrieveUpdateDestroyAPIView,
+    InboxAPIView,
+    MessageBulkCreateAPIView,
+    MessageExportAPIView,
     MessageListCreateAPIView,
+    MessageSearchAPIView,
     MessageRetrieveUpdateDestroyAPIView,
+    ThreadLookupAPIView,
     ThreadParticipantListCreateAPIView,
     ThreadParticipantRetrieveUpdateDestroyAPIView,
+    ThreadParticipantsBulkAPIView,
+    ThreadReadAPIView,
+    UserThreadsBulkAPIView,
 )
 
+# ASGI deployments serve the hot endpoints from async-native views
+hot = async_views if getattr(settings, "CHAT_ASYNC_VIEWS", False) else views
+
 urlpatterns = [
     # Thread endpoints
-    path("threads/", ThreadListCreateAPIView.as_view(), name="thread-list"),
+    path("threads/", hot.ThreadListCreateAPIView.as_view(), name="thread-list"),
+    # Threads of many entities in one request
+    path("threads/lookup/", ThreadLookupAPIView.as_view(), name="thread-lookup"),
     path(
         "threads/<str:pk>/",
-        ThreadRetrieveUpdateDestroyAPIView.as_view(),
+        hot.ThreadRetrieveUpdateDestroyAPIView.as_view(),
         name="thread-detail",
     ),
     # Message endpoints
     path("messages/", MessageListCreateAPIView.as_view(), name="message-list"),
+    path(
+        "messages/bulk/",
+        MessageBulkCreateAPIView.as_view(),
+        name="message-bulk-create",
+    ),
     path(
         "messages/<str:pk>/",
         MessageRetrieveUpdateDestroyAPIView.as_view(),
@@ -27,15 +44,30 @@ urlpatterns = [
     ),
     path(
         "threads/<uuid:thread_id>/messages",
-        ThreadMessagesAPIView.as_view(),
+        hot.ThreadMessagesAPIView.as_view(),
         name="thread-messages",
     ),
+    path(
+        "threads/<uuid:thread_id>/read",
+        ThreadReadAPIView.as_view(),
+        name="thread-read",
+    ),
+    path(
+        "threads/<uuid:thread_id>/messages/bulk",
+        MessageBulkCreateAPIView.as_view(),
+        name="thread-messages-bulk-create",
+    ),
     # ThreadParticipant endpoints
     path(
         "participants/",
         ThreadParticipantListCreateAPIView.as_view(),
         name="participant-list",
     ),
+    path(
+        "participants/bulk/",
+        UserThreadsBulkAPIView.as_view(),
+        name="participant-bulk",
+    ),
     path(
         "participants/<str:pk>/",
         ThreadParticipantRetrieveUpdateDestroyAPIView.as_view(),
@@ -43,7 +75,18 @@ urlpatterns = [
     ),
     path(
         "threads/<uuid:thread_id>/participants",
-        ThreadParticipantsAPIView.as_view(),
+        hot.ThreadParticipantsAPIView.as_view(),
         name="thread-participants",
     ),
+    path(
+        "threads/<uuid:thread_id>/participants/bulk",
+        ThreadParticipantsBulkAPIView.as_view(),
+        name="thread-participants-bulk",
+    ),
+    # Full-text search over the current user's threads
+    path("search/", MessageSearchAPIView.as_view(), name="message-search"),
+    # NDJSON export of thread history
+    path("export/", MessageExportAPIView.as_view(), name="message-export"),
+    # Unread counts across the current user's threads
+    path("inbox/", InboxAPIView.as_view(), name="inbox"),
 ]
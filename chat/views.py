@@ -1,77 +1,317 @@
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.utils.urls import replace_query_param
 
 from users.models import CustomUser
-from .models import Thread, Message, ThreadParticipant
+from .broadcast import publish_messages
+from .conditional import conditional_get
+from .export import accepts_gzip, buffered, export_lines, gzip_stream, parse_bound
+from .ingest import create_message
+from .list_version import thread_list_version
+from .models import ArchivedMessage, Thread, Message, ThreadParticipant
+from .pagination import ListPagination, ThreadMessagePagination
+from .permissions import IsThreadParticipant, limit_thread_choices, participating
+from .search import search_messages
+from .tail_cache import get_tail_cache, load_tail
 from .serializers import (
+    BulkMessageSerializer,
+    BulkParticipantSerializer,
+    BulkThreadMessageSerializer,
+    BulkUserThreadsSerializer,
     CreateMessageSerializer,
     CreateParticipantSerializer,
-    ParticipantSerializer,
-    ThreadMessageSerializer,
+    EntityLookupSerializer,
+    InboxRowSerializer,
+    ParticipantRowSerializer,
+    ReadCursorSerializer,
+    SearchResultRowSerializer,
+    ThreadMessageRowSerializer,
     ThreadSerializer,
     MessageSerializer,
     ThreadParticipantSerializer,
+    format_datetime,
 )
 
 
+def thread_validators(thread_id):
+    """
+    Conditional GET validators of a thread and its sub-resources: one
+    primary key lookup, no result set.
+    """
+    row = (
+        Thread.objects.filter(pk=thread_id)
+        .values_list("version", "modified_at")
+        .first()
+    )
+    if row is None:
+        return None
+    version, modified_at = row
+    return version, modified_at
+
+
+def filter_list(request, queryset, uuid_filters=()):
+    """
+    Filters shared by the global list endpoints: exact matches on the UUID
+    query parameters in ``uuid_filters`` plus ``created_by``, and a
+    ``created_after``/``created_before`` range. Returns ``(queryset, None)``,
+    or ``(None, error response)``.
+    """
+    for name in (*uuid_filters, "created_by"):
+        value = request.query_params.get(name)
+        if value:
+            try:
+                queryset = queryset.filter(**{name: uuid.UUID(value)})
+            except ValueError:
+                return None, Response(
+                    {"error": f"'{name}' must be a UUID."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+    for name, lookup in (
+        ("created_after", "created_at__gte"),
+        ("created_before", "created_at__lt"),
+    ):
+        value = request.query_params.get(name)
+        if value:
+            try:
+                queryset = queryset.filter(**{lookup: parse_bound(value)})
+            except ValueError:
+                return None, Response(
+                    {"error": f"'{name}' must be an ISO 8601 datetime."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+    return queryset, None
+
+
+def sparse_fieldset(request, queryset, serializer_class, paginator):
+    """
+    Restrict ``queryset`` to the sparse fieldset in ``?fields=a,b``. Returns
+    ``(queryset, fields, None)``, or ``(None, None, error response)``;
+    ``fields`` is ``None`` when no fieldset was asked for.
+    """
+    fields = request.query_params.get("fields", "").split(",")
+    fields = [name.strip() for name in fields if name.strip()] or None
+    if fields:
+        unknown = set(fields) - set(serializer_class.field_names())
+        if unknown:
+            return None, None, Response(
+                {"error": f"Unknown fields: {', '.join(sorted(unknown))}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # Only the requested columns, plus the ones the cursor is built from
+        queryset = serializer_class.select(
+            queryset, fields, "id", paginator.position_field
+        )
+    return queryset, fields, None
+
+
+def paginated_list(request, queryset, serializer_class, paginator):
+    """
+    One keyset page of ``queryset``, restricted to the sparse fieldset in
+    ``?fields=a,b`` when given.
+    """
+    queryset, fields, error = sparse_fieldset(
+        request, queryset, serializer_class, paginator
+    )
+    if error:
+        return error
+
+    page = paginator.paginate_queryset(queryset, request)
+    serializer = serializer_class(page, many=True, fields=fields)
+    return paginator.get_paginated_response(serializer.data)
+
+
+def create_thread(serializer, user):
+    """
+    Save a validated new thread with its creator as the first participant,
+    who can then add the others.
+    """
+    with transaction.atomic():
+        thread = serializer.save(created_by=user)
+        ThreadParticipant.objects.bulk_add([(thread.id, user.id)], created_by=user)
+    return thread
+
+
 class ThreadListCreateAPIView(APIView):
     """
-    List all threads or create a new thread.
+    List the user's threads (all of them for staff) or create a new thread.
     """
 
     permission_classes = [IsAuthenticated]
 
+    ordering_fields = {"created_at", "last_activity_at", "message_count"}
+
+    @conditional_get
     def get(self, request):
-        print(f"{request.query_params=}")
-        if request.query_params:
-            entity_id = request.query_params.get("entity_id")
-            entity_type = request.query_params.get("entity_type")
+        threads, error = self.filter_threads(request)
+        if error:
+            return error
+
+        paginator = ListPagination(ordering=request.query_params.get("ordering"))
+        return paginated_list(request, threads, ThreadSerializer, paginator)
+
+    def get_validators(self, request):
+        # One cache read; the ETag also covers the filters in the query string,
+        # and the user, whose threads the list holds
+        version = thread_list_version()
+        if version is None:
+            return None
+        return (version, request.user.pk), None
+
+    def filter_threads(self, request):
+        """
+        Returns ``(threads, None)``, or ``(None, error response)``.
+        """
+        entity_id = request.query_params.get("entity_id")
+        entity_type = request.query_params.get("entity_type")
+
+        if entity_id and not entity_type:
+            return None, Response(
+                {"error": "'entity_id' requires 'entity_type'."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-            if not entity_id or not entity_type:
-                return Response(
-                    {"error": "Both 'entity_id' and 'entity_type' are required."},
+        # The default manager already excludes deleted threads
+        threads, error = filter_list(
+            request, participating(Thread.objects.all(), request.user, "id")
+        )
+        if error:
+            return None, error
+        # Filter threads based on entity_type and entity_id
+        if entity_type:
+            threads = threads.filter(entity_type=entity_type)
+        if entity_id:
+            threads = threads.filter(entity_id=entity_id)
+
+        # Activity filters and ordering read the denormalized summary only
+        active_since = request.query_params.get("active_since")
+        if active_since:
+            try:
+                active_since = parse_datetime(active_since)
+            except ValueError:
+                active_since = None
+            if active_since is None:
+                return None, Response(
+                    {"error": "'active_since' must be an ISO 8601 datetime."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-
-            # Filter threads based on entity_id and entity_type
-            threads = Thread.objects.filter(
-                entity_id=entity_id, entity_type=entity_type
+            threads = threads.filter(last_activity_at__gte=active_since)
+
+        has_messages = request.query_params.get("has_messages")
+        if has_messages == "true":
+            threads = threads.filter(message_count__gt=0)
+        elif has_messages == "false":
+            threads = threads.filter(message_count=0)
+
+        # Applied by the paginator, with the id as tiebreak
+        ordering = request.query_params.get("ordering")
+        if ordering and ordering.lstrip("-") not in self.ordering_fields:
+            return None, Response(
+                {"error": f"Unsupported ordering '{ordering}'."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-            # Serialize the threads
-            serializer = ThreadSerializer(threads, many=True)
-
-            return Response(serializer.data)
-        threads = Thread.objects.filter(is_deleted=False)  # Filter by is_deleted=False
-        serializer = ThreadSerializer(threads, many=True)
-        return Response(serializer.data)
+        return threads, None
 
     def post(self, request):
         serializer = ThreadSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(created_by=request.user)  # Automatically set created_by
+            create_thread(serializer, request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ThreadLookupAPIView(APIView):
+    """
+    Live threads of many entities at once, e.g. a chat badge for every row
+    of an order list, instead of one ``threads/?entity_id=`` call per row.
+    Only threads the user takes part in, as in ``threads/``.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = EntityLookupSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Unique entities, in request order
+        entities = list(
+            dict.fromkeys(
+                (entity["entity_type"], entity["entity_id"])
+                for entity in serializer.validated_data["entities"]
+            )
+        )
+        max_items = getattr(settings, "CHAT_LOOKUP_MAX_ENTITIES", 200)
+        if len(entities) > max_items:
+            return Response(
+                {"error": f"At most {max_items} entities per request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # One query, seeking the live (entity_type, entity_id) index. An OR of
+        # per-type conditions is not index-friendly on every database, so the
+        # cross product of types and ids is read; pages usually span a single
+        # type, and pairs nobody asked for are dropped below.
+        requested = set(entities)
+        threads = participating(Thread.objects.all(), request.user, "id")
+        threads = [
+            thread
+            for thread in threads.filter(
+                entity_type__in={entity_type for entity_type, _ in entities},
+                entity_id__in={entity_id for _, entity_id in entities},
+            ).order_by("created_at", "id")
+            if (thread.entity_type, thread.entity_id) in requested
+        ]
+
+        matches = defaultdict(list)
+        for thread, data in zip(threads, ThreadSerializer(threads, many=True).data):
+            matches[thread.entity_type, thread.entity_id].append((thread, data))
+
+        results = []
+        for entity_type, entity_id in entities:
+            found = matches[entity_type, entity_id]
+            result = {
+                "entity_type": entity_type,
+                "entity_id": entity_id,
+                "threads": [data for _, data in found],
+            }
+            if serializer.validated_data["counts"]:
+                # Message counts are kept on the threads; no counting query
+                result["thread_count"] = len(found)
+                result["message_count"] = sum(
+                    thread.message_count for thread, _ in found
+                )
+            results.append(result)
+        return Response({"results": results})
+
+
 class ThreadRetrieveUpdateDestroyAPIView(APIView):
     """
     Retrieve, update or delete a specific thread.
     """
 
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsThreadParticipant]
+    thread_kwarg = "pk"
 
     def get_object(self, pk):
         try:
-            return Thread.objects.get(
-                pk=pk, is_deleted=False
-            )  # Check if the thread is not deleted
+            return Thread.objects.get(pk=pk)  # Live threads only
         except Thread.DoesNotExist:
             return None
 
+    @conditional_get
     def get(self, request, pk):
         thread = self.get_object(pk)
         if thread is None:
@@ -80,6 +320,9 @@ class ThreadRetrieveUpdateDestroyAPIView(APIView):
         serializer = ThreadSerializer(thread)
         return Response(serializer.data)
 
+    def get_validators(self, request, pk):
+        return thread_validators(pk)
+
     def put(self, request, pk):
         thread = self.get_object(pk)
         if thread is None:
@@ -109,16 +352,24 @@ class MessageListCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        messages = Message.objects.filter(
-            is_deleted=False
-        )  # Filter by is_deleted=False
-        serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        # Messages of the user's threads only
+        messages, error = filter_list(
+            request,
+            participating(Message.objects.all(), request.user),
+            ("thread_id", "user_id"),
+        )
+        if error:
+            return error
+        return paginated_list(request, messages, MessageSerializer, ListPagination())
 
     def post(self, request):
-        serializer = MessageSerializer(data=request.data)
+        serializer = limit_thread_choices(
+            MessageSerializer(data=request.data), request.user
+        )
         if serializer.is_valid():
-            serializer.save(created_by=request.user)  # Automatically set created_by
+            # Automatically set created_by
+            message = serializer.save(created_by=request.user)
+            publish_messages([message])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -131,10 +382,9 @@ class MessageRetrieveUpdateDestroyAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self, pk):
+        messages = participating(Message.objects.all(), self.request.user)
         try:
-            return Message.objects.get(
-                pk=pk, is_deleted=False
-            )  # Check if the message is not deleted
+            return messages.get(pk=pk)  # Live messages only
         except Message.DoesNotExist:
             return None
 
@@ -151,7 +401,9 @@ class MessageRetrieveUpdateDestroyAPIView(APIView):
         if message is None:
             return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = MessageSerializer(message, data=request.data)
+        serializer = limit_thread_choices(
+            MessageSerializer(message, data=request.data), request.user
+        )
         if serializer.is_valid():
             serializer.save(created_by=request.user)  # Automatically set created_by
             return Response(serializer.data)
@@ -174,15 +426,23 @@ class ThreadParticipantListCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-
-        participants = ThreadParticipant.objects.filter(
-            is_deleted=False
-        )  # Filter by is_deleted=False
-        serializer = ThreadParticipantSerializer(participants, many=True)
-        return Response(serializer.data)
+        # Participants of the user's threads only
+        participants, error = filter_list(
+            request,
+            participating(ThreadParticipant.objects.all(), request.user),
+            ("thread_id", "user_id"),
+        )
+        if error:
+            return error
+        return paginated_list(
+            request, participants, ThreadParticipantSerializer, ListPagination()
+        )
 
     def post(self, request):
-        serializer = ThreadParticipantSerializer(data=request.data)
+        # Into the user's own threads only
+        serializer = limit_thread_choices(
+            ThreadParticipantSerializer(data=request.data), request.user
+        )
         if serializer.is_valid():
             serializer.save(created_by=request.user)  # Automatically set created_by
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -197,10 +457,11 @@ class ThreadParticipantRetrieveUpdateDestroyAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self, pk):
+        participants = participating(
+            ThreadParticipant.objects.all(), self.request.user
+        )
         try:
-            return ThreadParticipant.objects.get(
-                pk=pk, is_deleted=False
-            )  # Check if the participant is not deleted
+            return participants.get(pk=pk)  # Live participants only
         except ThreadParticipant.DoesNotExist:
             return None
 
@@ -217,7 +478,10 @@ class ThreadParticipantRetrieveUpdateDestroyAPIView(APIView):
         if participant is None:
             return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = ThreadParticipantSerializer(participant, data=request.data)
+        serializer = limit_thread_choices(
+            ThreadParticipantSerializer(participant, data=request.data),
+            request.user,
+        )
         if serializer.is_valid():
             serializer.save(created_by=request.user)  # Automatically set created_by
             return Response(serializer.data)
@@ -233,17 +497,51 @@ class ThreadParticipantRetrieveUpdateDestroyAPIView(APIView):
 
 
 class ThreadMessagesAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsThreadParticipant]
 
+    @conditional_get
     def get(self, request, thread_id):
+        paginator = ThreadMessagePagination()
+        tail_cache = get_tail_cache()
+        # The opening page of a busy thread comes from its cached tail
+        if (
+            tail_cache is not None
+            and self.validators is not None
+            and paginator.opens_tail(request, tail_cache.size)
+        ):
+            version = self.validators[0]
+            tail = tail_cache.get(thread_id, version)
+            if tail is None:
+                thread = get_object_or_404(Thread, id=thread_id)
+                tail = load_tail(
+                    thread, version, tail_cache.size, paginator.position_field
+                )
+                tail_cache.set(thread_id, tail)
+            page = paginator.paginate_tail(tail, request)
+            if page is not None:
+                return paginator.get_paginated_response(
+                    [message["data"] for message in page]
+                )
+
         thread = get_object_or_404(Thread, id=thread_id)
 
-        messages = Message.objects.filter(thread=thread, is_deleted=False).order_by(
-            "created_at"
+        messages = ThreadMessageRowSerializer.values(
+            Message.objects.filter(thread=thread)
         )
+        # Older history continues in cold storage once the hot rows run out
+        archived = None
+        if thread.archived_until is not None:
+            archived = ThreadMessageRowSerializer.values(
+                ArchivedMessage.objects.filter(thread=thread)
+            )
 
-        serializer = ThreadMessageSerializer(messages, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Keyset pagination on (created_at, id); opens on the latest page
+        page = paginator.paginate_queryset(messages, request, archived=archived)
+        serializer = ThreadMessageRowSerializer(page)
+        return paginator.get_paginated_response(serializer.data)
+
+    def get_validators(self, request, thread_id):
+        return thread_validators(thread_id)
 
     def post(self, request, thread_id):
         thread = get_object_or_404(Thread, id=thread_id)
@@ -253,7 +551,8 @@ class ThreadMessagesAPIView(APIView):
             user = get_object_or_404(
                 CustomUser, id=serializer.validated_data["user"].id
             )
-            message = Message.objects.create(
+            # Inserted on its own or, with CHAT_INGEST_BATCHING, in a batch
+            message = create_message(
                 thread=thread,
                 user=user,
                 content=serializer.validated_data["content"],
@@ -265,20 +564,127 @@ class ThreadMessagesAPIView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class MessageBulkCreateAPIView(APIView):
+    """
+    Create many messages in one request, either for the thread in the URL or
+    for the thread named by each item. Returns a result per item.
+    """
+
+    # Into the thread in the URL, or those named by the items, only for
+    # their participants
+    permission_classes = [IsAuthenticated, IsThreadParticipant]
+
+    def post(self, request, thread_id=None):
+        items = request.data.get("messages") if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"error": "'messages' must be a non-empty list."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        max_items = getattr(settings, "CHAT_BULK_MAX_MESSAGES", 1000)
+        if len(items) > max_items:
+            return Response(
+                {"error": f"At most {max_items} messages per request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if thread_id is not None:
+            thread = get_object_or_404(Thread, id=thread_id)
+            item_serializer_class = BulkMessageSerializer
+        else:
+            item_serializer_class = BulkThreadMessageSerializer
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            serializer = item_serializer_class(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = self.error(index, serializer.errors)
+
+        # Resolve every referenced user and thread with one query each
+        users = CustomUser.objects.in_bulk({data["user"] for _, data in valid})
+        if thread_id is not None:
+            threads = {thread.id: thread}
+        else:
+            # Threads the user is not in are reported as unknown
+            threads = participating(Thread.objects.all(), request.user, "id").in_bulk(
+                {data["thread"] for _, data in valid}
+            )
+
+        messages = []
+        for index, data in valid:
+            thread = threads.get(data.get("thread", thread_id))
+            user = users.get(data["user"])
+            if thread is None:
+                results[index] = self.error(
+                    index, {"thread": [f'Invalid pk "{data["thread"]}".']}
+                )
+            elif user is None:
+                results[index] = self.error(
+                    index, {"user": [f'Invalid pk "{data["user"]}".']}
+                )
+            else:
+                message = Message(
+                    thread=thread,
+                    user=user,
+                    content=data["content"],
+                    created_by=request.user,
+                )
+                messages.append(message)
+                results[index] = {
+                    "index": index,
+                    "status": status.HTTP_201_CREATED,
+                    "message_id": str(message.id),
+                    "thread_id": str(thread.id),
+                }
+
+        if messages:
+            with transaction.atomic():
+                Message.objects.bulk_create(
+                    messages,
+                    batch_size=getattr(settings, "CHAT_BULK_BATCH_SIZE", 500),
+                )
+                Thread.objects.record_messages(messages)
+                publish_messages(messages)
+
+        if not messages:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif len(messages) < len(items):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response(
+            {"created": len(messages), "results": results}, status=response_status
+        )
+
+    def error(self, index, errors):
+        return {"index": index, "status": status.HTTP_400_BAD_REQUEST, "errors": errors}
+
+
 class ThreadParticipantsAPIView(APIView):
+    permission_classes = [IsAuthenticated, IsThreadParticipant]
+
+    @conditional_get
     def get(self, request, thread_id):
         # Fetch the thread
         thread = get_object_or_404(Thread, id=thread_id)
 
         # Get all participants for the thread
-        participants = ThreadParticipant.objects.filter(thread=thread, is_deleted=False)
+        participants = ParticipantRowSerializer.values(
+            ThreadParticipant.objects.filter(thread=thread)
+        )
 
-        # Serialize the participants
-        serializer = ParticipantSerializer(participants, many=True)
+        # Serialize the participants straight from the joined rows
+        serializer = ParticipantRowSerializer(participants)
 
         # Return the serialized data
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def get_validators(self, request, thread_id):
+        return thread_validators(thread_id)
+
     def post(self, request, thread_id):
         # Fetch the thread
         thread = get_object_or_404(Thread, id=thread_id)
@@ -290,9 +696,9 @@ class ThreadParticipantsAPIView(APIView):
                 CustomUser, id=serializer.validated_data["user"].id
             )
 
-            # Check if the participant already exists
-            participant, created = ThreadParticipant.objects.get_or_create(
-                thread=thread, user=user, defaults={"created_by": request.user}
+            # Adds the participant, or revives a removed one, unless present
+            created = ThreadParticipant.objects.bulk_add(
+                [(thread.id, user.id)], created_by=request.user
             )
 
             response_data = {"thread_id": str(thread.id), "user_id": str(user.id)}
@@ -302,3 +708,328 @@ class ThreadParticipantsAPIView(APIView):
             )
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class BulkParticipantAPIView(APIView):
+    """
+    Shared validation for the bulk participant endpoints.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = None
+
+    def get_changes(self, request):
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return None, Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        max_items = getattr(settings, "CHAT_BULK_MAX_PARTICIPANTS", 1000)
+        if len(data["add"]) + len(data["remove"]) > max_items:
+            return None, Response(
+                {"error": f"At most {max_items} changes per request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return data, None
+
+    def unknown(self, queryset, ids):
+        """
+        Ids in ``ids`` with no live row in ``queryset``, checked in one query.
+        """
+        found = set(queryset.filter(id__in=ids).values_list("id", flat=True))
+        return [str(pk) for pk in ids if pk not in found]
+
+
+class ThreadParticipantsBulkAPIView(BulkParticipantAPIView):
+    """
+    Add or remove many participants of one thread in a single request.
+    """
+
+    permission_classes = [IsAuthenticated, IsThreadParticipant]
+    serializer_class = BulkParticipantSerializer
+
+    def post(self, request, thread_id):
+        thread = get_object_or_404(Thread, id=thread_id)
+        data, error = self.get_changes(request)
+        if error:
+            return error
+
+        unknown = self.unknown(CustomUser.objects.all(), data["add"])
+        if unknown:
+            return Response(
+                {"add": [f"Unknown users: {', '.join(unknown)}."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        with transaction.atomic():
+            added = ThreadParticipant.objects.bulk_add(
+                ((thread.id, user_id) for user_id in data["add"]),
+                created_by=request.user,
+            )
+            removed, _ = ThreadParticipant.objects.filter(
+                thread=thread, user_id__in=data["remove"]
+            ).delete()
+            if removed:
+                Thread.objects.filter(pk=thread.pk).touch()
+
+        return Response(
+            {
+                "thread_id": str(thread.id),
+                "added": sorted(str(user_id) for _, user_id in added),
+                "removed": removed,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class UserThreadsBulkAPIView(BulkParticipantAPIView):
+    """
+    Add one user to, or remove them from, many threads in a single request;
+    only threads the current user takes part in.
+    """
+
+    serializer_class = BulkUserThreadsSerializer
+
+    def post(self, request):
+        data, error = self.get_changes(request)
+        if error:
+            return error
+
+        user = get_object_or_404(CustomUser, id=data["user"])
+        # Threads the current user is not in are reported as unknown
+        threads = participating(Thread.objects.all(), request.user, "id")
+        unknown = self.unknown(threads, data["add"])
+        if unknown:
+            return Response(
+                {"add": [f"Unknown threads: {', '.join(unknown)}."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        remove = list(
+            threads.filter(pk__in=data["remove"]).values_list("id", flat=True)
+        )
+
+        with transaction.atomic():
+            added = ThreadParticipant.objects.bulk_add(
+                ((thread_id, user.id) for thread_id in data["add"]),
+                created_by=request.user,
+            )
+            removed, _ = ThreadParticipant.objects.filter(
+                user=user, thread_id__in=remove
+            ).delete()
+            if removed:
+                Thread.objects.filter(pk__in=remove).touch()
+
+        return Response(
+            {
+                "user_id": str(user.id),
+                "added": sorted(str(thread_id) for thread_id, _ in added),
+                "removed": removed,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ThreadReadAPIView(APIView):
+    """
+    Advance the current user's read cursor in a thread.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, thread_id):
+        participant = get_object_or_404(
+            ThreadParticipant.objects.select_related("thread"),
+            thread_id=thread_id,
+            user=request.user,
+            thread__is_deleted=False,
+        )
+
+        serializer = ReadCursorSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        message_id = serializer.validated_data.get("message_id")
+        if message_id is not None:
+            until = get_object_or_404(
+                Message.objects.values_list("created_at", flat=True),
+                id=message_id,
+                thread_id=thread_id,
+            )
+        else:
+            until = participant.thread.last_message_at
+
+        if until is not None:
+            ThreadParticipant.objects.filter(pk=participant.pk).mark_read(until)
+            participant.refresh_from_db(fields=["last_read_at"])
+
+        return Response(
+            {
+                "thread_id": str(thread_id),
+                "last_read_at": format_datetime(participant.last_read_at),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class InboxAPIView(APIView):
+    """
+    Unread counts for every thread the current user participates in,
+    computed in a single query.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        participations = ThreadParticipant.objects.filter(
+            user=request.user, thread__is_deleted=False
+        ).with_unread_counts()
+        if request.query_params.get("unread_only") == "true":
+            participations = participations.filter(unread_count__gt=0)
+        participations = participations.order_by(
+            "-thread__last_activity_at", "thread_id"
+        )
+
+        serializer = InboxRowSerializer(InboxRowSerializer.values(participations))
+        threads = serializer.data
+        return Response(
+            {
+                "total_unread": sum(thread["unread_count"] for thread in threads),
+                "threads": threads,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class MessageSearchAPIView(APIView):
+    """
+    Ranked full-text search over messages of the threads the current user
+    participates in, optionally narrowed to one entity or thread.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response(
+                {"error": "'q' is required."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        threads = Thread.objects.filter(
+            id__in=ThreadParticipant.objects.filter(user=request.user).values(
+                "thread_id"
+            ),
+        )
+        entity_type = request.query_params.get("entity_type")
+        entity_id = request.query_params.get("entity_id")
+        thread_id = request.query_params.get("thread_id")
+        if entity_type:
+            threads = threads.filter(entity_type=entity_type)
+        if entity_id:
+            threads = threads.filter(entity_id=entity_id)
+        if thread_id:
+            try:
+                threads = threads.filter(id=uuid.UUID(thread_id))
+            except ValueError:
+                return Response(
+                    {"error": "'thread_id' must be a UUID."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        try:
+            limit = min(max(int(request.query_params.get("limit", 20)), 1), 100)
+            offset = max(int(request.query_params.get("offset", 0)), 0)
+        except ValueError:
+            return Response(
+                {"error": "'limit' and 'offset' must be integers."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        messages = search_messages(
+            Message.objects.filter(thread__in=threads), query
+        )
+        rows = list(
+            SearchResultRowSerializer.values(messages)[offset : offset + limit + 1]
+        )
+
+        next_link = None
+        if len(rows) > limit:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), "offset", offset + limit
+            )
+        return Response(
+            {
+                "next": next_link,
+                "results": SearchResultRowSerializer(rows[:limit]).data,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class MessageExportAPIView(APIView):
+    """
+    Stream the history of one thread, or of all threads of an entity type
+    (optionally one entity), as NDJSON; only threads the current user takes
+    part in, unless staff. Compressed with gzip on the fly when the client
+    accepts it.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        thread_id = request.query_params.get("thread_id")
+        entity_type = request.query_params.get("entity_type")
+        entity_id = request.query_params.get("entity_id")
+        if not thread_id and not entity_type:
+            return Response(
+                {"error": "Either 'thread_id' or 'entity_type' is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if entity_id and not entity_type:
+            return Response(
+                {"error": "'entity_id' requires 'entity_type'."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        bounds = {}
+        for name in ("since", "until"):
+            value = request.query_params.get(name)
+            if value:
+                try:
+                    bounds[name] = parse_bound(value)
+                except ValueError:
+                    return Response(
+                        {"error": f"'{name}' must be an ISO 8601 datetime."},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+
+        threads = participating(Thread.objects.all(), request.user, "id")
+        if thread_id:
+            try:
+                thread_id = uuid.UUID(thread_id)
+            except ValueError:
+                return Response(
+                    {"error": "'thread_id' must be a UUID."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            threads = threads.filter(id=thread_id)
+            if not threads.exists():
+                return Response(
+                    {"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND
+                )
+        if entity_type:
+            threads = threads.filter(entity_type=entity_type)
+        if entity_id:
+            threads = threads.filter(entity_id=entity_id)
+
+        content = buffered(export_lines(threads, **bounds))
+        compress = accepts_gzip(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if compress:
+            content = gzip_stream(content)
+
+        response = StreamingHttpResponse(content, content_type="application/x-ndjson")
+        response["Content-Disposition"] = 'attachment; filename="messages.ndjson"'
+        if compress:
+            response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
@@ -2,6 +2,8 @@
 ASGI config for chat_system project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP is served by Django; WebSocket connections to ``/ws/chat/`` receive new
+thread messages as they are committed.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -12,5 +14,25 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_system.settings')
+# Lets the settings turn off persistent connections, which ASGI cannot reuse
+os.environ.setdefault("DJANGO_ASGI", "true")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once the app registry is ready
+from chat.consumers import ThreadMessageConsumer  # noqa: E402
+
+websocket_routes = {
+    "/ws/chat/": ThreadMessageConsumer(),
+}
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        consumer = websocket_routes.get(scope["path"])
+        if consumer is None:
+            await receive()
+            await send({"type": "websocket.close"})
+            return
+        return await consumer(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,144 @@
+"""
+Primary/replica routing with read-your-writes stickiness.
+
+``PrimaryReplicaRouter`` sends reads of the ``chat`` and ``users`` apps made
+while serving a request to a random alias in ``DATABASE_REPLICAS`` and all
+writes to ``default``. Reads stay on the primary when:
+
+- the request is not a GET/HEAD/OPTIONS (what it writes is based on what
+  it reads) or has written anything,
+- the request's user wrote in the last ``READ_YOUR_WRITES_SECONDS``
+  (recorded in the cache by ``ReplicaRoutingMiddleware``), or
+- a transaction is open on the primary.
+
+Reads outside a request (management commands, shells) always use the
+primary. Pins are kept in Django's cache, so deployments with several
+processes need a shared cache backend.
+"""
+
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_request_state = ContextVar("replica_routing", default=None)
+
+
+class RoutingState:
+    """
+    Routing state of one request.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.safe = request.method in ("GET", "HEAD", "OPTIONS")
+        self.wrote = False
+        self.pinned = None
+
+    def user_key(self):
+        user = getattr(self.request, "user", None)
+        if user is None or not user.is_authenticated:
+            return None
+        return f"db-pin:{user.pk}"
+
+    def is_pinned(self):
+        if self.wrote or not self.safe:
+            return True
+        if self.pinned is None:
+            # Unknown until authentication has resolved the user
+            key = self.user_key()
+            if key is None:
+                return False
+            self.pinned = cache.get(key) is not None
+        return self.pinned
+
+
+def record_write():
+    """
+    Keep the current request's reads, and its user's for the next
+    ``READ_YOUR_WRITES_SECONDS``, on the primary. The router calls this for
+    every write it routes; code writing on a request's behalf elsewhere
+    (e.g. chat.ingest) calls it too.
+    """
+    state = _request_state.get()
+    if state is not None:
+        state.wrote = True
+
+
+class PrimaryReplicaRouter:
+    route_app_labels = {"chat", "users"}
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels:
+            return None
+        replicas = getattr(settings, "DATABASE_REPLICAS", [])
+        state = _request_state.get()
+        if (
+            not replicas
+            or state is None
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+            or state.is_pinned()
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels:
+            return None
+        record_write()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        databases = {DEFAULT_DB_ALIAS, *getattr(settings, "DATABASE_REPLICAS", [])}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        if db in getattr(settings, "DATABASE_REPLICAS", []):
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Tracks the routing state of each request and, once a request that
+    wrote is done, pins its user's reads to the primary.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _request_state.set(RoutingState(request))
+        try:
+            return self.get_response(request)
+        finally:
+            self.finish(token)
+
+    async def __acall__(self, request):
+        token = _request_state.set(RoutingState(request))
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finish(token)
+
+    def finish(self, token):
+        state = _request_state.get()
+        _request_state.reset(token)
+        # DRF authenticates in the view, so the user is known by now
+        key = state.user_key()
+        if state.wrote and key is not None:
+            cache.set(key, 1, getattr(settings, "READ_YOUR_WRITES_SECONDS", 5))
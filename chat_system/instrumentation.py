@@ -0,0 +1,423 @@
+"""
+Per-request performance instrumentation.
+
+``InstrumentationMiddleware`` times every request and splits it into
+database time (all queries, through ``connection.execute_wrapper``), render
+time (``response.render()``) and the rest of the view ("app": mostly
+serialization). The numbers are sent as a ``Server-Timing`` header, logged
+as one structured record per request, and aggregated into per-route
+histograms served in the Prometheus text format by ``metrics_view``.
+Queries slower than ``SLOW_QUERY_MS`` are logged with their SQL. The state
+of psycopg connection pools (``DATABASE_POOL``) and the counters of the
+thread tail cache (``CHAT_TAIL_CACHE``) are exported with the histograms.
+
+Metrics are kept per process; scrape every worker.
+"""
+
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+request_logger = logging.getLogger("chat_system.requests")
+slow_query_logger = logging.getLogger("chat_system.slow_queries")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """
+    Cumulative Prometheus histogram, one series per label set.
+    """
+
+    def __init__(self, name, documentation, labels, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            counts = self.series.get(label_values)
+            if counts is None:
+                # Per bucket counts (+Inf last), then count and sum
+                counts = [0] * (len(self.buckets) + 2) + [0.0]
+                self.series[label_values] = counts
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+    def collect(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            series = [(labels, list(counts)) for labels, counts in self.series.items()]
+        for label_values, counts in sorted(series):
+            labels = ",".join(
+                f'{name}="{escape_label(value)}"'
+                for name, value in zip(self.labels, label_values)
+            )
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"{self.name}_count{{{labels}}} {counts[-2]}")
+            lines.append(f"{self.name}_sum{{{labels}}} {counts[-1]}")
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "chat_http_request_duration_seconds",
+    "Total time spent handling the request.",
+    ("route", "method", "status"),
+)
+DB_SECONDS = Histogram(
+    "chat_http_request_db_seconds",
+    "Time spent in database queries per request.",
+    ("route", "method"),
+)
+DB_QUERIES = Histogram(
+    "chat_http_request_db_queries",
+    "Database queries per request.",
+    ("route", "method"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+APP_SECONDS = Histogram(
+    "chat_http_request_app_seconds",
+    "View time outside the database and renderer, mostly serialization.",
+    ("route", "method"),
+)
+RENDER_SECONDS = Histogram(
+    "chat_http_request_render_seconds",
+    "Time spent rendering the response body.",
+    ("route", "method"),
+)
+SLOW_QUERIES = Histogram(
+    "chat_slow_query_duration_seconds",
+    "Queries slower than SLOW_QUERY_MS.",
+    ("route",),
+)
+HISTOGRAMS = (
+    REQUEST_SECONDS,
+    DB_SECONDS,
+    DB_QUERIES,
+    APP_SECONDS,
+    RENDER_SECONDS,
+    SLOW_QUERIES,
+)
+
+
+class RequestTimings:
+    """
+    Timings of one request; also the ``execute_wrapper`` timing its queries.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+        self.render_started = None
+        self.slow_query_ms = getattr(settings, "SLOW_QUERY_MS", 200)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db += elapsed
+            if self.slow_query_ms is not None and elapsed * 1e3 >= self.slow_query_ms:
+                self.log_slow_query(sql, elapsed, context)
+
+    def log_slow_query(self, sql, elapsed, context):
+        route = get_route(self.request)
+        SLOW_QUERIES.observe(elapsed, route)
+        # Parameters may hold message content; only the SQL is logged
+        slow_query_logger.warning(
+            "Slow query (%.1f ms) on %s: %s",
+            elapsed * 1e3,
+            route,
+            sql,
+            extra={
+                "route": route,
+                "duration_ms": round(elapsed * 1e3, 3),
+                "database": context["connection"].alias,
+                "sql": sql,
+            },
+        )
+
+    def start_render(self, response):
+        self.render_started = time.perf_counter()
+        response.add_post_render_callback(self.end_render)
+
+    def end_render(self, response):
+        self.render = time.perf_counter() - self.render_started
+
+
+def get_route(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.route or match.view_name
+
+
+class InstrumentationMiddleware:
+    """
+    Times each request; see the module docstring. Place it first in
+    ``MIDDLEWARE`` so the total covers the other middleware too.
+
+    Queries run while a streaming response is consumed are not counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # A sync hook would cost the async handler a thread hop
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings(request)
+        request._timings = timings
+        start = time.perf_counter()
+        with self.wrap_queries(timings):
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        self.record(request, response, timings, total)
+        return response
+
+    async def __acall__(self, request):
+        timings = RequestTimings(request)
+        request._timings = timings
+        start = time.perf_counter()
+        # Queries run in sync_to_async threads on this context's connections
+        with self.wrap_queries(timings):
+            response = await self.get_response(request)
+        total = time.perf_counter() - start
+        self.record(request, response, timings, total)
+        return response
+
+    def wrap_queries(self, timings):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(timings))
+        return stack
+
+    def process_template_response(self, request, response):
+        # Called last for the outermost middleware, right before render()
+        request._timings.start_render(response)
+        return response
+
+    async def aprocess_template_response(self, request, response):
+        request._timings.start_render(response)
+        return response
+
+    def record(self, request, response, timings, total):
+        route = get_route(request)
+        method = request.method
+        app = max(total - timings.db - timings.render, 0.0)
+
+        REQUEST_SECONDS.observe(total, route, method, str(response.status_code))
+        DB_SECONDS.observe(timings.db, route, method)
+        DB_QUERIES.observe(timings.queries, route, method)
+        APP_SECONDS.observe(app, route, method)
+        RENDER_SECONDS.observe(timings.render, route, method)
+
+        if getattr(settings, "SERVER_TIMING", True):
+            response["Server-Timing"] = ", ".join(
+                [
+                    f'db;dur={timings.db * 1e3:.2f};desc="{timings.queries} queries"',
+                    f"app;dur={app * 1e3:.2f}",
+                    f"render;dur={timings.render * 1e3:.2f}",
+                    f"total;dur={total * 1e3:.2f}",
+                ]
+            )
+
+        request_logger.info(
+            "%s %s %s %.1f ms",
+            method,
+            request.path,
+            response.status_code,
+            total * 1e3,
+            extra={
+                "route": route,
+                "method": method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(total * 1e3, 3),
+                "db_ms": round(timings.db * 1e3, 3),
+                "db_queries": timings.queries,
+                "app_ms": round(app * 1e3, 3),
+                "render_ms": round(timings.render * 1e3, 3),
+            },
+        )
+
+
+def metrics_view(request):
+    """
+    All histograms in the Prometheus text exposition format. Requires
+    ``Authorization: Bearer <METRICS_TOKEN>`` when that setting is set, and
+    a staff session otherwise.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token:
+        if not constant_time_compare(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        ):
+            return HttpResponseForbidden()
+    elif not getattr(request.user, "is_staff", False):
+        return HttpResponseForbidden()
+
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.collect()
+    lines += collect_pool_metrics(pool_stats())
+    # Imported here: this module is loaded with the settings, before the apps
+    from chat.tail_cache import get_tail_cache
+
+    tail_cache = get_tail_cache()
+    if tail_cache is not None:
+        lines += collect_tail_cache_metrics(tail_cache.stats())
+    return HttpResponse(
+        "\n".join(lines) + "\n", content_type="text/plain; version=0.0.4"
+    )
+
+
+def pool_stats():
+    """
+    ``{alias: stats}`` of the databases using a psycopg connection pool
+    (``DATABASE_POOL``), from ``ConnectionPool.get_stats()``.
+    """
+    stats = {}
+    for alias in connections:
+        if "pool" in connections.settings[alias].get("OPTIONS", {}):
+            pool = connections[alias].pool
+            if pool is not None:
+                stats[alias] = pool.get_stats()
+    return stats
+
+
+def collect_pool_metrics(stats):
+    """
+    Prometheus lines for ``pool_stats()``.
+    """
+    metrics = [
+        ("chat_db_pool_connections", "Pooled connections by state.", "gauge"),
+        (
+            "chat_db_pool_requests_waiting",
+            "Requests waiting for a connection.",
+            "gauge",
+        ),
+        ("chat_db_pool_requests_total", "Connections handed out.", "counter"),
+        (
+            "chat_db_pool_wait_seconds_total",
+            "Time requests spent waiting for a connection.",
+            "counter",
+        ),
+    ]
+    samples = {name: [] for name, _, _ in metrics}
+    for alias, pool in sorted(stats.items()):
+        label = f'database="{escape_label(alias)}"'
+        size, idle = pool.get("pool_size", 0), pool.get("pool_available", 0)
+        samples["chat_db_pool_connections"] += [
+            f'chat_db_pool_connections{{{label},state="in_use"}} {size - idle}',
+            f'chat_db_pool_connections{{{label},state="idle"}} {idle}',
+        ]
+        samples["chat_db_pool_requests_waiting"].append(
+            f"chat_db_pool_requests_waiting{{{label}}} "
+            f"{pool.get('requests_waiting', 0)}"
+        )
+        samples["chat_db_pool_requests_total"].append(
+            f"chat_db_pool_requests_total{{{label}}} {pool.get('requests_num', 0)}"
+        )
+        samples["chat_db_pool_wait_seconds_total"].append(
+            f"chat_db_pool_wait_seconds_total{{{label}}} "
+            f"{pool.get('requests_wait_ms', 0) / 1e3}"
+        )
+
+    lines = []
+    if stats:
+        for name, documentation, kind in metrics:
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+            lines += samples[name]
+    return lines
+
+
+def collect_tail_cache_metrics(stats):
+    """
+    Prometheus lines for ``chat.tail_cache`` counters (``stats()``).
+    """
+    lines = [
+        "# HELP chat_tail_cache_requests_total Thread tail cache lookups.",
+        "# TYPE chat_tail_cache_requests_total counter",
+        f'chat_tail_cache_requests_total{{result="hit"}} {stats["hits"]}',
+        f'chat_tail_cache_requests_total{{result="miss"}} {stats["misses"]}',
+        "# HELP chat_tail_cache_evictions_total Tails evicted to stay in budget.",
+        "# TYPE chat_tail_cache_evictions_total counter",
+        f"chat_tail_cache_evictions_total {stats['evictions']}",
+    ]
+    # Only known for the local backend
+    for key, documentation in (
+        ("entries", "Cached thread tails."),
+        ("bytes", "Approximate memory held by cached tails."),
+    ):
+        if key in stats:
+            name = f"chat_tail_cache_{key}"
+            lines += [
+                f"# HELP {name} {documentation}",
+                f"# TYPE {name} gauge",
+                f"{name} {stats[key]}",
+            ]
+    return lines
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per record: the message plus any ``extra`` fields.
+    """
+
+    reserved = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.reserved and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
@@ -0,0 +1,106 @@
+"""
+Fast renderers and parsers for the API.
+
+``ORJSONRenderer``/``ORJSONParser`` replace DRF's ``json``-based classes;
+orjson encodes UUIDs and datetimes natively, which is most of what our
+payloads contain. ``MessagePackRenderer`` answers ``Accept:
+application/msgpack`` when the optional ``msgpack`` package is installed.
+"""
+
+import datetime
+import uuid
+
+import orjson
+from django.utils.http import parse_header_parameters
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Anything orjson cannot encode itself (Decimal, lazy translations, ...) is
+# handed to DRF's encoder, so output matches JSONRenderer.
+fallback_encoder = JSONEncoder()
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Drop-in replacement for DRF's ``JSONRenderer``.
+    """
+
+    media_type = "application/json"
+    format = "json"
+    charset = None
+    # Datetimes end in "Z" like DRF's DateTimeField output
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        options = self.options
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=fallback_encoder.default, option=options)
+        # Like JSONRenderer, keep the output safe to embed in JavaScript
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028")
+            ret = ret.replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+    def get_indent(self, accepted_media_type, renderer_context):
+        # orjson only has a two space indent; any requested indent gets it
+        if accepted_media_type:
+            _, params = parse_header_parameters(accepted_media_type)
+            if params.get("indent", "0") not in ("", "0"):
+                return True
+        return bool(renderer_context.get("indent"))
+
+
+class ORJSONParser(BaseParser):
+    """
+    Drop-in replacement for DRF's ``JSONParser``.
+    """
+
+    media_type = "application/json"
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+
+
+def msgpack_default(obj):
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, datetime.datetime):
+        value = obj.isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+    return fallback_encoder.default(obj)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack bodies for clients sending ``Accept: application/msgpack``.
+    Values are the same as in the JSON representation.
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if msgpack is None:
+            raise RuntimeError("MessagePackRenderer requires the msgpack package.")
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=msgpack_default, use_bin_type=True)
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from .authentication import evict_cached_user
+        from .models import CustomUser
+
+        post_save.connect(evict_cached_user, sender=CustomUser)
+        post_delete.connect(evict_cached_user, sender=CustomUser)
@@ -0,0 +1,60 @@
+import copy
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import TTLCache
+
+user_cache = TTLCache(
+    max_size=getattr(settings, "USER_CACHE_MAX_SIZE", 10000),
+    ttl=getattr(settings, "USER_CACHE_TTL", 300),
+)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user through ``user_cache``
+    instead of querying ``CustomUser`` on every request.
+
+    Saving or deleting a user evicts it from this process's cache; writes
+    that bypass model signals (``QuerySet.update``) and other processes are
+    bounded by ``USER_CACHE_TTL``.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            try:
+                user = self.user_model.objects.get(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.set(user_id, user)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        # Requests get their own copy so they never share mutable state
+        return copy.copy(user)
+
+
+def evict_cached_user(sender, instance, **kwargs):
+    user_cache.delete(str(instance.pk))
@@ -1,3 +1,67 @@
+from unittest import mock
+
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import user_cache
+from .cache import TTLCache
+from .models import CustomUser
+
+
+class CachedJWTAuthenticationTestCase(TestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email="user1@example.com", password="password1", name="User One"
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.url = reverse("user_profile")
+
+    def test_user_is_resolved_from_cache_after_first_request(self):
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["email"], "user1@example.com")
+
+    def test_saving_user_evicts_cached_entry(self):
+        self.client.get(self.url)
+
+        self.user.name = "Renamed"
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).data["name"], "Renamed")
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TTLCacheTestCase(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
 
-# Create your tests here.
+    def test_entries_expire(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        with mock.patch("users.cache.time.monotonic", return_value=1000):
+            cache.set("a", 1)
+        with mock.patch("users.cache.time.monotonic", return_value=1061):
+            self.assertIsNone(cache.get("a"))